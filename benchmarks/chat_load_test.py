@@ -0,0 +1,124 @@
+"""
+Test tải cho endpoint /api/chat với LLM giả (không cần mạng, không tốn quota)
+
+Chạy Flask app với FakeProvider trong một thư mục tạm (không đụng tới topics/
+thật), gửi đồng thời nhiều request chat qua test client, đọc hết SSE stream
+rồi in throughput và phân vị độ trễ (TTFB, tổng) cùng histogram từng giai
+đoạn của app (/api/latency_metrics).
+
+Cache ngữ nghĩa và trả lời mẫu bị tắt để mọi request đều đi qua model (đo đúng
+đường gọi LLM); bật lại bằng --with-caches, khi đó request được trả lời không
+qua model được thống kê riêng.
+
+Chạy: python benchmarks/chat_load_test.py --requests 200 --concurrency 16 --ttft 0.3 --error-rate 0.02
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+MESSAGES = [
+    "Hôm nay bác thấy hơi mệt, cháu có lời khuyên gì không?",
+    "Bác nhớ món canh chua ở quê quá.",
+    "Cháu kể bác nghe chuyện gì vui đi.",
+    "Tối qua bác ngủ không ngon lắm.",
+    "Cuối tuần này con cháu có về thăm bác không nhỉ?"
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--topic', default='que_huong')
+    parser.add_argument('--ttft', type=float, default=0.3, help='TTFT trung vị của model giả (giây)')
+    parser.add_argument('--tokens-per-second', type=float, default=80)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--mid-stream-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--with-caches', action='store_true',
+                        help='Giữ cache ngữ nghĩa và trả lời mẫu (mặc định tắt)')
+    args = parser.parse_args()
+
+    # Cấu hình provider qua biến môi trường trước khi import app
+    os.environ['LLM_PROVIDER'] = 'fake'
+    os.environ['FAKE_LLM_TTFT'] = str(args.ttft)
+    os.environ['FAKE_LLM_TOKENS_PER_SECOND'] = str(args.tokens_per_second)
+    os.environ['FAKE_LLM_ERROR_RATE'] = str(args.error_rate)
+    os.environ['FAKE_LLM_MID_STREAM_ERROR_RATE'] = str(args.mid_stream_error_rate)
+    os.environ['FAKE_LLM_SEED'] = str(args.seed)
+
+    work_dir = tempfile.mkdtemp(prefix='chat_load_test_')
+    os.chdir(work_dir)
+    import chatbot
+    chatbot.ensure_topic_folders()
+    if not args.with_caches:
+        chatbot.SEMANTIC_CACHE_CONFIG['enabled'] = False
+        chatbot.SPECULATIVE_ENABLED = False
+
+    def send(index):
+        client = chatbot.app.test_client()
+        message = f"{MESSAGES[index % len(MESSAGES)]} ({index})"
+        start = time.time()
+        response = client.post('/api/chat', json={'message': message, 'topic_key': args.topic}, buffered=False)
+        first_byte = None
+        failed = response.status_code != 200
+        without_model = False
+        for data in response.response:
+            if first_byte is None:
+                first_byte = time.time() - start
+            if b'"error"' in data:
+                failed = True
+            if b'"cached": true' in data or b'"quick_reply": true' in data:
+                without_model = True
+        response.close()
+        return first_byte or 0.0, time.time() - start, failed, without_model
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(send, range(args.requests)))
+    elapsed = time.time() - start
+
+    model_results = [result for result in results if not result[3]]
+    errors = sum(1 for _, _, failed, _ in results if failed)
+    served_without_model = len(results) - len(model_results)
+
+    print(f"Requests: {args.requests}  Concurrency: {args.concurrency}  Thời gian: {elapsed:.2f}s")
+    print(f"Throughput: {args.requests / elapsed:.1f} req/s  Lỗi: {errors} ({errors / args.requests:.1%})")
+    print(f"Qua model: {len(model_results)}  Cache/trả lời mẫu: {served_without_model}"
+          f"{'' if args.with_caches else ' (cache tắt)'}")
+    print(f"{'':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    groups = [('qua model', model_results)]
+    if served_without_model:
+        groups.append(('không model', [result for result in results if result[3]]))
+    for group_name, group in groups:
+        if not group:
+            continue
+        for name, values in (('TTFB', [ttfb for ttfb, _, _, _ in group]), ('Tổng', [total for _, total, _, _ in group])):
+            label = f"{name} {group_name}" if len(groups) > 1 else f"{name} (ms)"
+            print(f"{label:<16}" + ''.join(f"{percentile(values, p) * 1000:>9.0f}" for p in (0.5, 0.95, 0.99))
+                  + f"{max(values) * 1000:>9.0f}")
+
+    print("-" * 52)
+    histograms = chatbot.metrics_collector.get_latency_histograms()
+    for trace_name, spans in histograms.items():
+        print(trace_name)
+        for span, stats in spans.items():
+            print(f"  {span:<22}{stats['p50_ms']:>9.0f}{stats['p95_ms']:>9.0f}{stats['p99_ms']:>9.0f}{stats['max_ms']:>9.0f}")
+    print(f"Provider: {chatbot.llm_provider.get_stats()}")
+
+
+if __name__ == '__main__':
+    main()
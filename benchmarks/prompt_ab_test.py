@@ -0,0 +1,127 @@
+"""
+So sánh A/B các biến thể system prompt (prompt_registry trong chatbot.py)
+
+Với mỗi biến thể, dựng system prompt cho mọi chủ đề x hồ sơ người dùng mẫu,
+gửi các tin nhắn mẫu qua route chat (stream) rồi in số token của prompt,
+TTFT, tổng thời gian, số từ và số câu của câu trả lời.
+
+Mặc định dùng LLM giả (FakeProvider) với thời gian đọc prompt tỉ lệ theo độ
+dài prompt, nên chạy offline được; --provider gemini gọi model thật (cần
+GOOGLE_API_KEY) để so sánh độ trễ và chất lượng câu trả lời thật.
+
+Chạy: python benchmarks/prompt_ab_test.py --prompt-tokens-per-second 4000
+      python benchmarks/prompt_ab_test.py --provider gemini --topics que_huong suc_khoe
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+PROFILES = [
+    {'name': 'Lan', 'call_style': 'bà', 'hometown': 'Huế', 'location': 'Paris'},
+    {'name': 'Tư', 'call_style': 'ông', 'hometown': 'Cần Thơ', 'location': 'Paris'},
+    {'name': 'Hùng', 'call_style': 'bác', 'hometown': 'Hải Phòng', 'location': 'Paris'},
+]
+
+MESSAGES = [
+    "Dạo này bác nhớ quê quá, không biết làm sao cho đỡ buồn.",
+    "Hôm nay bác thấy hơi mệt, cháu có lời khuyên gì không?",
+    "Cháu kể bác nghe chuyện gì vui đi.",
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--provider', choices=('fake', 'gemini'), default='fake')
+    parser.add_argument('--variants', nargs='*', help='Mặc định: mọi biến thể đã đăng ký')
+    parser.add_argument('--topics', nargs='*', help='Mặc định: mọi chủ đề')
+    parser.add_argument('--ttft', type=float, default=0.2, help='TTFT trung vị của model giả (giây)')
+    parser.add_argument('--prompt-tokens-per-second', type=float, default=4000,
+                        help='Tốc độ đọc prompt của model giả (0 = TTFT không phụ thuộc prompt)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--show-prompt', action='store_true', help='In prompt mẫu (chủ đề đầu, hồ sơ đầu) của mỗi biến thể')
+    args = parser.parse_args()
+
+    # Cấu hình provider qua biến môi trường trước khi import app
+    os.environ['LLM_PROVIDER'] = args.provider
+    os.environ['FAKE_LLM_TTFT'] = str(args.ttft)
+    os.environ['FAKE_LLM_PROMPT_TOKENS_PER_SECOND'] = str(args.prompt_tokens_per_second)
+    os.environ['FAKE_LLM_SEED'] = str(args.seed)
+
+    work_dir = tempfile.mkdtemp(prefix='prompt_ab_test_')
+    os.chdir(work_dir)
+    import chatbot
+    from utils.model_router import TASK_CHAT
+    from utils.sentence_budget import SentenceBudget
+    chatbot.ensure_topic_folders()
+
+    variants = args.variants or chatbot.prompt_registry.names()
+    topics = args.topics or list(chatbot.TOPICS)
+    contexts = [(topic_key, profile) for topic_key in topics for profile in PROFILES]
+    token_report = chatbot.prompt_registry.measure(contexts, variants)
+
+    results = {}
+    for variant in variants:
+        ttfts, totals, words, sentences = [], [], [], []
+        errors = 0
+        for topic_key, profile in contexts:
+            prompt = chatbot.get_system_prompt(topic_key, user_info=profile, variant=variant)
+            if args.show_prompt and topic_key == topics[0] and profile is PROFILES[0]:
+                print(f"===== {variant} =====\n{prompt}\n")
+            turn_model = chatbot.model_router.get_model(TASK_CHAT, system_instruction=prompt)
+            generation_config = chatbot.get_chat_generation_config(chatbot.get_response_shape(topic_key))
+            for message in MESSAGES:
+                start = time.time()
+                first_token = None
+                reply = ''
+                try:
+                    for chunk in turn_model.generate_content(message, generation_config=generation_config,
+                                                             stream=True):
+                        if first_token is None:
+                            first_token = time.time() - start
+                        reply += chunk.text or ''
+                except Exception as e:
+                    errors += 1
+                    print(f"[{variant}] {topic_key}: {e}")
+                    continue
+                totals.append(time.time() - start)
+                ttfts.append(first_token or 0.0)
+                words.append(len(reply.split()))
+                # Đếm câu như ở app (không giới hạn)
+                budget = SentenceBudget(max_sentences=10 ** 6)
+                budget.feed(reply + '\n')
+                sentences.append(budget.sentences)
+        results[variant] = (ttfts, totals, words, sentences, errors)
+
+    print(f"Provider: {args.provider}  Chủ đề: {len(topics)}  Hồ sơ: {len(PROFILES)}  Tin nhắn: {len(MESSAGES)}")
+    print(f"{'Biến thể':<12}{'Token':>8}{'Ký tự':>8}{'TTFT p50':>10}{'TTFT p95':>10}"
+          f"{'Tổng p50':>10}{'Từ':>7}{'Câu':>6}{'Lỗi':>6}")
+    for variant in variants:
+        ttfts, totals, words, sentences, errors = results[variant]
+        tokens = token_report[variant]
+        print(f"{variant:<12}{tokens['avg_tokens']:>8.0f}{tokens['avg_chars']:>8.0f}"
+              f"{percentile(ttfts, 0.5) * 1000:>10.0f}{percentile(ttfts, 0.95) * 1000:>10.0f}"
+              f"{percentile(totals, 0.5) * 1000:>10.0f}"
+              f"{sum(words) / max(1, len(words)):>7.1f}{sum(sentences) / max(1, len(sentences)):>6.1f}{errors:>6}")
+
+    if len(variants) > 1:
+        base = token_report[variants[0]]['avg_tokens']
+        for variant in variants[1:]:
+            saved = 1 - token_report[variant]['avg_tokens'] / base if base else 0.0
+            print(f"{variant} so với {variants[0]}: {saved:.1%} token system prompt ít hơn")
+    print(f"Provider: {chatbot.llm_provider.get_stats()}")
+
+
+if __name__ == '__main__':
+    main()
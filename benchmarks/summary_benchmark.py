@@ -0,0 +1,39 @@
+"""
+Benchmark cho bước tóm tắt trích xuất cục bộ (extractive pre-summarizer)
+
+Đo mức giảm token đầu vào của prompt tóm tắt và tỉ lệ giữ lại thông tin
+quan trọng (fact recall) trên bộ hội thoại mẫu trong summary_fixtures.json.
+
+Chạy: python benchmarks/summary_benchmark.py
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.extractive_summarizer import ExtractiveSummarizer, benchmark_fact_recall
+
+FIXTURES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'summary_fixtures.json')
+
+
+def main():
+    with open(FIXTURES_FILE, 'r', encoding='utf-8') as f:
+        fixtures = json.load(f)
+
+    results = benchmark_fact_recall(ExtractiveSummarizer(), fixtures)
+
+    print(f"{'Fixture':<22}{'Trước':>8}{'Sau':>8}{'Giảm':>8}{'Recall':>9}")
+    for item in results['fixtures']:
+        print(f"{item['name']:<22}{item['tokens_before']:>8}{item['tokens_after']:>8}"
+              f"{item['reduction']:>8.0%}{item['fact_recall']:>9.0%}")
+        if item['missing_facts']:
+            print(f"  Thiếu: {', '.join(item['missing_facts'])}")
+
+    print("-" * 55)
+    print(f"{'Tổng':<22}{results['tokens_before']:>8}{results['tokens_after']:>8}"
+          f"{results['reduction']:>8.0%}{results['fact_recall']:>9.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,19 +2,79 @@ from flask import Flask, render_template, request, Response, jsonify, session
 import google.generativeai as genai
 import json
 import os
+import re
+import time
 from datetime import datetime
 import threading
 import atexit
 
+from utils.extractive_summarizer import ExtractiveSummarizer, EMOTION_KEYWORDS
+from utils.token_counter import estimate_tokens, estimate_tokens_many, default_estimator
+from utils.text_cleaner import StreamingTextCleaner, StreamingPatternRemover
+from utils.stream_coalescer import StreamCoalescer
+from utils.stream_buffer import StreamRegistry
+from utils.speculative_engine import SpeculativeEngine
+from utils.hedged_stream import HedgedStreamer
+from utils.azure_tts_service import AzureTTSService
+from utils.compression import negotiate_encoding, compress_body, compress_stream
+from utils.semantic_cache import SemanticCache
+
+try:
+    from flask_sock import Sock  # WebSocket (tùy chọn): pip install flask-sock
+except ImportError:
+    Sock = None
+from utils.metrics import MetricsCollector, RequestTrace
+from utils.model_router import ModelRouter, TASK_CHAT, TASK_SUMMARY
+from utils.llm_provider import GeminiProvider, FakeProvider, FakeLLMConfig
+from utils.circuit_breaker import CircuitOpenError
+from utils.sentence_budget import SentenceBudget
+from utils.prompt_registry import PromptRegistry, compress_prompt
+from utils.summary_scheduler import IdleSummaryScheduler
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here-change-this'  # Thay đổi key này
+sock = Sock(app) if Sock is not None else None
 
 # Cấu hình Gemini API
 API_KEY = ""
-genai.configure(api_key=API_KEY)
 
-# Khởi tạo model
-model = genai.GenerativeModel("gemini-2.5-flash")
+# Backend LLM: 'gemini' (mặc định) hoặc 'fake' - model giả chạy offline để test tải, không tốn quota
+# Ví dụ: LLM_PROVIDER=fake FAKE_LLM_TTFT=0.3 FAKE_LLM_ERROR_RATE=0.02 python chatbot.py
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini')
+if LLM_PROVIDER == 'fake':
+    llm_provider = FakeProvider(FakeLLMConfig(
+        ttft_median=float(os.getenv('FAKE_LLM_TTFT', 0.4)),
+        tokens_per_second=float(os.getenv('FAKE_LLM_TOKENS_PER_SECOND', 80)),
+        prompt_tokens_per_second=float(os.getenv('FAKE_LLM_PROMPT_TOKENS_PER_SECOND', 0)),
+        error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', 0)),
+        mid_stream_error_rate=float(os.getenv('FAKE_LLM_MID_STREAM_ERROR_RATE', 0)),
+        seed=int(os.getenv('FAKE_LLM_SEED', 0))
+    ))
+    print("⚠️ Đang dùng LLM giả (LLM_PROVIDER=fake) - câu trả lời không phải của Gemini")
+else:
+    llm_provider = GeminiProvider(API_KEY)
+
+# Circuit breaker cho từng route model: khi Gemini lỗi liên tục thì trả lời ngay bằng câu mẫu thay vì chờ timeout
+CIRCUIT_BREAKER_CONFIG = {
+    'failure_rate_threshold': 0.5,  # Tỉ lệ lỗi trong cửa sổ để ngắt mạch
+    'window_seconds': 60,           # Cửa sổ tính tỉ lệ lỗi (giây)
+    'min_calls': 5,                 # Số lời gọi tối thiểu trong cửa sổ trước khi được ngắt
+    'open_seconds': 30,             # Thời gian ngắt trước khi cho một lời gọi thử
+    'timeout_multiplier': 2.0,      # Timeout lời gọi = p99 độ trễ gần đây x hệ số này
+    'max_timeout': 60
+}
+CHAT_FALLBACK_REPLY = "Dạ, cháu đang hơi chậm một chút. Bác chờ cháu một lát rồi nói lại với cháu nhé ạ."
+
+# Khởi tạo model: chat dùng model chính, tóm tắt dùng model nhẹ riêng (xem DEFAULT_ROUTES)
+model_router = ModelRouter(provider=llm_provider, breaker_config=CIRCUIT_BREAKER_CONFIG)
+model = model_router.get_model(TASK_CHAT)
+
+# Số liệu streaming (TTFB, số event) và thời gian từng giai đoạn của request giữ trong bộ nhớ
+LATENCY_TRACE_CONFIG = {
+    'structured_logs': False,  # Ghi log JSON thời gian từng giai đoạn của mỗi request (logger utils.metrics)
+    'histogram_window': 1000   # Số request gần nhất dùng tính p50/p95/p99
+}
+metrics_collector = MetricsCollector(save_to_file=False, **LATENCY_TRACE_CONFIG)
 
 # Biến global
 chat_session = None
@@ -50,13 +110,116 @@ TOPICS = {
 }
 
 # Cấu hình
-CONTEXT_LIMIT = 10
-SUMMARY_THRESHOLD = 20
-SUMMARY_BATCH_SIZE = 10
+CONTEXT_LIMIT = 10  # Số tin nhắn tối đa đưa vào context, kể cả khi còn ngân sách token
+EXTRACTIVE_SUMMARY_ENABLED = True  # Rút gọn hội thoại cục bộ trước khi gửi đi tóm tắt
+SUMMARY_SCHEDULER_ENABLED = True  # Tóm tắt trước phần hội thoại cũ khi server rảnh
+SPECULATIVE_ENABLED = True  # Làm nóng session khi người dùng đang gõ, trả lời mẫu cho câu xã giao ngắn
+
+# Cache ngữ nghĩa: câu hỏi gần giống câu đã hỏi (cùng chủ đề, cùng hồ sơ người dùng) dùng lại câu trả lời
+SEMANTIC_CACHE_CONFIG = {
+    'enabled': True,
+    'threshold': 0.8,                         # Độ tương đồng cosine tối thiểu
+    'ttl': 7 * 24 * 3600,                     # Câu trả lời dùng lại được trong bao lâu (giây)
+    'max_entries_per_scope': 500,
+    'max_scopes': 200,                        # Số phạm vi (chủ đề + hồ sơ) giữ lại, bỏ phạm vi lâu không dùng nhất
+    'scope_idle_ttl': 7 * 24 * 3600,          # Bỏ phạm vi không dùng quá lâu (hồ sơ cũ sau khi sửa thông tin)
+    'skip_emotions': ['buồn', 'nhớ_quê'],  # Tâm sự cá nhân luôn được trả lời mới
+    # Chỉ cache câu hỏi thuộc các nhóm này: câu trả lời không phụ thuộc diễn biến cuộc trò chuyện
+    'intents': {
+        'health': r'\b(?:thuốc|bệnh|huyết áp|tiểu đường|đường huyết|triệu chứng|bác sĩ|đau|mệt|mất ngủ|'
+                  r'tập thể dục|ăn uống|dinh dưỡng|vitamin|kiêng)\b',
+        'fact': r'\b(?:là gì|là ai|nghĩa là|năm nào|khi nào|bao nhiêu|ở đâu|có nên|'
+                r'cách (?:làm|nấu|trồng|chữa|phòng|giữ))\b'
+    }
+}
+# Dấu hiệu câu hỏi (chỉ câu hỏi mới được cache, không cache lời kể chuyện)
+QUESTION_PATTERN = re.compile(r'\?|\b(?:gì|sao|nào|bao nhiêu|bao giờ|ở đâu|có nên|được không|không\s*$)', re.IGNORECASE)
+# Nhờ kể, hát, trò chuyện...: câu trả lời phải mới và theo ngữ cảnh, không bao giờ cache
+CONVERSATIONAL_REQUEST_PATTERN = re.compile(r'\b(?:kể|hát|đọc thơ|nói chuyện|trò chuyện|tâm sự|đố|chơi)\b',
+                                            re.IGNORECASE)
+CACHE_INTENT_PATTERNS = {intent: re.compile(pattern, re.IGNORECASE)
+                         for intent, pattern in SEMANTIC_CACHE_CONFIG['intents'].items()}
+
+# Cấu hình tóm tắt theo lượng token ước lượng (không theo số tin nhắn)
+DEFAULT_SUMMARY_CONFIG = {
+    'context_tokens': 1200,          # Ngân sách token cho context gần nhất khi khôi phục session
+    'summary_trigger_tokens': 2400,  # Tổng token của working history để bắt đầu tóm tắt
+    'summary_batch_tokens': 800,     # Token mục tiêu cho mỗi batch tóm tắt
+    'min_context_messages': 2,       # Luôn giữ ít nhất bấy nhiêu tin nhắn gần nhất
+    'max_context_messages': CONTEXT_LIMIT
+}
+
+# Ghi đè cấu hình tóm tắt theo chủ đề
+TOPIC_SUMMARY_CONFIG = {
+    'que_huong': {'context_tokens': 1600, 'summary_trigger_tokens': 3200},  # Hay kể chuyện dài
+    'lich_su': {'context_tokens': 1600, 'summary_trigger_tokens': 3200},
+    'suc_khoe': {'summary_batch_tokens': 600}  # Tóm tắt sớm để giữ thông tin sức khỏe
+}
+
+# Độ dài câu trả lời chat (khớp quy tắc "TỐI ĐA 4-5 CÂU" trong prompt)
+DEFAULT_RESPONSE_SHAPE = {
+    'max_output_tokens': 400,  # Trần token phía model (model 2.5 có thể tính cả token suy nghĩ, không đặt quá thấp)
+    'max_sentences': 5,        # Dừng stream phía server khi đủ số câu (người già hiếm khi nghe hết câu dài)
+    'stop_sequences': ['\nNgười dùng:', '\nUser:']  # Model tự viết tiếp lượt của người dùng
+}
+
+# Ghi đè theo chủ đề
+TOPIC_RESPONSE_SHAPE = {
+    'que_huong': {'max_output_tokens': 480, 'max_sentences': 6},  # Kể chuyện quê, cho dài hơn một chút
+    'lich_su': {'max_output_tokens': 480, 'max_sentences': 6},
+    'suc_khoe': {'max_sentences': 5}
+}
+
+# Gộp các mẩu text khi streaming để giảm số event SSE (mẩu đầu tiên vẫn gửi ngay)
+STREAM_COALESCE_CONFIG = {
+    'flush_on_sentence': True,  # Gửi đến hết câu hoàn chỉnh cuối cùng
+    'max_bytes': 200,           # Gửi khi bộ đệm đạt kích thước này
+    'max_latency': 0.25,        # Không giữ text quá lâu (giây)
+    'flush_first': True
+}
+
+# Buffer event của mỗi stream để client kết nối lại bằng Last-Event-ID
+STREAM_BUFFER_CONFIG = {
+    'max_events': 1024,  # Số event gần nhất giữ lại cho mỗi stream
+    'ttl': 300           # Giữ stream đã xong bao lâu để còn resume (giây)
+}
+# Nén response theo Accept-Encoding (brotli nếu có cài, không thì gzip)
+COMPRESSION_CONFIG = {
+    'enabled': True,
+    'mimetypes': ('application/json', 'text/html'),  # JSON (export, thống kê) và trang chat kèm lịch sử
+    'min_bytes': 1024,  # Chỉ nén response từ kích thước này trở lên
+    'level': 6
+}
+
+STREAM_CANCEL_GRACE = 20  # Hủy sinh phản hồi nếu không còn client nào đọc stream sau bấy nhiêu giây
+
+# Timeout và hedging cho lời gọi chat streaming
+CHAT_HEDGE_CONFIG = {
+    'first_token_timeout': 15,   # Giây chờ token đầu tiên của mỗi lần gọi
+    'chunk_timeout': 20,         # Giây tối đa giữa hai chunk
+    'max_attempts': 3,           # Tổng số lần gọi (kể cả hedge và thử lại)
+    'default_hedge_delay': 3.0,  # Độ trễ hedge khi chưa đủ số liệu p95
+    'min_hedge_delay': 0.8,
+    'adaptive_timeout_multiplier': 3.0,  # Khi đủ số liệu: timeout token đầu = p99 x 3 (không quá first_token_timeout)
+    'min_first_token_timeout': 4.0
+}
+
 USER_INFO_FILE = 'user_info.json'
 TOPICS_DIR = 'topics'
 
 file_lock = threading.Lock()
+extractive_summarizer = ExtractiveSummarizer()
+
+# Cache đoạn prompt tóm tắt đã format: {topic_key: {'version': ..., 'fragment': ...}}
+summary_prompt_cache = {}
+
+# Khóa theo chủ đề: request và scheduler nền không sửa working history cùng lúc
+topic_locks = {topic_key: threading.RLock() for topic_key in TOPICS}
+# Khóa đổi chat_session/current_topic cùng lúc (lượt chat và luồng làm nóng nền)
+session_lock = threading.RLock()
+
+# Các stream phản hồi đang chạy/vừa xong, theo stream ID
+stream_registry = StreamRegistry(**STREAM_BUFFER_CONFIG)
 
 def ensure_topic_folders():
     """Tạo các thư mục chủ đề nếu chưa có"""
@@ -96,6 +259,7 @@ def clear_topic_files(topic_key):
             if os.path.exists(file_path):
                 os.remove(file_path)
                 print(f"Đã xóa file {file_path}")
+        summary_prompt_cache.pop(topic_key, None)
     except Exception as e:
         print(f"Lỗi khi xóa file chủ đề {topic_key}: {e}")
 
@@ -120,49 +284,16 @@ def load_user_info():
         print(f"Lỗi đọc file thông tin người dùng: {e}")
         return {}
 
-def clean_response_text(text):
-    """Làm sạch text đơn giản - chỉ loại bỏ những gì cần thiết"""
-    import re
-    
-    # Chỉ loại bỏ markdown cơ bản
-    text = re.sub(r'\*{1,3}(.*?)\*{1,3}', r'\1', text)  # *, **, ***
-    text = re.sub(r'`{1,3}(.*?)`{1,3}', r'\1', text)    # `, ```
-    text = re.sub(r'#{1,6}\s*(.*?)(?:\n|$)', r'\1\n', text)  # # headers
-    
-    # Loại bỏ một số ký tự markdown
-    text = text.replace('•', '')
-    text = text.replace('→', ' ')
-    text = text.replace('**', '')
-    text = text.replace('*', '')
-    
-    # Sửa khoảng cách sau dấu câu (chỉ khi cần)
-    text = re.sub(r'([.!?:;,])([a-zA-Zàáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ])', r'\1 \2', text)
-    
-    # Chuẩn hóa khoảng trắng
-    text = re.sub(r' {2,}', ' ', text)      # Loại bỏ nhiều space
-    text = re.sub(r'\n{3,}', '\n\n', text)  # Tối đa 2 newline
-    
-    return text.strip()
-
-
 def detect_emotion_and_optimize_response(user_message):
     """
     Phân tích cảm xúc trong tin nhắn người dùng và đưa ra gợi ý phản hồi
     Áp dụng kỹ thuật Emotion Recognition + Response Optimization
     """
-    emotion_keywords = {
-        'buồn': ['buồn', 'khóc', 'cô đơn', 'một mình', 'chán nản', 'tủi thân', 'u uất'],
-        'nhớ_quê': ['nhớ', 'quê', 'xa nhà', 'nước ngoài', 'hoài niệm', 'hương', 'làng'],
-        'lo_lắng': ['lo', 'sợ', 'băn khoăn', 'không biết', 'thế nào', 'làm sao', 'tìm đâu'],
-        'vui': ['vui', 'hạnh phúc', 'tốt', 'khỏe', 'hài lòng', 'sung sướng', 'phấn khích'],
-        'bệnh_tật': ['đau', 'ốm', 'bệnh', 'mệt', 'yếu', 'thuốc', 'khó chịu'],
-        'gia_đình': ['con', 'cháu', 'vợ', 'chồng', 'anh em', 'họ hàng', 'thăm']
-    }
-    
     detected_emotions = []
     message_lower = user_message.lower()
     
-    for emotion, keywords in emotion_keywords.items():
+    # Danh sách từ khóa dùng chung với bộ tóm tắt trích xuất
+    for emotion, keywords in EMOTION_KEYWORDS.items():
         if any(keyword in message_lower for keyword in keywords):
             detected_emotions.append(emotion)
     
@@ -208,29 +339,55 @@ PHÁT HIỆN CẢM XÚC VUI - ÁP DỤNG CHIẾN LƯỢC CHIA VUI:
     return detected_emotions, optimization_hint
 
 
-def get_dialect_style(hometown):
+# Lưới an toàn: nhận diện phần gợi ý cảm xúc nếu model lỡ lặp lại trong phản hồi (biên dịch một lần)
+HINT_LEAK_PATTERN = re.compile(
+    r'PHÁT HIỆN (?:CẢM XÚC|TÌNH CẢM|TÂM TRẠNG)[^\n:]*:'
+    r'|ÁP DỤNG CHIẾN LƯỢC [^\n:]*:'
+    r'|TRÁNH:[^\n]*'
+)
+# Mọi đoạn gợi ý bị lộ đều bắt đầu bằng một trong các cụm này (dùng để giữ lại text khi streaming)
+HINT_LEAK_OPENERS = ('PHÁT HIỆN ', 'ÁP DỤNG CHIẾN LƯỢC ', 'TRÁNH:')
+# In cảnh báo lộ gợi ý tối đa một lần mỗi khoảng này (giây)
+HINT_LEAK_WARNING_INTERVAL = 60
+hint_leak_warning = {'last_at': 0.0, 'suppressed': 0}
+hint_leak_warning_lock = threading.Lock()
+
+
+def create_hint_marker_filter():
+    """Bộ lọc gợi ý cảm xúc cho một stream: gợi ý bị cắt giữa hai mẩu text vẫn được lọc"""
+    return StreamingPatternRemover(HINT_LEAK_PATTERN, HINT_LEAK_OPENERS)
+
+
+def warn_hint_leak(count=1):
+    """In cảnh báo lộ gợi ý cảm xúc, giới hạn tần suất (các lần bị bỏ qua được cộng dồn)"""
+    now = time.time()
+    with hint_leak_warning_lock:
+        if now - hint_leak_warning['last_at'] < HINT_LEAK_WARNING_INTERVAL:
+            hint_leak_warning['suppressed'] += count
+            return
+        suppressed = hint_leak_warning['suppressed']
+        hint_leak_warning.update(last_at=now, suppressed=0)
+    extra = f" (+{suppressed} lần trước chưa báo)" if suppressed else ""
+    print(f"Cảnh báo: phản hồi chứa gợi ý cảm xúc, đã lọc bỏ {count} đoạn{extra}")
+
+
+def get_turn_model(session, instruction):
     """
-    Xác định giọng địa phương với Chain of Thought và Few-shot Prompting
-    Chỉ lấy các tỉnh đại diện cho từng vùng miền
+    Model cho một lượt chat: gợi ý cảm xúc đi kèm dưới dạng system instruction riêng của lượt đó
+    Gợi ý không chèn vào tin nhắn người dùng nên không lưu vào history của session
     """
-    
-    # Chain of Thought: Phân tích bước để xác định giọng
-    analysis_prompt = """
-CHAIN OF THOUGHT - PHÂN TÍCH GIỌNG ĐỊA PHƯƠNG:
-1. XÁC ĐỊNH VÙNG MIỀN: Miền Bắc/Trung/Nam
-2. XÁC ĐỊNH TIỂU VÙNG: Đồng bằng/Núi/Ven biển
-3. ÁP DỤNG ĐẶC ĐIỂM GIỌNG: Từ ngữ + Cách xưng hô + Đặc sản địa phương
-4. SỬ DỤNG FEW-SHOT: Theo mẫu của tỉnh đại diện
-
-"""
-    
-    # Few-shot với các tỉnh đại diện
-    dialect_representatives = {
-        # MIỀN BẮC - Đại diện
-        "Hà Nội": {
-            "region": "Miền Bắc - Thủ đô",
-            "characteristics": "Lịch sự, trang trọng, dùng 'ạ', 'thưa', 'dạ'",
-            "sample_responses": """
+    if not instruction:
+        return session.model
+    return model_router.get_model(TASK_CHAT, system_instruction=instruction)
+
+
+# Giọng địa phương: few-shot theo tỉnh đại diện của từng vùng miền
+DIALECT_REPRESENTATIVES = {
+    # MIỀN BẮC - Đại diện
+    "Hà Nội": {
+        "region": "Miền Bắc - Thủ đô",
+        "characteristics": "Lịch sự, trang trọng, dùng 'ạ', 'thưa', 'dạ'",
+        "sample_responses": """
 FEW-SHOT EXAMPLES:
 User: "Bác nhớ phở Hà Nội quá"
 Assistant: "Bác ạ, phở Hà Nội thơm nức mũi, nước trong vắt như ở phố cổ vậy. Ở xa mà nhớ, bác thử tìm xương bò ninh kỹ, thêm gừng nướng cho đúng điệu Hà Nội nhé."
@@ -238,13 +395,13 @@ Assistant: "Bác ạ, phở Hà Nội thơm nức mũi, nước trong vắt như
 User: "Bác buồn, nhớ Hồ Gươm"  
 Assistant: "Bác ơi, cháu hiểu lắm ạ. Hồ Gươm chiều chiều, gió thổi nhẹ, bao nhiêu kỷ niệm đẹp. Bác kể cháu nghe về những buổi tối đi dạo quanh hồ đi."
 """,
-            "food_culture": "Phở, bún chả, chả cá Lã Vọng, bánh cuốn"
-        },
-        
-        "Nam Định": {
-            "region": "Miền Bắc - Đồng bằng",  
-            "characteristics": "Chân chất, mộc mạc, dùng 'nhỉ', 'đó', 'này'",
-            "sample_responses": """
+        "food_culture": "Phở, bún chả, chả cá Lã Vọng, bánh cuốn"
+    },
+    
+    "Nam Định": {
+        "region": "Miền Bắc - Đồng bằng",  
+        "characteristics": "Chân chất, mộc mạc, dùng 'nhỉ', 'đó', 'này'",
+        "sample_responses": """
 FEW-SHOT EXAMPLES:
 User: "Bác nhớ phở bò Nam Định"
 Assistant: "Ối bác ơi, phở bò Nam Định ngon số một đó! Nước trong, thịt bò tái mềm, ăn là nhớ quê ngay nhỉ. Bác tìm xương bò ninh với quế hồi, bánh phở to to như ở quê mình."
@@ -252,14 +409,14 @@ Assistant: "Ối bác ơi, phở bò Nam Định ngon số một đó! Nước t
 User: "Quê bác có lễ hội gì vui không?"
 Assistant: "Bác ơi, Nam Định mình có hội Phủ Dầy đông vui lắm đó! Rước kiệu, hát chèo rộn ràng, ăn nem nắm ngon tuyệt. Nhớ không bác?"
 """,
-            "food_culture": "Phở bò, nem nắm, bánh cuốn"
-        },
-
-        # MIỀN TRUNG - Đại diện  
-        "Huế": {
-            "region": "Miền Trung - Cố đô",
-            "characteristics": "Nhẹ nhàng, ngọt ngào, dùng 'mình', 'rứa', 'nì', 'mô'", 
-            "sample_responses": """
+        "food_culture": "Phở bò, nem nắm, bánh cuốn"
+    },
+
+    # MIỀN TRUNG - Đại diện  
+    "Huế": {
+        "region": "Miền Trung - Cố đô",
+        "characteristics": "Nhẹ nhàng, ngọt ngào, dùng 'mình', 'rứa', 'nì', 'mô'", 
+        "sample_responses": """
 FEW-SHOT EXAMPLES:
 User: "Bác nhớ bún bò Huế quá"
 Assistant: "Bác ơi, bún bò Huế cay nồng, thơm mắm ruốc rứa! Ở xa quê mà nhớ, bác nấu với sả, gừng, thêm chút mắm ruốc cho đúng vị Huế mình nì."
@@ -267,13 +424,13 @@ Assistant: "Bác ơi, bún bò Huế cay nồng, thơm mắm ruốc rứa! Ở x
 User: "Huế có gì đẹp nhỉ?"
 Assistant: "Bác ơi, Huế mình thơ mộng lắm nha! Sông Hương trong xanh, cầu Trường Tiền, tối nghe ca Huế du dương. Dân mình hiền hậu, ăn nói nhè nhẹ rứa đó mình."
 """,
-            "food_culture": "Bún bò Huế, bánh bèo, bánh nậm, chè Huế"
-        },
+        "food_culture": "Bún bò Huế, bánh bèo, bánh nậm, chè Huế"
+    },
 
-        "Nghệ An": {
-            "region": "Miền Trung - Quê Bác Hồ", 
-            "characteristics": "Giọng 'gi' thành 'di', 'r' thành 'z', chân chất",
-            "sample_responses": """
+    "Nghệ An": {
+        "region": "Miền Trung - Quê Bác Hồ", 
+        "characteristics": "Giọng 'gi' thành 'di', 'r' thành 'z', chân chất",
+        "sample_responses": """
 FEW-SHOT EXAMPLES:  
 User: "Bác nhớ quê Nghệ An"
 Assistant: "Bác ơi, Nghệ An quê Bác Hồ, đất thiêng liêng lắm mà! Làng Sen, làng Kim Liên, nghe tên thôi đã thấy tự hào zồi. Bác có về thăm làng Bác chưa?"
@@ -281,14 +438,14 @@ Assistant: "Bác ơi, Nghệ An quê Bác Hồ, đất thiêng liêng lắm mà!
 User: "Cháo lươn Nghệ An làm sao?"
 Assistant: "Ối bác ơi, cháo lươn Nghệ An ngon tuyệt, ăn là ghiền luôn đó! Lươn làm sạch, nấu cháo với nếp, thêm rau răm, ớt bột. Ăn nóng hổi, nhớ quê dzậy!"
 """,
-            "food_culture": "Cháo lươn, bánh mướt, kim chi Nghệ An"
-        },
-
-        # MIỀN NAM - Đại diện
-        "TP.HCM": {
-            "region": "Miền Nam - Sài Gòn",
-            "characteristics": "Thoải mái, phóng khoáng, dùng 'nhé', 'nha', 'dzậy', 'hông'",
-            "sample_responses": """
+        "food_culture": "Cháo lươn, bánh mướt, kim chi Nghệ An"
+    },
+
+    # MIỀN NAM - Đại diện
+    "TP.HCM": {
+        "region": "Miền Nam - Sài Gòn",
+        "characteristics": "Thoải mái, phóng khoáng, dùng 'nhé', 'nha', 'dzậy', 'hông'",
+        "sample_responses": """
 FEW-SHOT EXAMPLES:
 User: "Bác nhớ hủ tiếu Sài Gòn"  
 Assistant: "Bác ơi, hủ tiếu Sài Gòn ngon bá cháy luôn nha! Nước trong, tôm tươi, mực giòn, ăn là nhớ chợ Bến Thành dzậy đó. Bác có nhớ mấy quán hủ tiếu quen thuộc hông?"
@@ -296,13 +453,13 @@ Assistant: "Bác ơi, hủ tiếu Sài Gòn ngon bá cháy luôn nha! Nước tr
 User: "Sài Gòn có gì vui?"
 Assistant: "Bác ơi, Sài Gòn nhộn nhịp suốt ngày đêm nha! Phố đi bộ Nguyễn Huệ, chợ Bến Thành, tối ra cafe vỉa hè ngồi ngắm người qua lại. Sống động lắm bác ơi!"
 """,
-            "food_culture": "Hủ tiếu, bánh tráng phơi sương, bánh xèo, bánh mì"
-        },
+        "food_culture": "Hủ tiếu, bánh tráng phơi sương, bánh xèo, bánh mì"
+    },
 
-        "Cần Thơ": {
-            "region": "Miền Nam - Miền Tây", 
-            "characteristics": "Đậm chất miền Tây, dùng 'mầy', 'tui', 'dzậy', gần gũi",
-            "sample_responses": """
+    "Cần Thơ": {
+        "region": "Miền Nam - Miền Tây", 
+        "characteristics": "Đậm chất miền Tây, dùng 'mầy', 'tui', 'dzậy', gần gũi",
+        "sample_responses": """
 FEW-SHOT EXAMPLES:
 User: "Bác nhớ bánh xèo Cần Thơ"
 Assistant: "Bác ơi, bánh xèo Cần Thơ giòn rụm, ăn với rau sống mát lành dzậy đó mầy! Bột gạo pha nước cốt dừa, đổ với tôm thịt, ăn chấm mắm nêm chua ngọt. Nhớ chợ nổi Cái Răng hông?"
@@ -310,66 +467,83 @@ Assistant: "Bác ơi, bánh xèo Cần Thơ giòn rụm, ăn với rau sống m
 User: "Miền Tây có gì hay?"  
 Assistant: "Bác ơi, miền Tây mình sông nước mênh mông, dân tình hiền hậu lắm nha! Chợ nổi sáng sớm, vườn trái cây sum suê, chiều ngồi bờ sông câu cá. Thơ mộng dzậy mầy ơi!"
 """,
-            "food_culture": "Bánh xèo, lẩu mắm, cá kho tộ, bánh tét"
-        }
+        "food_culture": "Bánh xèo, lẩu mắm, cá kho tộ, bánh tét"
     }
+}
 
-    # Mapping các tỉnh khác về đại diện
-    province_mapping = {
-        # Miền Bắc → Hà Nội style
-        "Hà Nội": "Hà Nội",
-        "Hà Tây": "Hà Nội", 
-        "Bắc Ninh": "Hà Nội",
-        "Hưng Yên": "Hà Nội",
-        "Hải Dương": "Hà Nội",
-        "Vĩnh Phúc": "Hà Nội",
-        
-        # Miền Bắc → Nam Định style  
-        "Nam Định": "Nam Định",
-        "Thái Bình": "Nam Định",
-        "Hà Nam": "Nam Định", 
-        "Ninh Bình": "Nam Định",
-        
-        # Miền Trung → Huế style
-        "Thừa Thiên Huế": "Huế",
-        "Huế": "Huế",
-        "Quảng Trị": "Huế",
-        "Quảng Bình": "Huế",
-        
-        # Miền Trung → Nghệ An style
-        "Nghệ An": "Nghệ An", 
-        "Hà Tĩnh": "Nghệ An",
-        "Thanh Hóa": "Nghệ An",
-        
-        # Miền Nam → TP.HCM style
-        "TP.HCM": "TP.HCM",
-        "Hồ Chí Minh": "TP.HCM",
-        "Sài Gòn": "TP.HCM",
-        "Bình Dương": "TP.HCM",
-        "Đồng Nai": "TP.HCM",
-        "Bà Rịa - Vũng Tàu": "TP.HCM",
-        
-        # Miền Nam → Cần Thơ style
-        "Cần Thơ": "Cần Thơ",
-        "An Giang": "Cần Thơ", 
-        "Kiên Giang": "Cần Thơ",
-        "Đồng Tháp": "Cần Thơ",
-        "Long An": "Cần Thơ",
-        "Tiền Giang": "Cần Thơ",
-        "Bến Tre": "Cần Thơ",
-        "Vĩnh Long": "Cần Thơ",
-        "Trà Vinh": "Cần Thơ",
-        "Sóc Trăng": "Cần Thơ",
-        "Bạc Liêu": "Cần Thơ", 
-        "Cà Mau": "Cần Thơ",
-        "Hậu Giang": "Cần Thơ"
-    }
+# Mapping các tỉnh khác về đại diện
+PROVINCE_DIALECT_MAPPING = {
+    # Miền Bắc → Hà Nội style
+    "Hà Nội": "Hà Nội",
+    "Hà Tây": "Hà Nội", 
+    "Bắc Ninh": "Hà Nội",
+    "Hưng Yên": "Hà Nội",
+    "Hải Dương": "Hà Nội",
+    "Vĩnh Phúc": "Hà Nội",
+    
+    # Miền Bắc → Nam Định style  
+    "Nam Định": "Nam Định",
+    "Thái Bình": "Nam Định",
+    "Hà Nam": "Nam Định", 
+    "Ninh Bình": "Nam Định",
+    
+    # Miền Trung → Huế style
+    "Thừa Thiên Huế": "Huế",
+    "Huế": "Huế",
+    "Quảng Trị": "Huế",
+    "Quảng Bình": "Huế",
+    
+    # Miền Trung → Nghệ An style
+    "Nghệ An": "Nghệ An", 
+    "Hà Tĩnh": "Nghệ An",
+    "Thanh Hóa": "Nghệ An",
+    
+    # Miền Nam → TP.HCM style
+    "TP.HCM": "TP.HCM",
+    "Hồ Chí Minh": "TP.HCM",
+    "Sài Gòn": "TP.HCM",
+    "Bình Dương": "TP.HCM",
+    "Đồng Nai": "TP.HCM",
+    "Bà Rịa - Vũng Tàu": "TP.HCM",
+    
+    # Miền Nam → Cần Thơ style
+    "Cần Thơ": "Cần Thơ",
+    "An Giang": "Cần Thơ", 
+    "Kiên Giang": "Cần Thơ",
+    "Đồng Tháp": "Cần Thơ",
+    "Long An": "Cần Thơ",
+    "Tiền Giang": "Cần Thơ",
+    "Bến Tre": "Cần Thơ",
+    "Vĩnh Long": "Cần Thơ",
+    "Trà Vinh": "Cần Thơ",
+    "Sóc Trăng": "Cần Thơ",
+    "Bạc Liêu": "Cần Thơ", 
+    "Cà Mau": "Cần Thơ",
+    "Hậu Giang": "Cần Thơ"
+}
 
+
+def get_dialect_style(hometown):
+    """
+    Xác định giọng địa phương với Chain of Thought và Few-shot Prompting
+    Chỉ lấy các tỉnh đại diện cho từng vùng miền
+    """
+    
+    # Chain of Thought: Phân tích bước để xác định giọng
+    analysis_prompt = """
+CHAIN OF THOUGHT - PHÂN TÍCH GIỌNG ĐỊA PHƯƠNG:
+1. XÁC ĐỊNH VÙNG MIỀN: Miền Bắc/Trung/Nam
+2. XÁC ĐỊNH TIỂU VÙNG: Đồng bằng/Núi/Ven biển
+3. ÁP DỤNG ĐẶC ĐIỂM GIỌNG: Từ ngữ + Cách xưng hô + Đặc sản địa phương
+4. SỬ DỤNG FEW-SHOT: Theo mẫu của tỉnh đại diện
+
+"""
+    
     # Tìm đại diện cho hometown
-    representative = province_mapping.get(hometown, "Hà Nội")  # Default Hà Nội
+    representative = PROVINCE_DIALECT_MAPPING.get(hometown, "Hà Nội")  # Default Hà Nội
     
-    if representative in dialect_representatives:
-        dialect_info = dialect_representatives[representative]
+    if representative in DIALECT_REPRESENTATIVES:
+        dialect_info = DIALECT_REPRESENTATIVES[representative]
         
         return f"""
 {analysis_prompt}
@@ -510,7 +684,8 @@ VUI → Chia vui + Khuyến khích duy trì
         QUAN TRỌNG: Người dùng không chọn chủ đề cụ thể và không cung cấp câu hỏi. Hãy trả lời chung chung, gợi ý người dùng chọn một chủ đề (quê hương, gia đình, sức khỏe, lịch sử, tâm linh) và cung cấp thông tin tổng quan về văn hóa Việt Nam.
         """
 
-def get_system_prompt(topic_key, user_input=None, user_info=load_user_info()):
+def build_system_prompt(topic_key, user_input=None, user_info=None, dialect_style_builder=get_dialect_style):
+    """Prompt hệ thống đầy đủ (biến thể 'full'); dialect_style_builder tạo phần giọng địa phương theo quê quán"""
     try:
         prompt_parts = []
         
@@ -627,7 +802,7 @@ QUAN TRỌNG: Luôn gọi người dùng là '{call_style}' trong mọi câu tr
 
             # Giọng nói địa phương
             if user_info.get('hometown'):
-                dialect_style = get_dialect_style(user_info['hometown'])
+                dialect_style = dialect_style_builder(user_info['hometown'])
                 prompt_parts.append(f"""
 QUAN TRỌNG VỀ GIỌNG NÓI: Trả lời theo {dialect_style}. Sử dụng từ ngữ và cách nói đặc trưng của vùng miền này một cách tự nhiên, gần gũi.
 """)
@@ -667,6 +842,62 @@ HƯỚNG DẪN TỐI ƯU:
         return ''.join(prompt_parts)
     except Exception as e:
         return f"Lỗi khi tạo prompt: {str(e)}. Vui lòng kiểm tra thông tin người dùng."
+
+def find_dialect_representative(hometown):
+    """Tỉnh đại diện giọng của quê quán (khớp cả tên viết dài như 'Thừa Thiên Huế', 'TP. Hồ Chí Minh'), None nếu không rõ"""
+    if not hometown:
+        return None
+    if hometown in PROVINCE_DIALECT_MAPPING:
+        return PROVINCE_DIALECT_MAPPING[hometown]
+    normalized = hometown.lower().replace('.', '').replace(' ', '')
+    for province, representative in PROVINCE_DIALECT_MAPPING.items():
+        if province.lower().replace('.', '').replace(' ', '') in normalized:
+            return representative
+    return None
+
+def get_compact_dialect_style(hometown):
+    """Giọng địa phương rút gọn: chỉ đặc điểm và ví dụ của vùng quê người dùng, bỏ phần Chain of Thought"""
+    representative = find_dialect_representative(hometown)
+    if representative is None:
+        return "giọng chung của người Việt: thân thiện, gần gũi, dùng 'nhé', 'nha', 'mình'"
+    dialect_info = DIALECT_REPRESENTATIVES[representative]
+    examples = dialect_info['sample_responses'].replace('FEW-SHOT EXAMPLES:', '').strip()
+    return f"""giọng {dialect_info['region']} ({dialect_info['characteristics']}; món quê: {dialect_info['food_culture']})
+Ví dụ giọng quê:
+{examples}
+"""
+
+# Biến thể system prompt: 'full' là prompt gốc, 'compressed' bỏ quy tắc trùng lặp và chỉ giữ ví dụ giọng quê người dùng
+# Số token từng biến thể xem ở /api/prompt_variants, so sánh độ dài/độ trễ: benchmarks/prompt_ab_test.py
+# Giữ prompt gốc cho tới khi chạy A/B thật (benchmarks/prompt_ab_test.py --provider gemini) cho thấy
+# bản rút gọn không làm giảm chất lượng câu trả lời
+PROMPT_VARIANT = os.getenv('PROMPT_VARIANT', 'full')
+PROMPT_COMPRESSION_CONFIG = {
+    # Phần server đã làm thay model (phát hiện cảm xúc mỗi lượt) hoặc chỉ là mẹo cho người viết prompt
+    'drop_sections': ['KỸ THUẬT NHẬN DIỆN CẢM XÚC', 'KỸ THUẬT TỐI ƯU TOKEN'],
+    'similarity': 0.6  # Quy tắc có Jaccard từ nội dung >= 0.6 với một dòng trước (cùng từ phủ định) bị bỏ
+}
+
+prompt_registry = PromptRegistry()
+prompt_registry.register(
+    'full',
+    lambda topic_key, user_input, user_info: build_system_prompt(topic_key, user_input, user_info),
+    'Prompt gốc: toàn bộ quy tắc và few-shot giọng địa phương kèm Chain of Thought'
+)
+prompt_registry.register(
+    'compressed',
+    lambda topic_key, user_input, user_info: compress_prompt(
+        build_system_prompt(topic_key, user_input, user_info, dialect_style_builder=get_compact_dialect_style),
+        **PROMPT_COMPRESSION_CONFIG
+    ),
+    'Bỏ quy tắc trùng lặp và phần thừa, chỉ giữ ví dụ giọng quê của người dùng'
+)
+
+def get_system_prompt(topic_key, user_input=None, user_info=None, variant=None):
+    """System prompt theo biến thể đang dùng (PROMPT_VARIANT), thông tin người dùng đọc mới mỗi lần"""
+    if user_info is None:
+        user_info = load_user_info()
+    return prompt_registry.build(variant or PROMPT_VARIANT, topic_key, user_input, user_info)
     
 
 def load_chat_history(topic_key):
@@ -767,22 +998,65 @@ def save_summary_data(topic_key, summary_data):
             file_path = get_topic_file_path(topic_key, 'summary')
             with open(file_path, 'w', encoding='utf-8') as f:
                 json.dump(summary_data, f, ensure_ascii=False, indent=2)
+            
+            # Chỉ build lại đoạn prompt khi có phiên bản tóm tắt mới
+            cached = summary_prompt_cache.get(topic_key)
+            if cached is None or cached['version'] != summary_data.get('summary_version'):
+                summary_prompt_cache[topic_key] = {
+                    'version': summary_data.get('summary_version'),
+                    'fragment': format_summary_prompt(topic_key, summary_data)
+                }
     except Exception as e:
         print(f"Lỗi ghi file tóm tắt {topic_key}: {e}")
 
+def format_summary_prompt(topic_key, summary_data):
+    """Tạo đoạn prompt tóm tắt để ghép vào system prompt khi khôi phục session"""
+    if not summary_data or 'summary' not in summary_data:
+        return ""
+    
+    fragment = f"\n\nTóm tắt từ các cuộc hội thoại trước về {TOPICS[topic_key]['name'].upper()}:\n"
+    fragment += f"- Tóm tắt: {summary_data['summary']}\n"
+    if summary_data.get('key_topics'):
+        fragment += f"- Chủ đề chính: {', '.join(summary_data['key_topics'])}\n"
+    if summary_data.get('important_facts'):
+        fragment += f"- Thông tin quan trọng: {', '.join(summary_data['important_facts'])}\n"
+    return fragment
+
+def get_summary_prompt_fragment(topic_key):
+    """Lấy đoạn prompt tóm tắt từ cache, chỉ đọc file ở lần đầu"""
+    cached = summary_prompt_cache.get(topic_key)
+    if cached is None:
+        summary_data = load_summary_data(topic_key)
+        cached = {
+            'version': summary_data.get('summary_version'),
+            'fragment': format_summary_prompt(topic_key, summary_data)
+        }
+        summary_prompt_cache[topic_key] = cached
+    return cached['fragment']
+
+def get_restore_prompt(topic_key):
+    """
+    Dựng prompt khôi phục session (system prompt + tóm tắt)
+    System prompt dựng lại mỗi lần để theo kịp thông tin người dùng và PROMPT_VARIANT;
+    phần tóm tắt đã được cache trong summary_prompt_cache
+    """
+    return get_system_prompt(topic_key) + get_summary_prompt_fragment(topic_key)
+
 def save_chat_context(topic_key, messages):
     """Lưu context gần nhất theo chủ đề"""
     try:
         with file_lock:
             file_path = get_topic_file_path(topic_key, 'context')
-            recent_messages = messages[-CONTEXT_LIMIT:] if len(messages) > CONTEXT_LIMIT else messages
+            config = get_summary_config(topic_key)
+            recent_messages = select_recent_messages(messages, config)
             
             context_data = {
                 'topic': topic_key,
                 'topic_name': TOPICS[topic_key]['name'],
                 'created_at': datetime.now().isoformat(),
                 'last_updated': datetime.now().isoformat(),
-                'context_limit': CONTEXT_LIMIT,
+                'context_limit': config['max_context_messages'],
+                'context_tokens': config['context_tokens'],
                 'recent_messages': recent_messages,
                 'total_messages_count': len(messages)
             }
@@ -792,15 +1066,81 @@ def save_chat_context(topic_key, messages):
     except Exception as e:
         print(f"Lỗi ghi file context {topic_key}: {e}")
 
-def should_create_summary(messages):
-    """Kiểm tra có cần tạo tóm tắt không"""
-    return len(messages) > SUMMARY_THRESHOLD
+def get_response_shape(topic_key):
+    """Lấy giới hạn độ dài câu trả lời của chủ đề (mặc định + ghi đè theo chủ đề)"""
+    shape = dict(DEFAULT_RESPONSE_SHAPE)
+    shape.update(TOPIC_RESPONSE_SHAPE.get(topic_key, {}))
+    return shape
+
+def get_chat_generation_config(shape):
+    """Generation config riêng của lượt chat (trần token, stop sequences), không sửa config của model"""
+    return genai.types.GenerationConfig(
+        max_output_tokens=shape['max_output_tokens'],
+        stop_sequences=shape['stop_sequences'] or None
+    )
+
+def get_summary_config(topic_key):
+    """Lấy cấu hình tóm tắt của chủ đề (mặc định + ghi đè theo chủ đề)"""
+    config = dict(DEFAULT_SUMMARY_CONFIG)
+    config.update(TOPIC_SUMMARY_CONFIG.get(topic_key, {}))
+    return config
+
+def estimate_message_tokens(message):
+    """Ước lượng số token của một lượt hội thoại (user + bot)"""
+    return estimate_tokens(message.get('user', '')) + estimate_tokens(message.get('bot', ''))
+
+def select_recent_messages(messages, config):
+    """Lấy các tin nhắn gần nhất vừa với ngân sách token của context"""
+    recent_messages = []
+    total_tokens = 0
+    
+    for message in reversed(messages):
+        if len(recent_messages) >= config['max_context_messages']:
+            break
+        message_tokens = estimate_message_tokens(message)
+        if (len(recent_messages) >= config['min_context_messages']
+                and total_tokens + message_tokens > config['context_tokens']):
+            break
+        recent_messages.append(message)
+        total_tokens += message_tokens
+    
+    recent_messages.reverse()
+    return recent_messages
+
+def select_summary_batch(messages, config):
+    """Chọn các đoạn cũ nhất cần tóm tắt theo token mục tiêu, không đụng tới context gần nhất"""
+    recent_count = len(select_recent_messages(messages, config))
+    candidates = messages[:len(messages) - recent_count]
+    
+    batch = []
+    batch_tokens = 0
+    for message in candidates:
+        batch.append(message)
+        batch_tokens += estimate_message_tokens(message)
+        if batch_tokens >= config['summary_batch_tokens']:
+            return batch
+    
+    # Chưa đủ token cho một batch thì chờ thêm hội thoại
+    return []
+
+def should_create_summary(topic_key, messages):
+    """Kiểm tra có cần tạo tóm tắt không (theo tổng token của working history)"""
+    config = get_summary_config(topic_key)
+    total_tokens = sum(estimate_message_tokens(message) for message in messages)
+    return total_tokens > config['summary_trigger_tokens']
 
 def create_conversation_summary(topic_key, conversations):
-    """Tạo tóm tắt từ một batch conversations"""
+    """
+    Tạo tóm tắt từ một batch conversations
+    Trả về None nếu lời gọi model lỗi (lỗi API, timeout, circuit đang mở): người gọi giữ nguyên dữ liệu
+    """
     try:
         topic_name = TOPICS[topic_key]['name']
         
+        # Rút gọn cục bộ: bỏ câu chào hỏi, giữ câu có tên riêng/cảm xúc/thông tin chính
+        if EXTRACTIVE_SUMMARY_ENABLED:
+            conversations = extractive_summarizer.compress_conversations(conversations)
+        
         # Tạo prompt để tóm tắt
         summary_prompt = f"""
 Hãy tóm tắt {len(conversations)} đoạn hội thoại về chủ đề {topic_name} một cách ngắn gọn và súc tích:
@@ -830,9 +1170,11 @@ Hãy trả lời theo format JSON:
 }
 """
         
-        # Tạo session riêng để tóm tắt
-        summary_session = model.start_chat()
-        response = summary_session.send_message(summary_prompt)
+        # Gọi model tóm tắt riêng để không tranh slot với chat trực tiếp
+        with model_router.acquire(TASK_SUMMARY) as summary_model:
+            response = summary_model.generate_content(
+                summary_prompt, request_options={'timeout': model_router.get_timeout(TASK_SUMMARY)}
+            )
         # print(response.text)  # Log phản hồi từ mô hình
         
         # Parse JSON response
@@ -866,75 +1208,122 @@ Hãy trả lời theo format JSON:
         
     except Exception as e:
         print(f"Lỗi tạo tóm tắt {topic_key}: {e}")
-        return {
-            "summary": f"Tóm tắt {len(conversations)} đoạn hội thoại",
-            "personal_info": [],
-            "key_topics": [],
-            "important_facts": []
-        }
+        return None
 
 def update_summary_file(topic_key, conversations_to_summarize):
-    """Cập nhật file tóm tắt theo chủ đề"""
+    """Cập nhật file tóm tắt theo chủ đề, trả về True nếu đã lưu tóm tắt mới"""
     try:
         # Load existing summary
+        previous_summary = load_summary_data(topic_key)
+        previous_version = previous_summary.get('summary_version', 0) if 'summary' in previous_summary else 0
+        
         summary_data = {
             'topic': topic_key,
             'topic_name': TOPICS[topic_key]['name'],
             'created_at': datetime.now().isoformat(),
             'last_updated': datetime.now().isoformat(),
-            'summary_version': 1,  # Bắt đầu lại từ phiên bản 1
-            'total_conversations_summarized': len(conversations_to_summarize),  # Đếm số đoạn được tóm tắt
+            'summary_version': previous_version + 1,  # Tăng phiên bản để làm mới cache prompt
+            'total_conversations_summarized': previous_summary.get('total_conversations_summarized', 0) + len(conversations_to_summarize),  # Đếm số đoạn được tóm tắt
             'summary_layers': []  # Reset lại danh sách layer
         }
         
         # Tạo tóm tắt cho batch mới
         new_summary = create_conversation_summary(topic_key, conversations_to_summarize)
+        if new_summary is None:
+            # Không ghi đè tóm tắt cũ bằng câu mẫu khi gọi model lỗi
+            return False
         
-        # Cập nhật nội dung tóm tắt
+        # Cập nhật nội dung tóm tắt, giữ lại chủ đề và thông tin quan trọng của các batch trước
         summary_data['summary'] = new_summary['summary']
-        summary_data['key_topics'] = new_summary['key_topics']
-        summary_data['important_facts'] = new_summary['personal_info'] + new_summary['important_facts']
+        summary_data['key_topics'] = list(dict.fromkeys(
+            previous_summary.get('key_topics', []) + new_summary['key_topics']))
+        summary_data['important_facts'] = list(dict.fromkeys(
+            previous_summary.get('important_facts', []) + new_summary['personal_info'] + new_summary['important_facts']))
         
         # Lưu updated summary
         save_summary_data(topic_key, summary_data)
         print(f"Đã tạo tóm tắt cho {len(conversations_to_summarize)} đoạn hội thoại chủ đề {topic_key}")
+        return True
         
     except Exception as e:
         print(f"Lỗi cập nhật tóm tắt {topic_key}: {e}")
+        return False
+
+def summarize_oldest_batch(topic_key, messages):
+    """
+    Tóm tắt batch cũ nhất (nếu đủ token) và trả về phần hội thoại còn lại
+    Trả về None nếu tạo tóm tắt lỗi: các đoạn cũ chưa được tóm tắt nên không được xóa
+    """
+    # Lấy các đoạn cần tóm tắt (cũ nhất) theo token mục tiêu của chủ đề
+    old_conversations = select_summary_batch(messages, get_summary_config(topic_key))
+    
+    if old_conversations:
+        # Tạo tóm tắt
+        if not update_summary_file(topic_key, old_conversations):
+            return None
+        
+        # Giữ lại phần còn lại (XÓA các đoạn cũ khỏi working file)
+        remaining_messages = messages[len(old_conversations):]
+        
+        print(f"Đã tóm tắt {len(old_conversations)} đoạn cũ chủ đề {topic_key}, còn lại {len(remaining_messages)} đoạn")
+        return remaining_messages
+    
+    return messages
 
 def manage_context_and_summary(topic_key, messages):
     """Quản lý context và tóm tắt theo chủ đề"""
-    if should_create_summary(messages):
-        # Tính toán cần tóm tắt bao nhiêu đoạn
-        conversations_to_summarize = len(messages) - CONTEXT_LIMIT
-        
-        if conversations_to_summarize >= SUMMARY_BATCH_SIZE:
-            # Lấy các đoạn cần tóm tắt (cũ nhất)
-            old_conversations = messages[:SUMMARY_BATCH_SIZE]
-            
-            # Tạo tóm tắt
-            update_summary_file(topic_key, old_conversations)
-            
-            # Giữ lại phần còn lại (XÓA các đoạn cũ khỏi working file)
-            remaining_messages = messages[SUMMARY_BATCH_SIZE:]
-            
-            print(f"Đã tóm tắt {SUMMARY_BATCH_SIZE} đoạn cũ chủ đề {topic_key}, còn lại {len(remaining_messages)} đoạn")
-            return remaining_messages
+    if should_create_summary(topic_key, messages):
+        remaining_messages = summarize_oldest_batch(topic_key, messages)
+        # Tóm tắt lỗi: giữ nguyên history, lượt sau thử lại
+        return messages if remaining_messages is None else remaining_messages
     
     return messages
 
-def init_chat_session(topic_key):
-    """Khởi tạo chat session theo chủ đề"""
+def find_topics_with_summary_backlog():
+    """Tìm các chủ đề có phần hội thoại cũ đủ một batch tóm tắt, nhiều nhất trước"""
+    backlog = []
+    for topic_key in TOPICS.keys():
+        messages = load_chat_history(topic_key)
+        batch = select_summary_batch(messages, get_summary_config(topic_key))
+        if batch:
+            backlog.append((len(messages), topic_key))
+    return [topic_key for _, topic_key in sorted(backlog, reverse=True)]
+
+def summarize_topic_backlog(topic_key):
+    """Tóm tắt trước phần hội thoại nằm ngoài context gần nhất (chạy nền khi server rảnh)"""
+    with topic_locks[topic_key]:
+        messages = load_chat_history(topic_key)
+        remaining_messages = summarize_oldest_batch(topic_key, messages)
+        if remaining_messages is None:
+            # Báo lỗi cho scheduler; history và file tóm tắt giữ nguyên để lần rảnh sau thử lại
+            raise RuntimeError(f"Tóm tắt nền chủ đề {topic_key} thất bại")
+        
+        if len(remaining_messages) != len(messages):
+            save_chat_history(topic_key, remaining_messages)
+            save_chat_context(topic_key, remaining_messages)
+
+def activate_session(topic_key, session):
+    """Đặt session đã dựng xong làm session hiện tại (đổi session và chủ đề cùng lúc)"""
     global chat_session, current_topic
-    try:
+    with session_lock:
+        chat_session = session
         current_topic = topic_key
+
+def get_active_session(topic_key):
+    """Session hiện tại nếu đang thuộc chủ đề này, không thì None"""
+    with session_lock:
+        return chat_session if current_topic == topic_key else None
+
+def init_chat_session(topic_key):
+    """Khởi tạo chat session theo chủ đề, trả về session mới (None nếu lỗi)"""
+    try:
         system_prompt = get_system_prompt(topic_key)
         
         # Câu chào gần gũi, không nhắc đến AI
         topic_name = TOPICS[topic_key]['name']
         friendly_greeting = f"Chào bác! Cháu đây, sẵn sàng tâm sự với bác về {topic_name.replace('🏠 ', '').replace('👨‍👩‍👧‍👦 ', '').replace('💊 ', '').replace('📚 ', '').replace('🙏 ', '')} nhé. Bác có muốn chia sẻ gì không?"
         
-        chat_session = model.start_chat(
+        session = model.start_chat(
             history=[
                 {
                     "role": "user",
@@ -949,30 +1338,21 @@ def init_chat_session(topic_key):
         print(f"Chat session đã được khởi tạo cho chủ đề: {topic_key}")
     except Exception as e:
         print(f"Lỗi khởi tạo chat session: {e}")
-        chat_session = None
+        session = None
+    activate_session(topic_key, session)
+    return session
 
-def restore_chat_session_with_summary(topic_key):
-    """Khôi phục session với tóm tắt + context gần nhất theo chủ đề"""
-    global chat_session, current_topic
-    
-    try:
-        current_topic = topic_key
-        
-        # Load summary và context
-        summary_data = load_summary_data(topic_key)
+def build_restored_session(topic_key):
+    """
+    Dựng session khôi phục (tóm tắt + context gần nhất) của chủ đề mà không đổi session hiện tại
+    Đọc history trong khóa của chủ đề để không lẫn với lượt đang được ghi
+    """
+    with topic_locks[topic_key]:
+        # Load context (tóm tắt lấy từ cache, không đọc lại file)
         recent_messages = load_chat_history(topic_key)
         
-        # Tạo context prompt với tóm tắt
-        context_prompt = get_system_prompt(topic_key)
-        
-        # Thêm tóm tắt chính vào prompt
-        if summary_data and 'summary' in summary_data:
-            context_prompt += f"\n\nTóm tắt từ các cuộc hội thoại trước về {TOPICS[topic_key]['name'].upper()}:\n"
-            context_prompt += f"- Tóm tắt: {summary_data['summary']}\n"
-            if summary_data['key_topics']:
-                context_prompt += f"- Chủ đề chính: {', '.join(summary_data['key_topics'])}\n"
-            if summary_data['important_facts']:
-                context_prompt += f"- Thông tin quan trọng: {', '.join(summary_data['important_facts'])}\n"
+        # Tạo context prompt với tóm tắt (đã được tính sẵn nếu scheduler nền chạy trước)
+        context_prompt = get_restore_prompt(topic_key)
         # Tạo history cho Gemini
         gemini_history = [
             {
@@ -985,9 +1365,9 @@ def restore_chat_session_with_summary(topic_key):
             }
         ]
         
-        # Thêm context gần nhất
-        context_limit = min(CONTEXT_LIMIT, len(recent_messages))
-        for chat in recent_messages[-context_limit:]:
+        # Thêm context gần nhất (theo ngân sách token của chủ đề)
+        context_messages = select_recent_messages(recent_messages, get_summary_config(topic_key))
+        for chat in context_messages:
             gemini_history.append({
                 "role": "user",
                 "parts": [chat['user']]
@@ -996,15 +1376,34 @@ def restore_chat_session_with_summary(topic_key):
                 "role": "model",
                 "parts": [chat['bot']]
             })
-        
-        chat_session = model.start_chat(history=gemini_history)
-        print(f"Khôi phục session chủ đề {topic_key} với {context_limit} tin nhắn gần nhất.")
-        
+    
+    session = model.start_chat(history=gemini_history)
+    print(f"Khôi phục session chủ đề {topic_key} với {len(context_messages)} tin nhắn gần nhất.")
+    return session
+
+def restore_chat_session_with_summary(topic_key):
+    """Khôi phục session với tóm tắt + context gần nhất theo chủ đề, trả về session mới"""
+    try:
+        session = build_restored_session(topic_key)
     except Exception as e:
         print(f"Lỗi khôi phục session {topic_key}: {e}")
-        init_chat_session(topic_key)
-
-def add_message_to_history(topic_key, user_message, bot_response):
+        return init_chat_session(topic_key)
+    activate_session(topic_key, session)
+    return session
+
+def get_topic_session(topic_key):
+    """Session của chủ đề cho một lượt chat: dùng session hiện tại nếu đúng chủ đề, không thì khôi phục"""
+    session = get_active_session(topic_key)
+    if session is not None:
+        return session
+    return restore_chat_session_with_summary(topic_key)
+
+def add_message_to_history(topic_key, user_message, bot_response, status='complete'):
+    """
+    Lưu một lượt chat
+    status khác 'complete' ('partial', 'aborted': client ngắt kết nối giữa chừng) chỉ ghi vào
+    full backup kèm cờ, không đưa vào working history/context và không kích hoạt tóm tắt
+    """
     cleaned_response = bot_response.strip()
     new_message = {
         'timestamp': datetime.now().isoformat(),
@@ -1012,22 +1411,28 @@ def add_message_to_history(topic_key, user_message, bot_response):
         'bot': bot_response,
         'emotions_detected': detect_emotion_and_optimize_response(user_message)[0]  # Lưu cảm xúc được phát hiện
     }
+    if status != 'complete':
+        new_message['status'] = status
     
-    # 1. Cập nhật FULL BACKUP trước (không bao giờ bị xóa)
-    full_backup = load_full_backup(topic_key)
-    full_backup.append(new_message)
-    save_full_backup(topic_key, full_backup)
-    
-    # 2. Cập nhật working history
-    messages = load_chat_history(topic_key)
-    messages.append(new_message)
-    
-    # 3. Quản lý context và tóm tắt (có thể cắt bớt messages)
-    messages = manage_context_and_summary(topic_key, messages)
-    
-    # 4. Lưu lại working files
-    save_chat_history(topic_key, messages)
-    save_chat_context(topic_key, messages)
+    with topic_locks[topic_key]:
+        # 1. Cập nhật FULL BACKUP trước (không bao giờ bị xóa)
+        full_backup = load_full_backup(topic_key)
+        full_backup.append(new_message)
+        save_full_backup(topic_key, full_backup)
+        
+        if status != 'complete':
+            return
+        
+        # 2. Cập nhật working history
+        messages = load_chat_history(topic_key)
+        messages.append(new_message)
+        
+        # 3. Quản lý context và tóm tắt (có thể cắt bớt messages)
+        messages = manage_context_and_summary(topic_key, messages)
+        
+        # 4. Lưu lại working files
+        save_chat_history(topic_key, messages)
+        save_chat_context(topic_key, messages)
 
 def get_topic_statistics(topic_key):
     """Lấy thống kê chat theo chủ đề"""
@@ -1066,8 +1471,107 @@ def get_all_topics_statistics():
         all_stats[topic_key] = get_topic_statistics(topic_key)
     return all_stats
 
+# Scheduler nền: tóm tắt trước và format sẵn đoạn prompt tóm tắt khi lượng request thấp
+summary_scheduler = IdleSummaryScheduler(
+    find_backlog=find_topics_with_summary_backlog,
+    summarize=summarize_topic_backlog,
+    precompute=get_summary_prompt_fragment
+)
+
+def warm_topic_session(topic_key):
+    """
+    Chuẩn bị trước đoạn prompt tóm tắt và session của chủ đề trong lúc người dùng đang gõ
+    Session được dựng riêng rồi mới đổi vào: lượt chat đang chạy vẫn giữ session nó đang dùng
+    """
+    get_summary_prompt_fragment(topic_key)
+    if get_active_session(topic_key) is not None:
+        return
+    session = build_restored_session(topic_key)
+    with session_lock:
+        # Một lượt chat có thể đã khôi phục session của chủ đề trong lúc đang dựng
+        if get_active_session(topic_key) is None:
+            activate_session(topic_key, session)
+
+def bot_asked_question(session):
+    """Lượt cuối của bot trong session có kết thúc bằng câu hỏi không (câu xã giao khi đó là câu trả lời)"""
+    for content in reversed(getattr(session, 'history', None) or []):
+        if content.role == 'model':
+            return ''.join(part.text for part in content.parts).rstrip().endswith('?')
+    return False
+
+def append_turn_to_session(user_message, bot_response, session=None):
+    """Ghi một lượt đã hoàn tất vào history của chat session (mặc định session hiện tại)"""
+    session = session or chat_session
+    if session is None:
+        return
+    session.history.extend([
+        genai.protos.Content(role='user', parts=[genai.protos.Part(text=user_message)]),
+        genai.protos.Content(role='model', parts=[genai.protos.Part(text=bot_response)])
+    ])
+
+# Dự đoán lượt tiếp theo: làm nóng session theo typing ping, trả lời mẫu cá nhân hóa cho câu ngắn quen thuộc
+speculative_engine = SpeculativeEngine(warm=warm_topic_session)
+
+semantic_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_CONFIG['threshold'],
+    max_entries_per_scope=SEMANTIC_CACHE_CONFIG['max_entries_per_scope'],
+    ttl=SEMANTIC_CACHE_CONFIG['ttl'],
+    max_scopes=SEMANTIC_CACHE_CONFIG['max_scopes'],
+    scope_idle_ttl=SEMANTIC_CACHE_CONFIG['scope_idle_ttl']
+)
+
+def get_cache_intent(user_message):
+    """Nhóm câu hỏi được phép cache (sức khỏe, kiến thức) của tin nhắn, hoặc None"""
+    if not QUESTION_PATTERN.search(user_message) or CONVERSATIONAL_REQUEST_PATTERN.search(user_message):
+        return None
+    for intent, pattern in CACHE_INTENT_PATTERNS.items():
+        if pattern.search(user_message):
+            return intent
+    return None
+
+def semantic_scope_prefix(topic_key):
+    """Tiền tố chung của mọi phạm vi cache ngữ nghĩa thuộc một chủ đề"""
+    return f"{topic_key}:"
+
+def get_semantic_scope(topic_key, user_message, detected_emotions, user_info=None):
+    """
+    Phạm vi cache ngữ nghĩa của tin nhắn (chủ đề + hồ sơ người dùng), hoặc None nếu không dùng cache
+    Chỉ áp dụng cho câu hỏi sức khỏe/kiến thức (SEMANTIC_CACHE_CONFIG['intents']), bỏ qua tin nhắn mang cảm xúc cá nhân
+    user_info: hồ sơ người dùng đã load của lượt chat (mặc định đọc từ file)
+    """
+    if not SEMANTIC_CACHE_CONFIG['enabled'] or get_cache_intent(user_message) is None:
+        return None
+    if any(emotion in SEMANTIC_CACHE_CONFIG['skip_emotions'] for emotion in detected_emotions):
+        return None
+    user_info = user_info if user_info is not None else load_user_info()
+    profile = '|'.join(str(user_info.get(key, '')) for key in ('name', 'age', 'hometown', 'call_style'))
+    return f"{semantic_scope_prefix(topic_key)}{profile}"
+
 # === ROUTES ===
 
+@app.after_request
+def compress_response(response):
+    """Nén response JSON/HTML lớn (export, thống kê, trang chat kèm lịch sử) nếu client chấp nhận"""
+    if (not COMPRESSION_CONFIG['enabled'] or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESSION_CONFIG['mimetypes'] or 'Content-Encoding' in response.headers):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESSION_CONFIG['min_bytes']:
+        return response
+    
+    response.set_data(compress_body(data, encoding, COMPRESSION_CONFIG['level']))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.before_request
+def start_background_jobs():
+    """Khởi động scheduler nền ở request đầu tiên (trong đúng process phục vụ request)"""
+    if SUMMARY_SCHEDULER_ENABLED:
+        summary_scheduler.start()
+
 @app.route('/')
 def index():
     """Trang chọn chủ đề"""
@@ -1090,11 +1594,352 @@ def chat_page(topic_key):
                          topic_info=topic_info,
                          messages=messages)
 
+def cancel_upstream_stream(stream):
+    """Dừng stream đang đọc dở ở upstream (cách hủy tùy provider, xem LLMProvider.cancel_stream)"""
+    if not llm_provider.cancel_stream(stream):
+        print("Cảnh báo: không hủy được stream upstream, model vẫn sinh tiếp tới hết")
+
+# Gửi lượt chat có timeout từng lần gọi và hedging (gọi thêm một lần nếu token đầu chậm hơn p95)
+chat_streamer = HedgedStreamer(cancel_stream=cancel_upstream_stream, **CHAT_HEDGE_CONFIG)
+
+def record_chat_token_usage(topic_key, contents, instruction, raw_response, usage_metadata=None, user_info=None):
+    """
+    Ghi số token và chi phí của một lượt chat theo người dùng/chủ đề (xem /api/token_usage)
+    Dùng số token thật từ usage_metadata nếu có (và hiệu chỉnh bộ ước lượng), không thì ước lượng cục bộ
+    user_info: hồ sơ người dùng đã load của lượt chat (tránh đọc lại file mỗi lượt)
+    """
+    try:
+        prompt_texts = [part.text for content in contents for part in content.parts if part.text]
+        prompt_texts.append(instruction or '')
+        input_tokens = getattr(usage_metadata, 'prompt_token_count', 0) or 0
+        output_tokens = getattr(usage_metadata, 'candidates_token_count', 0) or 0
+        if output_tokens and raw_response:
+            default_estimator.observe(raw_response, output_tokens)
+        
+        estimated = not input_tokens or not output_tokens
+        input_tokens = input_tokens or estimate_tokens_many(prompt_texts)
+        output_tokens = output_tokens or estimate_tokens(raw_response)
+        metrics_collector.record_token_usage(metrics_collector.create_token_usage(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            model_name=model_router.get_route(TASK_CHAT).model_name,
+            user_id=(user_info if user_info is not None else load_user_info()).get('name'),
+            topic=topic_key,
+            estimated=estimated
+        ))
+    except Exception as e:
+        print(f"Lỗi ghi số token: {e}")
+
+def run_chat_turn(topic_key, user_message, detected_emotions, optimization_hint, emit, request_start,
+                  should_cancel=None, trace=None, semantic_scope=None, session=None, user_info=None):
+    """
+    Chạy một lượt chat với Gemini và phát từng event (JSON đã mã hóa) qua emit
+    Không phụ thuộc kết nối HTTP: SSE đọc lại event từ StreamBuffer theo ID
+    should_cancel() trả về True khi không còn ai nhận phản hồi: dừng stream, không ghi lượt vào session
+    trace: RequestTrace của request, ghi thời gian build prompt, chunk đầu, stream và lưu lịch sử
+    semantic_scope: nếu có, câu trả lời hoàn chỉnh được lưu vào cache ngữ nghĩa trong phạm vi này
+    session: chat session của lượt (mặc định session hiện tại)
+    user_info: hồ sơ người dùng đã load khi bắt đầu lượt (dùng để ghi số token theo người dùng)
+    """
+    session = session or chat_session
+    stream_stats = {'start': request_start, 'first_byte': None, 'chunks': 0, 'events': 0, 'bytes': 0}
+    trace = trace or RequestTrace('chat', request_start)
+    success, error_message, cancelled = True, None, False
+    
+    def emit_event(payload):
+        """Mã hóa event một lần, phát đi và cập nhật số liệu stream"""
+        data = json.dumps(payload)
+        if stream_stats['first_byte'] is None:
+            stream_stats['first_byte'] = time.time()
+        stream_stats['events'] += 1
+        stream_stats['bytes'] += len(data.encode('utf-8'))
+        emit(data)
+    
+    try:
+        # Kiểm tra chat_session tồn tại
+        if session is None:
+            success, error_message = False, 'Chat session chưa được khởi tạo'
+            emit_event({'error': error_message})
+            return
+        
+        with trace.span('prompt_build'):
+            turn_model = get_turn_model(session, optimization_hint.strip())
+            # Gửi trên bản chụp history: session chỉ được cập nhật khi lượt hoàn tất,
+            # nên lần gọi lỗi/hedge/thử lại không để lại lượt dở dang trong history
+            contents = list(session.history) + [
+                genai.protos.Content(role='user', parts=[genai.protos.Part(text=user_message)])
+            ]
+            shape = get_response_shape(topic_key)
+            generation_config = get_chat_generation_config(shape)
+        
+        # Làm sạch tăng dần: markdown bị cắt giữa các chunk vẫn được xử lý đúng
+        text_cleaner = StreamingTextCleaner()
+        # Lọc gợi ý cảm xúc bị lộ, kể cả khi bị cắt giữa hai mẩu text
+        hint_filter = create_hint_marker_filter()
+        # Gộp các mẩu nhỏ thành ít event hơn (theo câu, kích thước hoặc độ trễ)
+        coalescer = StreamCoalescer(**STREAM_COALESCE_CONFIG)
+        # Đếm câu đã gửi, cắt stream khi đủ số câu của chủ đề
+        sentence_budget = SentenceBudget(shape['max_sentences'])
+        raw_response = ""
+        bot_response = ""
+        usage_metadata = None
+        local_error = None
+        
+        # Chỉ giữ slot của route chat khi gọi model và đọc stream: lỗi xử lý cục bộ
+        # (làm sạch, gửi event, lưu) không bị circuit breaker tính là lỗi của model
+        with model_router.acquire(TASK_CHAT):
+            # Chờ chunk tiếp theo tối đa đến hạn max_latency của text đang giữ (stream trả về None khi hết hạn)
+            stream = chat_streamer.stream(
+                lambda: turn_model.generate_content(contents, generation_config=generation_config, stream=True),
+                idle_timeout=coalescer.time_until_flush
+            )
+            upstream_start = last_chunk_at = time.time()
+            for chunk in stream:
+                if chunk is not None:
+                    # Chunk đầu: thời gian chờ model (gồm cả hedge/thử lại); sau đó: khoảng cách giữa các chunk
+                    chunk_at = time.time()
+                    if stream_stats['chunks'] == 0:
+                        trace.add_span('first_chunk', chunk_at - upstream_start)
+                    else:
+                        trace.add_sample('inter_chunk', chunk_at - last_chunk_at)
+                    last_chunk_at = chunk_at
+                    if should_cancel is not None and should_cancel():
+                        cancelled = True
+                        break
+                    stream_stats['chunks'] += 1
+                    # Chunk cuối mang số token thật của cả lượt
+                    usage_metadata = getattr(chunk, 'usage_metadata', None) or usage_metadata
+                try:
+                    if chunk is None:
+                        # Upstream im lặng quá max_latency: gửi phần text đang giữ
+                        pending_text = coalescer.poll()
+                    elif chunk.text:
+                        raw_response += chunk.text
+                        # Làm sạch text trước khi gửi (chỉ gửi phần đã chốt)
+                        clean_text = sentence_budget.feed(hint_filter.feed(text_cleaner.feed(chunk.text)))
+                        bot_response += clean_text
+                        pending_text = coalescer.add(clean_text)
+                    else:
+                        continue
+                    if pending_text:
+                        emit_event({'text': pending_text})
+                except Exception as e:
+                    # Lỗi xử lý cục bộ: dừng đọc stream, báo lỗi sau khi đã trả slot
+                    local_error = e
+                    break
+                if sentence_budget.exhausted:
+                    break
+            
+            if stream_stats['chunks']:
+                trace.add_span('stream', time.time() - upstream_start - trace.spans.get('first_chunk', 0.0))
+            if cancelled or sentence_budget.exhausted or local_error is not None:
+                # Dừng mọi lần gọi đang chạy ở upstream (client đã ngắt, đã đủ số câu hoặc lỗi cục bộ)
+                stream.close()
+        
+        if local_error is not None:
+            raise local_error
+        
+        record_chat_token_usage(topic_key, contents, optimization_hint, raw_response, usage_metadata, user_info)
+        
+        if not cancelled:
+            clean_text = sentence_budget.feed(hint_filter.feed(text_cleaner.finish()) + hint_filter.finish())
+            if hint_filter.removed:
+                warn_hint_leak(hint_filter.removed)
+            bot_response += clean_text
+            pending_text = coalescer.flush(clean_text)
+            if pending_text:
+                emit_event({'text': pending_text})
+            with trace.span('persistence'):
+                # Câu trả lời bị cắt: history của session giữ đúng phần người dùng đã nhận
+                append_turn_to_session(user_message, bot_response if sentence_budget.exhausted else raw_response,
+                                       session)
+        
+        if cancelled:
+            status = 'partial' if bot_response else 'aborted'
+            print(f"Client ngắt kết nối, dừng sinh phản hồi ({status}, {len(bot_response)} ký tự)")
+            try:
+                with trace.span('persistence'):
+                    add_message_to_history(topic_key, user_message, bot_response, status=status)
+            except Exception as save_error:
+                print(f"Lỗi lưu lịch sử: {save_error}")
+            emit_event({'cancelled': True, 'status': status})
+            return
+        
+        # Lưu vào lịch sử (chỉ lưu message gốc)
+        try:
+            with trace.span('persistence'):
+                add_message_to_history(topic_key, user_message, bot_response)
+        except Exception as save_error:
+            print(f"Lỗi lưu lịch sử: {save_error}")
+        
+        if semantic_scope and bot_response.strip():
+            semantic_cache.add(user_message, bot_response, semantic_scope)
+        
+        trace.attributes['truncated'] = sentence_budget.exhausted
+        emit_event({'done': True, 'emotions_detected': detected_emotions})
+        
+    except CircuitOpenError as e:
+        # Model đang lỗi liên tục: trả lời ngay bằng câu mẫu, không ghi câu mẫu vào session/lịch sử
+        print(f"Không gọi model chat: {e}")
+        success, error_message = False, str(e)
+        trace.name = 'chat_fallback'
+        emit_event({'text': CHAT_FALLBACK_REPLY})
+        emit_event({'done': True, 'fallback': True, 'retry_after': round(e.retry_after, 1),
+                    'emotions_detected': detected_emotions})
+    except Exception as e:
+        print(f"Lỗi trong run_chat_turn(): {e}")
+        success, error_message = False, str(e)
+        emit_event({'error': f'Lỗi xử lý: {str(e)}'})
+    finally:
+        first_byte = stream_stats['first_byte']
+        trace.finish()
+        trace.attributes.update({'topic': topic_key, 'success': success, 'cancelled': cancelled,
+                                 'upstream_chunks': stream_stats['chunks']})
+        metrics_collector.record_trace(trace)
+        metrics_collector.record_stream_metrics(metrics_collector.create_stream_metrics(
+            start_time=stream_stats['start'],
+            end_time=time.time(),
+            time_to_first_byte=first_byte - stream_stats['start'] if first_byte else None,
+            upstream_chunks=stream_stats['chunks'],
+            events_sent=stream_stats['events'],
+            bytes_sent=stream_stats['bytes'],
+            success=success,
+            error_message=error_message,
+            cancelled=cancelled
+        ))
+
+def format_sse_event(event_id, data):
+    """Định dạng một event SSE có ID (để client gửi lại Last-Event-ID khi kết nối lại)"""
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+def sse_response(buffer, last_event_id=0):
+    """Trả về response SSE đọc event từ buffer, bắt đầu sau last_event_id"""
+    def generate():
+        for event in buffer.read(last_event_id):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield format_sse_event(*event)
+    
+    headers = {
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+        'X-Accel-Buffering': 'no',
+        'X-Stream-Id': buffer.stream_id
+    }
+    body = generate()
+    
+    # Nén stream, flush sau mỗi event để client nhận ngay từng event
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding')) if COMPRESSION_CONFIG['enabled'] else None
+    if encoding:
+        body = compress_stream(body, encoding, COMPRESSION_CONFIG['level'])
+        headers['Content-Encoding'] = encoding
+        headers['Vary'] = 'Accept-Encoding'
+    
+    return Response(body, mimetype='text/event-stream', headers=headers)
+
+def validate_chat_input(user_message, topic_key):
+    """Kiểm tra tin nhắn và chủ đề, trả về thông báo lỗi hoặc None"""
+    if not user_message:
+        return 'Tin nhắn không được để trống'
+    if not topic_key:
+        return 'Chủ đề không được để trống'
+    if topic_key not in TOPICS:
+        return f'Chủ đề không hợp lệ: {topic_key}'
+    return None
+
+def reply_without_model(topic_key, user_message, reply, trace, trace_name, done_info, session=None):
+    """Trả lời ngay không gọi model (câu mẫu hoặc cache): ghi lượt vào session/lịch sử và trả về buffer đã đóng"""
+    buffer = stream_registry.create()
+    buffer.append(json.dumps({'text': reply}))
+    buffer.append(json.dumps({'done': True, **done_info}))
+    buffer.close()
+    
+    # Ghi lịch sử ngay (dưới khóa của chủ đề như nhánh gọi model) để các lượt được lưu đúng thứ tự
+    with trace.span('persistence'):
+        append_turn_to_session(user_message, reply, session)
+        try:
+            add_message_to_history(topic_key, user_message, reply)
+        except Exception as save_error:
+            print(f"Lỗi lưu lịch sử: {save_error}")
+    
+    # Thống kê riêng để câu trả lời không qua model không kéo thấp phân vị của lượt gọi model
+    trace.name = trace_name
+    trace.finish()
+    trace.attributes['topic'] = topic_key
+    metrics_collector.record_trace(trace)
+    return buffer
+
+def start_chat_turn(topic_key, user_message, request_start):
+    """
+    Bắt đầu một lượt chat và trả về StreamBuffer chứa các event của lượt đó
+    Dùng chung cho SSE (/api/chat) và WebSocket (/ws/chat)
+    """
+    # Thời gian từng giai đoạn của request (xem /api/latency_metrics)
+    trace = RequestTrace('chat', request_start)
+    
+    # Phân tích cảm xúc và tối ưu phản hồi
+    try:
+        with trace.span('emotion_detection'):
+            detected_emotions, optimization_hint = detect_emotion_and_optimize_response(user_message)
+    except Exception as e:
+        print(f"Lỗi phân tích cảm xúc: {e}")
+        detected_emotions, optimization_hint = [], ""
+    
+    # Khởi tạo chat session nếu chưa có hoặc đổi chủ đề; lượt này giữ session của nó tới khi xong
+    with trace.span('session_restore'):
+        try:
+            session = get_topic_session(topic_key)
+        except Exception as e:
+            print(f"Lỗi khởi tạo session: {e}")
+            session = init_chat_session(topic_key)
+    
+    # Hồ sơ người dùng đọc một lần cho cả lượt (câu mẫu, phạm vi cache, ghi số token)
+    user_info = load_user_info()
+    
+    # Câu xã giao ngắn (khớp nguyên văn danh sách quen thuộc): trả lời ngay bằng mẫu cá nhân hóa, không gọi model
+    # Bỏ qua khi bot vừa hỏi: "vâng", "có" lúc đó là câu trả lời, cần model hiểu theo ngữ cảnh
+    quick_reply = None
+    if SPECULATIVE_ENABLED and not bot_asked_question(session):
+        with trace.span('quick_reply_match'):
+            topic_name = TOPICS[topic_key]['name'].split(' ', 1)[-1]
+            quick_reply = speculative_engine.quick_reply(user_message, topic_key, topic_name, user_info)
+    
+    if quick_reply:
+        return reply_without_model(topic_key, user_message, quick_reply, trace, 'chat_quick_reply',
+                                   {'emotions_detected': detected_emotions, 'quick_reply': True}, session)
+    
+    # Câu hỏi gần giống câu đã hỏi trong cùng chủ đề/hồ sơ: trả lại câu trả lời cũ sau vài mili giây
+    with trace.span('semantic_cache_lookup'):
+        semantic_scope = get_semantic_scope(topic_key, user_message, detected_emotions, user_info)
+        cached = semantic_cache.lookup(user_message, semantic_scope) if semantic_scope else None
+    if cached:
+        cached_reply, similarity = cached
+        return reply_without_model(topic_key, user_message, cached_reply, trace, 'chat_semantic_cache',
+                                   {'emotions_detected': detected_emotions, 'cached': True,
+                                    'similarity': round(similarity, 3)}, session)
+    
+    # Sinh phản hồi ở luồng riêng, event được lưu vào buffer để client kết nối lại vẫn nhận tiếp
+    buffer = stream_registry.create()
+    
+    def produce():
+        try:
+            run_chat_turn(topic_key, user_message, detected_emotions, optimization_hint,
+                          buffer.append, request_start,
+                          should_cancel=lambda: buffer.detached_for() > STREAM_CANCEL_GRACE,
+                          trace=trace, semantic_scope=semantic_scope, session=session, user_info=user_info)
+        finally:
+            buffer.close()
+    
+    threading.Thread(target=produce, name=f"chat-stream-{buffer.stream_id[:8]}", daemon=True).start()
+    return buffer
+
 @app.route('/chat', methods=['POST'])
 @app.route('/api/chat', methods=['POST'])
 def api_chat():
     """API chat với emotion detection và response optimization"""
     global chat_session
+    request_start = time.time()  # TTFB tính từ lúc nhận request
     
     try:
         # Kiểm tra request data
@@ -1106,99 +1951,229 @@ def api_chat():
         topic_key = data.get('topic_key', '').strip()
         
         print(f"Received: message='{user_message}', topic_key='{topic_key}'")  # Debug log
+        summary_scheduler.record_request()
         
-        if not user_message:
-            return jsonify({'error': 'Tin nhắn không được để trống'}), 400
-            
-        if not topic_key:
-            return jsonify({'error': 'Chủ đề không được để trống'}), 400
+        input_error = validate_chat_input(user_message, topic_key)
+        if input_error:
+            return jsonify({'error': input_error}), 400
         
-        if topic_key not in TOPICS:
-            return jsonify({'error': f'Chủ đề không hợp lệ: {topic_key}'}), 400
+        return sse_response(start_chat_turn(topic_key, user_message, request_start))
         
-        # Phân tích cảm xúc và tối ưu phản hồi
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chat/stream/<stream_id>', methods=['GET'])
+def resume_chat_stream(stream_id):
+    """Kết nối lại một stream đang chạy/vừa xong, gửi tiếp từ sau Last-Event-ID (không gọi lại model)"""
+    buffer = stream_registry.get(stream_id)
+    if buffer is None:
+        return jsonify({'error': 'Stream không tồn tại hoặc đã hết hạn'}), 404
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id', '0')
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        return jsonify({'error': f'Last-Event-ID không hợp lệ: {last_event_id}'}), 400
+    
+    return sse_response(buffer, last_event_id)
+
+# Azure TTS cho WebSocket, khởi tạo khi cần (đọc key từ biến môi trường)
+AUDIO_FRAME_SIZE = 32 * 1024  # Kích thước mỗi frame âm thanh nhị phân gửi qua WebSocket
+tts_service = None
+
+def get_tts_service():
+    """Lấy Azure TTS service (None nếu chưa cấu hình AZURE_SPEECH_KEY/AZURE_SPEECH_REGION)"""
+    global tts_service
+    if tts_service is None:
+        speech_key = os.getenv('AZURE_SPEECH_KEY')
+        speech_region = os.getenv('AZURE_SPEECH_REGION')
+        if not speech_key or not speech_region:
+            return None
+        tts_service = AzureTTSService(speech_key, speech_region)
+    return tts_service
+
+def ws_chat(ws):
+    """
+    WebSocket chat: một kết nối cho nhiều tin nhắn, typing ping và âm thanh TTS
+    
+    Client gửi JSON:
+        {"type": "message", "request_id": ..., "message": ..., "topic_key": ...}
+        {"type": "typing", "topic_key": ...}
+        {"type": "resume", "request_id": ..., "stream_id": ..., "last_event_id": ...}
+        {"type": "tts", "request_id": ..., "text": ...}
+    Server gửi JSON {"type": "event", "request_id", "stream_id", "event_id", "data"} với data giống
+    event SSE; âm thanh gồm header {"type": "audio", ...} rồi các frame nhị phân, kết thúc bằng
+    {"type": "audio_end", ...}. Nhiều lượt có thể chạy song song, phân biệt bằng request_id.
+    """
+    send_lock = threading.Lock()
+    
+    def send(frame):
+        with send_lock:
+            ws.send(frame)
+    
+    def send_error(request_id, error):
+        send(json.dumps({'type': 'error', 'request_id': request_id, 'error': error}))
+    
+    def forward_events(request_id, buffer, last_event_id=0):
+        """Chuyển event từ buffer sang WebSocket (data đã mã hóa JSON, không mã hóa lại)"""
+        events = buffer.read(last_event_id)
         try:
-            detected_emotions, optimization_hint = detect_emotion_and_optimize_response(user_message)
+            for event in events:
+                if event is None:
+                    continue
+                event_id, data = event
+                send(f'{{"type": "event", "request_id": {json.dumps(request_id)}, '
+                     f'"stream_id": "{buffer.stream_id}", "event_id": {event_id}, "data": {data}}}')
         except Exception as e:
-            print(f"Lỗi phân tích cảm xúc: {e}")
-            detected_emotions, optimization_hint = [], ""
+            print(f"WebSocket ngắt khi đang gửi stream {buffer.stream_id}: {e}")
+        finally:
+            events.close()
+    
+    def send_tts_audio(request_id, text):
+        """Tổng hợp giọng nói và gửi âm thanh theo từng frame nhị phân"""
+        service = get_tts_service()
+        if service is None:
+            send_error(request_id, 'TTS chưa được cấu hình')
+            return
+        audio_bytes, metadata, success = service.text_to_speech_stream(text)
+        if not success:
+            send_error(request_id, 'Lỗi tổng hợp giọng nói')
+            return
+        send(json.dumps({'type': 'audio', 'request_id': request_id, 'format': 'wav', 'bytes': len(audio_bytes)}))
+        for offset in range(0, len(audio_bytes), AUDIO_FRAME_SIZE):
+            send(audio_bytes[offset:offset + AUDIO_FRAME_SIZE])
+        send(json.dumps({'type': 'audio_end', 'request_id': request_id}))
+    
+    def frame_text(frame, key):
+        """Trường chuỗi của frame đã strip ('' nếu thiếu); báo ValueError nếu sai kiểu"""
+        value = frame.get(key)
+        if value is None:
+            return ''
+        if not isinstance(value, str):
+            raise ValueError(f'Trường {key} phải là chuỗi')
+        return value.strip()
+    
+    def handle_frame(frame):
+        """Xử lý một frame; frame lỗi chỉ trả lỗi cho request đó, không đóng kết nối"""
+        frame_type = frame.get('type')
+        request_id = frame.get('request_id')
         
-        # Khởi tạo chat session nếu chưa có hoặc đổi chủ đề
-        try:
-            if chat_session is None or current_topic != topic_key:
-                restore_chat_session_with_summary(topic_key)
-        except Exception as e:
-            print(f"Lỗi khởi tạo session: {e}")
-            init_chat_session(topic_key)
+        if frame_type == 'message':
+            user_message = frame_text(frame, 'message')
+            topic_key = frame_text(frame, 'topic_key')
+            summary_scheduler.record_request()
+            input_error = validate_chat_input(user_message, topic_key)
+            if input_error:
+                send_error(request_id, input_error)
+                return
+            buffer = start_chat_turn(topic_key, user_message, time.time())
+            threading.Thread(target=forward_events, args=(request_id, buffer), daemon=True).start()
         
-        # Thêm optimization hint vào message nếu có
-        enhanced_message = user_message
-        if optimization_hint:
-            enhanced_message = f"{optimization_hint}\n\nTin nhắn từ người dùng: {user_message}"
+        elif frame_type == 'typing':
+            topic_key = frame_text(frame, 'topic_key')
+            if SPECULATIVE_ENABLED and topic_key in TOPICS:
+                speculative_engine.on_typing(topic_key)
         
-        def generate():
+        elif frame_type == 'resume':
+            # Kiểm tra last_event_id như endpoint SSE /api/chat/stream/<stream_id>
+            last_event_id = frame.get('last_event_id') or 0
             try:
-                # Kiểm tra chat_session tồn tại
-                if chat_session is None:
-                    yield f"data: {json.dumps({'error': 'Chat session chưa được khởi tạo'})}\n\n"
-                    return
-                
-                # Thử streaming trước
-                try:
-                    stream = chat_session.send_message(enhanced_message, stream=True)
-                    
-                    bot_response = ""
-                    for chunk in stream:
-                        if chunk.text:
-                            # Lọc bỏ optimization hint trong response (nếu có)
-                            clean_text = chunk.text
-                            if optimization_hint and any(hint_word in clean_text for hint_word_list in [
-                                ["PHÁT HIỆN CẢM XỨC", "ÁP DỤNG CHIẾN LƯỢC", "TRÁNH:"]
-                            ] for hint_word in hint_word_list):
-                                # Bỏ qua chunk này nếu chứa optimization hint
-                                continue
-                            
-                            # Làm sạch text trước khi gửi
-                            clean_text = clean_response_text(clean_text)
-                            
-                            bot_response += clean_text
-                            yield f"data: {json.dumps({'text': clean_text})}\n\n"
-                    
-                except Exception as stream_error:
-                    print(f"Streaming failed, fallback to non-streaming: {stream_error}")
-                    # Fallback: non-streaming response
-                    response = chat_session.send_message(enhanced_message, stream=False)
-                    bot_response = clean_response_text(response.text)
-                    yield f"data: {json.dumps({'text': bot_response})}\n\n"
-                
-                # Lưu vào lịch sử (chỉ lưu message gốc, không lưu optimization hint)
-                try:
-                    add_message_to_history(topic_key, user_message, bot_response)
-                except Exception as save_error:
-                    print(f"Lỗi lưu lịch sử: {save_error}")
-                
-                yield f"data: {json.dumps({'done': True, 'emotions_detected': detected_emotions})}\n\n"
-                
-            except Exception as e:
-                print(f"Lỗi trong generate(): {e}")
-                yield f"data: {json.dumps({'error': f'Lỗi xử lý: {str(e)}'})}\n\n"
+                last_event_id = int(last_event_id)
+            except (TypeError, ValueError):
+                send_error(request_id, f'last_event_id không hợp lệ: {last_event_id}')
+                return
+            buffer = stream_registry.get(frame_text(frame, 'stream_id'))
+            if buffer is None:
+                send_error(request_id, 'Stream không tồn tại hoặc đã hết hạn')
+                return
+            threading.Thread(target=forward_events, args=(request_id, buffer, last_event_id),
+                             daemon=True).start()
         
-        return Response(generate(), mimetype='text/plain', headers={
-            'Content-Type': 'text/event-stream',
-            'Cache-Control': 'no-cache',
-            'Connection': 'keep-alive'
-        })
+        elif frame_type == 'tts':
+            text = frame_text(frame, 'text')
+            if not text:
+                send_error(request_id, 'Không có nội dung để đọc')
+                return
+            threading.Thread(target=send_tts_audio, args=(request_id, text), daemon=True).start()
         
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        else:
+            send_error(request_id, f'Loại frame không hỗ trợ: {frame_type}')
+    
+    while True:
+        raw_frame = ws.receive()
+        if raw_frame is None:
+            break
+        
+        try:
+            frame = json.loads(raw_frame)
+        except (TypeError, ValueError):
+            send_error(None, 'Frame không phải JSON hợp lệ')
+            continue
+        if not isinstance(frame, dict):
+            send_error(None, 'Frame phải là JSON object')
+            continue
+        
+        try:
+            handle_frame(frame)
+        except ValueError as e:
+            send_error(frame.get('request_id'), str(e))
+        except Exception as e:
+            print(f"Lỗi xử lý frame WebSocket: {e}")
+            send_error(frame.get('request_id'), str(e))
+
+if sock is not None:
+    sock.route('/ws/chat')(ws_chat)
+
+@app.route('/api/typing', methods=['POST'])
+def typing_ping():
+    """Tín hiệu người dùng đang gõ: làm nóng session của chủ đề trong nền"""
+    if not SPECULATIVE_ENABLED:
+        return jsonify({'success': True, 'warming': False})
+    
+    data = request.get_json(silent=True) or {}
+    topic_key = data.get('topic_key', '').strip()
+    if topic_key not in TOPICS:
+        return jsonify({'error': f'Chủ đề không hợp lệ: {topic_key}'}), 400
+    
+    return jsonify({'success': True, 'warming': speculative_engine.on_typing(topic_key)})
+
+@app.route('/api/speculative_stats', methods=['GET'])
+def speculative_stats():
+    """Thống kê typing ping, làm nóng session và trả lời mẫu"""
+    return jsonify(speculative_engine.get_stats())
+
+@app.route('/api/token_usage', methods=['GET'])
+def token_usage():
+    """Số token và chi phí ước tính theo người dùng, chủ đề và model (cửa sổ trượt, mặc định 24 giờ)"""
+    window = request.args.get('window', 86400, type=float)
+    return jsonify({
+        'usage': metrics_collector.get_token_usage_summary(window),
+        'estimator': default_estimator.get_stats()
+    })
+
+@app.route('/api/llm_provider', methods=['GET'])
+def llm_provider_stats():
+    """Backend LLM đang dùng và số liệu của nó (với model giả: số lần gọi, lỗi được tiêm, cấu hình độ trễ)"""
+    return jsonify(llm_provider.get_stats())
+
+@app.route('/api/prompt_variants', methods=['GET'])
+def prompt_variants():
+    """Các biến thể system prompt, biến thể đang dùng và số token đo được mỗi lần build"""
+    return jsonify({'active': PROMPT_VARIANT, 'variants': prompt_registry.get_stats()})
+
+@app.route('/api/semantic_cache', methods=['GET'])
+def semantic_cache_stats():
+    """Thống kê cache ngữ nghĩa và nhật ký các lần dùng lại câu trả lời (câu hỏi, câu đã khớp, độ tương đồng)"""
+    return jsonify({
+        'stats': semantic_cache.get_stats(),
+        'audit_trail': semantic_cache.get_audit_trail(request.args.get('limit', 50, type=int))
+    })
 
 @app.route('/api/reset_session', methods=['POST'])
 def reset_session():
     """Reset chat session"""
-    global chat_session, current_topic
     try:
-        chat_session = None
-        current_topic = None
+        activate_session(None, None)
         return jsonify({'success': True, 'message': 'Chat session đã được reset'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1211,12 +2186,13 @@ def clear_topic(topic_key):
     
     try:
         clear_topic_files(topic_key)
+        # Câu trả lời đã cache của chủ đề dựa trên lịch sử vừa xóa
+        semantic_cache.clear_prefix(semantic_scope_prefix(topic_key))
         
         # Reset session nếu đang chat chủ đề này
-        global chat_session, current_topic
-        if current_topic == topic_key:
-            chat_session = None
-            current_topic = None
+        with session_lock:
+            if get_active_session(topic_key) is not None:
+                activate_session(None, None)
         
         return jsonify({'success': True, 'message': f'Đã xóa lịch sử chủ đề {TOPICS[topic_key]["name"]}'})
     except Exception as e:
@@ -1227,11 +2203,10 @@ def clear_all_topics():
     """Xóa lịch sử tất cả chủ đề"""
     try:
         clear_all_topic_files()
+        semantic_cache.clear()
         
         # Reset session
-        global chat_session, current_topic
-        chat_session = None
-        current_topic = None
+        activate_session(None, None)
         
         return jsonify({'success': True, 'message': 'Đã xóa lịch sử tất cả chủ đề'})
     except Exception as e:
@@ -1320,6 +2295,30 @@ def emotion_stats(topic_key):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/model_routes', methods=['GET'])
+def model_routes():
+    """Thống kê model, concurrency và độ trễ theo từng route"""
+    return jsonify(model_router.get_stats())
+
+@app.route('/api/scheduler_status', methods=['GET'])
+def scheduler_status():
+    """Trạng thái scheduler tóm tắt nền"""
+    return jsonify(summary_scheduler.get_status())
+
+@app.route('/api/stream_metrics', methods=['GET'])
+def stream_metrics():
+    """Số liệu streaming: TTFB, số chunk từ Gemini và số event SSE mỗi phản hồi"""
+    return jsonify({
+        'summary': metrics_collector.get_stream_summary(),
+        'coalesce_config': STREAM_COALESCE_CONFIG,
+        'hedging': chat_streamer.get_stats()
+    })
+
+@app.route('/api/latency_metrics', methods=['GET'])
+def latency_metrics():
+    """Phân vị p50/p95/p99 (ms) của từng giai đoạn request chat: cảm xúc, khôi phục session, build prompt, chunk đầu, stream, lưu lịch sử"""
+    return jsonify(metrics_collector.get_latency_histograms(request.args.get('name')))
+
 @app.route('/api/user_info', methods=['GET'])
 def get_user_info():
     """Xem thông tin người dùng hiện tại"""
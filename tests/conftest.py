@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHAT_REPLY = "Dạ, cháu nghe bác kể mà thấy vui lắm ạ. Bác nhớ giữ gìn sức khỏe nhé."
+
+
+def wait_for(condition, timeout=2.0):
+    """Poll condition until it is true; False if timeout passes first"""
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class FakeClock:
+    """Manually advanced time source for components that take a clock argument"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def chatbot_app(tmp_path, monkeypatch):
+    """chatbot module with topic files in tmp_path, a fresh session and an offline fake model"""
+    chatbot = pytest.importorskip('chatbot')
+    from utils.llm_provider import FakeLLMConfig, FakeProvider
+    from utils.model_router import TASK_CHAT, ModelRouter
+
+    provider = FakeProvider(FakeLLMConfig(ttft_distribution='fixed', ttft_median=0.0, tokens_per_second=1e6,
+                                          chunk_pattern='sentence', responder=lambda prompt: CHAT_REPLY))
+    router = ModelRouter(provider=provider, breaker_config=chatbot.CIRCUIT_BREAKER_CONFIG)
+    monkeypatch.setattr(chatbot, 'llm_provider', provider)
+    monkeypatch.setattr(chatbot, 'model_router', router)
+    monkeypatch.setattr(chatbot, 'model', router.get_model(TASK_CHAT))
+    monkeypatch.setattr(chatbot, 'chat_session', None)
+    monkeypatch.setattr(chatbot, 'current_topic', None)
+    monkeypatch.setattr(chatbot, 'summary_prompt_cache', {})
+    monkeypatch.setattr(chatbot, 'SUMMARY_SCHEDULER_ENABLED', False)
+    monkeypatch.setattr(chatbot, 'TOPICS_DIR', str(tmp_path / 'topics'))
+    monkeypatch.setattr(chatbot, 'USER_INFO_FILE', str(tmp_path / 'user_info.json'))
+    with open(chatbot.USER_INFO_FILE, 'w', encoding='utf-8') as f:
+        f.write('{"name": "Bác An", "call_style": "bác"}')
+    chatbot.ensure_topic_folders()
+    return chatbot
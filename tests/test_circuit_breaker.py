@@ -0,0 +1,208 @@
+import asyncio
+
+import pytest
+
+from utils.circuit_breaker import (CircuitBreaker, CircuitOpenError, STATE_CLOSED, STATE_HALF_OPEN,
+                                   STATE_OPEN)
+from utils.llm_provider import FakeLLMConfig, FakeProvider
+from utils.llm_service import LLMService
+from utils.model_router import TASK_CHAT
+
+
+def make_breaker(clock, **overrides):
+    config = dict(failure_rate_threshold=0.5, window_seconds=60, min_calls=4, open_seconds=30,
+                  half_open_max_calls=1, clock=clock)
+    config.update(overrides)
+    return CircuitBreaker('test', **config)
+
+
+def call(breaker, success):
+    breaker.before_call()
+    if success:
+        breaker.record_success(0.1)
+    else:
+        breaker.record_failure()
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = make_breaker(clock)
+    for _ in range(3):
+        call(breaker, False)
+    assert breaker.state == STATE_CLOSED
+
+
+def test_opens_at_failure_rate_threshold(clock):
+    breaker = make_breaker(clock)
+    call(breaker, True)
+    call(breaker, True)
+    call(breaker, False)
+    assert breaker.state == STATE_CLOSED
+    call(breaker, False)  # 2 of 4 failed = 0.5
+    assert breaker.state == STATE_OPEN
+
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == pytest.approx(30)
+    assert breaker.get_stats()['rejected'] == 1
+
+
+def test_old_results_leave_the_window(clock):
+    breaker = make_breaker(clock)
+    for _ in range(3):
+        call(breaker, False)
+    clock.advance(61)
+    call(breaker, False)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.get_stats()['window_calls'] == 1
+
+
+def open_breaker(breaker):
+    for _ in range(4):
+        call(breaker, False)
+    assert breaker.state == STATE_OPEN
+
+
+def test_successful_probe_closes(clock):
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    clock.advance(29)
+    assert breaker.state == STATE_OPEN
+    clock.advance(1)
+    assert breaker.state == STATE_HALF_OPEN
+
+    breaker.before_call()
+    breaker.record_success(0.2)
+    assert breaker.state == STATE_CLOSED
+    # Failures from before the circuit opened no longer count
+    call(breaker, False)
+    assert breaker.state == STATE_CLOSED
+
+
+def test_failed_probe_reopens(clock):
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    clock.advance(30)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.get_stats()['times_opened'] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.advance(30)
+    assert breaker.state == STATE_HALF_OPEN
+
+
+def test_probe_slots_are_limited_and_released(clock):
+    breaker = make_breaker(clock, half_open_max_calls=2)
+    open_breaker(breaker)
+    clock.advance(30)
+
+    breaker.before_call()
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # A finished probe frees its slot (a success closes the circuit entirely)
+    breaker.record_success(0.1)
+    assert breaker.state == STATE_CLOSED
+    breaker.before_call()
+
+
+def test_probe_slot_released_after_failed_probe(clock):
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    clock.advance(30)
+    breaker.before_call()
+    breaker.record_failure()
+    clock.advance(30)
+    # New half-open period: the slot of the failed probe is free again
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_timeout_uses_default_until_enough_samples(clock):
+    breaker = make_breaker(clock, default_timeout=15)
+    for _ in range(19):
+        breaker.record_success(1.0)
+    assert breaker.get_timeout() == 15
+    breaker.record_success(1.0)
+    assert breaker.get_timeout() == pytest.approx(2.0)  # p99 1.0s x multiplier 2
+
+
+@pytest.mark.parametrize('latency, expected', [(0.1, 2.0), (5.0, 10.0), (100.0, 60.0)])
+def test_timeout_is_clamped(clock, latency, expected):
+    breaker = make_breaker(clock, min_timeout=2.0, max_timeout=60.0, timeout_multiplier=2.0)
+    for _ in range(50):
+        breaker.record_success(latency)
+    assert breaker.get_timeout() == pytest.approx(expected)
+
+
+def test_timeout_follows_the_quantile(clock):
+    breaker = make_breaker(clock, timeout_quantile=0.99, timeout_multiplier=1.0, min_timeout=0.0)
+    for index in range(100):
+        breaker.record_success(1.0 if index < 98 else 8.0)
+    assert breaker.get_timeout() == pytest.approx(8.0)
+
+
+def test_release_frees_the_probe_slot_without_a_result(clock):
+    breaker = make_breaker(clock)
+    open_breaker(breaker)
+    clock.advance(30)
+    breaker.before_call()
+    breaker.release()
+    assert breaker.state == STATE_HALF_OPEN
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def make_service(**config):
+    config = dict(dict(ttft_distribution='fixed', ttft_median=0.0, tokens_per_second=1e6,
+                       chunk_pattern='fixed', chunk_tokens=(2, 2)), **config)
+    return LLMService(api_key=None, model_name='fake-chat', provider=FakeProvider(FakeLLMConfig(**config)))
+
+
+def test_streams_closed_early_keep_the_circuit_closed():
+    service = make_service()
+    for index in range(10):
+        stream = service.generate_stream(f"Câu hỏi {index}")
+        next(stream)
+        stream.close()
+
+    stats = service.get_route_stats()[TASK_CHAT]
+    assert stats['errors'] == 0
+    assert stats['cancelled'] == 10
+    assert stats['in_flight'] == 0
+    assert stats['circuit']['state'] == STATE_CLOSED
+    assert stats['circuit']['failure_rate'] == 0.0
+    # The route still serves calls
+    assert next(service.generate_stream("Còn nữa không?"))
+
+
+def test_async_streams_closed_early_keep_the_circuit_closed():
+    service = make_service()
+
+    async def main():
+        for index in range(10):
+            stream = service.astream(f"Câu hỏi {index}")
+            await stream.__anext__()
+            await stream.aclose()
+
+    asyncio.run(main())
+    stats = service.get_route_stats()[TASK_CHAT]
+    assert stats['errors'] == 0
+    assert stats['cancelled'] == 10
+    assert stats['circuit']['state'] == STATE_CLOSED
+
+
+def test_provider_errors_still_open_the_circuit():
+    service = make_service(error_rate=1.0, error_kinds=('unavailable',))
+    for index in range(5):
+        with pytest.raises(Exception):
+            list(service.generate_stream(f"Câu hỏi {index}"))
+
+    stats = service.get_route_stats()[TASK_CHAT]
+    assert stats['errors'] == 5
+    assert stats['cancelled'] == 0
+    assert stats['circuit']['state'] == STATE_OPEN
@@ -0,0 +1,157 @@
+import gzip
+import json
+import zlib
+
+import pytest
+
+from utils import compression
+from utils.compression import StreamCompressor, compress_stream, negotiate_encoding
+
+needs_brotli = pytest.mark.skipif(compression.brotli is None, reason="brotli not installed")
+
+
+@needs_brotli
+@pytest.mark.parametrize('header, expected', [
+    ("gzip, deflate, br", 'br'),
+    ("br;q=0, gzip", 'gzip'),
+    ("gzip;q=0.5, br;q=0.1", 'br'),
+    ("*", 'br'),
+    ("identity", None),
+    ("br;q=0, gzip;q=0", None),
+    ("", None),
+    (None, None),
+])
+def test_negotiation_prefers_brotli_then_gzip(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+def test_gzip_is_used_when_brotli_is_missing(monkeypatch):
+    monkeypatch.setattr(compression, 'SUPPORTED_ENCODINGS', ('gzip',))
+    assert negotiate_encoding("br, gzip") == 'gzip'
+    assert negotiate_encoding("br") is None
+
+
+def test_streamed_pieces_are_decodable_after_each_flush():
+    compressor = StreamCompressor('gzip')
+    decoder = zlib.decompressobj(31)
+    for piece in ["id: 1\ndata: {}\n\n", "id: 2\ndata: {\"text\": \"Dạ\"}\n\n"]:
+        assert decoder.decompress(compressor.compress(piece.encode('utf-8'))).decode('utf-8') == piece
+    assert decoder.decompress(compressor.finish()) == b''
+    assert decoder.eof
+
+
+def test_compress_stream_closes_its_source():
+    closed = []
+
+    def pieces():
+        try:
+            yield "a"
+            yield "b"
+        finally:
+            closed.append(True)
+
+    assert gzip.decompress(b''.join(compress_stream(pieces(), 'gzip'))) == b"ab"
+    assert closed == [True]
+
+
+def decode(response):
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'br':
+        return compression.brotli.decompress(response.data)
+    if encoding == 'gzip':
+        return gzip.decompress(response.data)
+    return response.data
+
+
+def write_history(chatbot, topic_key, count):
+    chatbot.save_chat_history(topic_key, [{'user': f"Bác kể chuyện số {index}", 'bot': "Dạ, cháu nghe ạ."}
+                                          for index in range(count)])
+
+
+@needs_brotli
+@pytest.mark.parametrize('accept, expected', [("gzip, br", 'br'), ("gzip", 'gzip'), ("identity", None)])
+def test_large_json_is_compressed_by_preference(chatbot_app, accept, expected):
+    chatbot = chatbot_app
+    write_history(chatbot, 'gia_dinh', 40)
+    response = chatbot.app.test_client().get('/api/export_topic/gia_dinh', headers={'Accept-Encoding': accept})
+
+    assert response.headers.get('Content-Encoding') == expected
+    assert 'Accept-Encoding' in response.headers['Vary']
+    body = json.loads(decode(response))
+    assert len(body['current_messages']) == 40
+    if expected:
+        assert len(response.data) < len(json.dumps(body))
+
+
+def test_chat_page_with_history_is_compressed(chatbot_app):
+    chatbot = chatbot_app
+    write_history(chatbot, 'gia_dinh', 200)
+    response = chatbot.app.test_client().get('/chat/gia_dinh', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.mimetype == 'text/html'
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    page = decode(response).decode('utf-8')
+    assert page.count('class="message-content"') >= 200
+    assert len(response.data) < len(page.encode('utf-8'))
+
+
+def test_small_json_is_not_compressed(chatbot_app):
+    chatbot = chatbot_app
+    response = chatbot.app.test_client().get('/api/user_info', headers={'Accept-Encoding': 'gzip'})
+    assert len(response.data) < chatbot.COMPRESSION_CONFIG['min_bytes']
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.get_json()['user_info']['name'] == "Bác An"
+
+
+def test_compression_can_be_disabled(chatbot_app, monkeypatch):
+    chatbot = chatbot_app
+    monkeypatch.setitem(chatbot.COMPRESSION_CONFIG, 'enabled', False)
+    write_history(chatbot, 'gia_dinh', 40)
+    response = chatbot.app.test_client().get('/api/export_topic/gia_dinh', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_already_encoded_responses_are_left_alone(chatbot_app):
+    chatbot = chatbot_app
+    body = json.dumps({'data': 'x' * 5000}).encode('utf-8')
+    with chatbot.app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+        response = chatbot.app.response_class(body, mimetype='application/json',
+                                              headers={'Content-Encoding': 'identity'})
+        response = chatbot.compress_response(response)
+    assert response.headers['Content-Encoding'] == 'identity'
+    assert response.get_data() == body
+
+
+def chat(chatbot, accept=None):
+    headers = {'Accept-Encoding': accept} if accept else {}
+    payload = {'message': "Hôm nay bác đi chợ", 'topic_key': 'gia_dinh'}
+    return chatbot.app.test_client().post('/api/chat', json=payload, headers=headers)
+
+
+def sse_events(text):
+    return [json.loads(line[len('data: '):]) for line in text.splitlines() if line.startswith('data: ')]
+
+
+@pytest.mark.parametrize('accept', [
+    pytest.param("br, gzip", marks=needs_brotli),
+    "gzip",
+])
+def test_sse_stream_is_compressed(chatbot_app, accept):
+    chatbot = chatbot_app
+    response = chat(chatbot, accept)
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Content-Encoding'] == negotiate_encoding(accept)
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+    events = sse_events(decode(response).decode('utf-8'))
+    assert ''.join(event.get('text', '') for event in events).strip()
+    assert events[-1]['done']
+
+
+def test_sse_stream_without_accept_encoding_is_plain(chatbot_app):
+    response = chat(chatbot_app)
+    assert 'Content-Encoding' not in response.headers
+    events = sse_events(response.get_data(as_text=True))
+    assert events[-1]['done']
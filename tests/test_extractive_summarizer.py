@@ -0,0 +1,75 @@
+import json
+import os
+
+from utils.extractive_summarizer import ExtractiveSummarizer, benchmark_fact_recall, conversation_tokens
+from utils.token_counter import estimate_tokens
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks',
+                        'summary_fixtures.json')
+
+FILLER = ["Dạ vâng ạ, cháu hiểu rồi.", "Bác có muốn chia sẻ gì thêm với cháu không?"]
+NEUTRAL = ["Trời hôm nay có nắng nhẹ.", "Đường làng giờ đã rộng hơn trước."]
+EMOTION = "Bác thấy cô đơn khi con đi làm xa."
+HEALTH = "Bác nhớ uống thuốc huyết áp đều đặn."
+
+
+def make_bot_turn():
+    return ' '.join([FILLER[0], NEUTRAL[0], EMOTION, NEUTRAL[1], HEALTH, FILLER[1]])
+
+
+def test_empty_batch():
+    assert ExtractiveSummarizer().compress_conversations([]) == []
+
+
+def test_emotion_and_health_sentences_are_kept():
+    summarizer = ExtractiveSummarizer(max_sentences=2)
+    [compressed] = summarizer.compress_conversations([{'user': "Chào cháu.", 'bot': make_bot_turn()}])
+    assert compressed['bot'] == f"{EMOTION} {HEALTH}"
+    assert compressed['user'] == "Chào cháu."
+
+
+def test_filler_is_dropped():
+    summarizer = ExtractiveSummarizer(keep_ratio=1.0, max_sentences=10)
+    [compressed] = summarizer.compress_conversations([{'user': "Chào cháu.", 'bot': make_bot_turn()}])
+    for sentence in FILLER:
+        assert sentence not in compressed['bot']
+    assert EMOTION in compressed['bot'] and HEALTH in compressed['bot']
+
+
+def test_turn_of_only_filler_becomes_empty():
+    [compressed] = ExtractiveSummarizer().compress_conversations([{'user': "Chào cháu.", 'bot': ' '.join(FILLER)}])
+    assert compressed['bot'] == ''
+
+
+def test_filler_with_a_name_or_number_is_kept():
+    bot = "Dạ vâng, cháu nhớ rồi: thứ Bảy này con Lan về thăm bác. Bác có muốn chia sẻ gì thêm với cháu không?"
+    [compressed] = ExtractiveSummarizer().compress_conversations([{'user': "Ừ.", 'bot': bot}])
+    assert 'con Lan về thăm bác' in compressed['bot']
+
+
+def test_output_respects_the_size_limits():
+    summarizer = ExtractiveSummarizer(keep_ratio=0.4, max_sentences=3, user_max_tokens=40)
+    story = [f"Hồi năm {1960 + index} bác còn ở làng Phú Xuyên, ngày nào cũng ra đồng." for index in range(8)]
+    long_user = ' '.join(story + [EMOTION])
+    assert estimate_tokens(long_user) > summarizer.user_max_tokens
+    conversations = [{'user': long_user, 'bot': make_bot_turn() * 3, 'emotions_detected': ['buồn']},
+                     {'user': "Chào cháu.", 'bot': make_bot_turn()}]
+    compressed = summarizer.compress_conversations(conversations)
+
+    for result in compressed:
+        assert len(summarizer.split_sentences(result['bot'])) <= summarizer.max_sentences
+    # Long user turns are compressed like bot turns, short ones are kept as they are
+    assert len(summarizer.split_sentences(compressed[0]['user'])) <= summarizer.max_sentences
+    assert compressed[1]['user'] == "Chào cháu."
+    assert conversation_tokens(compressed) < conversation_tokens(conversations)
+    # Other fields are kept and the input is not modified
+    assert compressed[0]['emotions_detected'] == ['buồn']
+    assert conversations[0]['user'] == long_user
+
+
+def test_fixture_facts_survive_compression():
+    with open(FIXTURES, encoding='utf-8') as f:
+        fixtures = json.load(f)
+    result = benchmark_fact_recall(ExtractiveSummarizer(), fixtures)
+    assert result['fact_recall'] == 1.0
+    assert result['tokens_after'] < result['tokens_before']
@@ -0,0 +1,116 @@
+import threading
+import time
+
+from google.api_core import exceptions as api_exceptions
+
+from utils.llm_provider import FakeLLMConfig, FakeProvider
+from utils.llm_service import LLMService
+from utils.metrics import MetricsCollector
+from utils.model_router import TASK_CHAT
+
+PROMPTS = [f"Câu hỏi số {index}" for index in range(12)]
+
+
+class Responder:
+    """Echoes the prompt; can fail some prompts and tracks how many calls run at once"""
+
+    def __init__(self, fail_times=None, delay=0.0):
+        self.fail_times = dict(fail_times or {})
+        self.delay = delay
+        self.calls = {}
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        key = next(text for text in PROMPTS[::-1] if text in prompt)
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            attempt = self.calls[key]
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self._lock:
+                self.running -= 1
+        if attempt <= self.fail_times.get(key, 0):
+            raise api_exceptions.ServiceUnavailable(f"Fake outage for {key}")
+        return f"Trả lời cho {key}."
+
+
+def make_service(responder, metrics=None, **config):
+    config = dict(dict(ttft_distribution='uniform', ttft_median=0.01, ttft_spread=1.0, tokens_per_second=1e6,
+                       responder=responder), **config)
+    return LLMService(api_key=None, model_name='fake-chat', provider=FakeProvider(FakeLLMConfig(**config)),
+                      metrics=metrics)
+
+
+def test_results_follow_input_order():
+    responder = Responder()
+    service = make_service(responder)
+    progress = []
+    results = service.generate_batch(PROMPTS, concurrency=4,
+                                     progress_callback=lambda done, total, result: progress.append((done, total)))
+
+    assert [result.index for result in results] == list(range(len(PROMPTS)))
+    assert [result.prompt for result in results] == PROMPTS
+    assert [result.text for result in results] == [f"Trả lời cho {prompt}." for prompt in PROMPTS]
+    assert all(result.success and result.attempts == 1 for result in results)
+    assert progress == [(done, len(PROMPTS)) for done in range(1, len(PROMPTS) + 1)]
+
+
+def test_transient_errors_are_retried():
+    responder = Responder(fail_times={PROMPTS[1]: 1, PROMPTS[4]: 2})
+    service = make_service(responder)
+    results = service.generate_batch(PROMPTS[:6], concurrency=3, max_retries=2)
+
+    assert all(result.success for result in results)
+    assert results[1].attempts == 2
+    assert results[4].attempts == 3
+    assert results[4].error is None
+    assert results[0].attempts == 1
+
+
+def test_concurrency_is_capped():
+    responder = Responder(delay=0.02)
+    service = make_service(responder)
+    results = service.generate_batch(PROMPTS, concurrency=3)
+
+    assert all(result.success for result in results)
+    assert responder.peak == 3
+    assert service.get_route_stats()[TASK_CHAT]['in_flight'] == 0
+
+
+def test_failures_are_returned_not_raised():
+    responder = Responder(fail_times={PROMPTS[2]: 99, PROMPTS[5]: 99})
+    service = make_service(responder)
+    results = service.generate_batch(PROMPTS[:8], concurrency=4, max_retries=1)
+
+    failed = [result.index for result in results if not result.success]
+    assert failed == [2, 5]
+    for index in failed:
+        assert results[index].attempts == 2
+        assert results[index].text == ""
+        assert 'Fake outage' in results[index].error
+    assert all(result.text for result in results if result.success)
+
+
+def test_tokens_of_successful_calls_are_accounted():
+    metrics = MetricsCollector(save_to_file=False, log_metrics=False)
+    responder = Responder(fail_times={PROMPTS[3]: 99})
+    service = make_service(responder, metrics=metrics)
+    results = service.generate_batch(PROMPTS[:6], concurrency=2, max_retries=0)
+
+    succeeded = [result for result in results if result.success]
+    assert len(succeeded) == 5
+    for result in succeeded:
+        assert result.usage_info['input_tokens'] > 0
+        assert result.usage_info['output_tokens'] == len(result.text.split())
+
+    summary = metrics.get_token_usage_summary()
+    assert summary['calls'] == 5
+    assert summary['input_tokens'] == sum(result.usage_info['input_tokens'] for result in succeeded)
+    assert summary['output_tokens'] == sum(result.usage_info['output_tokens'] for result in succeeded)
+    assert summary['by_topic'][TASK_CHAT]['calls'] == 5
+    assert summary['cost'] > 0
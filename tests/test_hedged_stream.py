@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from utils.hedged_stream import HedgedStreamer
+
+
+class TrackedStream:
+    def __init__(self, chunks, delay=0.0):
+        self.chunks = list(chunks)
+        self.delay = delay
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            time.sleep(self.delay)
+            yield chunk
+
+    def close(self):
+        self.closed.set()
+
+
+def test_attempt_cancelled_while_starting_is_cancelled_upstream():
+    slow = TrackedStream(['slow'])
+    fast = TrackedStream(['a', 'b'])
+    started = []
+    release_slow = threading.Event()
+
+    def start_attempt():
+        started.append(len(started))
+        if len(started) == 1:
+            # The hedge wins while this call is still starting
+            release_slow.wait(2)
+            return slow
+        return fast
+
+    cancelled = []
+    streamer = HedgedStreamer(default_hedge_delay=0.05, min_hedge_delay=0.01,
+                              cancel_stream=cancelled.append)
+    assert list(streamer.stream(start_attempt)) == ['a', 'b']
+    release_slow.set()
+
+    assert slow.closed.wait(2)
+    assert slow in cancelled
+    stats = streamer.get_stats()
+    assert stats['calls'] == 1
+    assert stats['hedges'] == 1
+    assert stats['hedge_wins'] == 1
+
+
+def test_iterator_is_closed_when_the_caller_stops_reading():
+    closed = threading.Event()
+
+    def chunks():
+        try:
+            for index in range(1000):
+                time.sleep(0.01)
+                yield index
+        finally:
+            closed.set()
+
+    streamer = HedgedStreamer()
+    stream = streamer.stream(chunks)
+    assert next(stream) == 0
+    stream.close()
+    assert closed.wait(2)
+
+
+def test_counters_are_consistent_across_threads():
+    streamer = HedgedStreamer()
+
+    def run():
+        for _ in range(20):
+            assert list(streamer.stream(lambda: iter(['x']))) == ['x']
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = streamer.get_stats()
+    assert stats['calls'] == 160
+    assert stats['attempts'] == 160
+    assert stats['failures'] == 0
+
+
+def test_idle_timeout_yields_none_while_waiting_for_the_next_chunk():
+    streamer = HedgedStreamer(chunk_timeout=2.0)
+    stream = streamer.stream(lambda: TrackedStream(['a', 'b'], delay=0.15), idle_timeout=lambda: 0.05)
+    items = list(stream)
+    assert [item for item in items if item is not None] == ['a', 'b']
+    assert items.index('b') > items.index('a') + 1
+
+
+def test_idle_timeout_does_not_extend_the_chunk_timeout():
+    streamer = HedgedStreamer(chunk_timeout=0.2)
+    stream = streamer.stream(lambda: TrackedStream(['a', 'b'], delay=0.5), idle_timeout=lambda: 0.05)
+    with pytest.raises(TimeoutError):
+        list(stream)
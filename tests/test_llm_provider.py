@@ -0,0 +1,38 @@
+import google.generativeai as genai
+import pytest
+
+from utils.llm_provider import FakeLLMConfig, FakeProvider, LLMProvider
+
+REPLY = "Dạ cháu chào bác ạ.\nNgười dùng: toi khoe, con cam on nhe.\nBác nhớ uống nước."
+
+
+def make_model():
+    provider = FakeProvider(FakeLLMConfig(ttft_distribution='fixed', ttft_median=0.0, tokens_per_second=1e6,
+                                          responder=lambda prompt: REPLY))
+    return provider, provider.create_model('fake-model')
+
+
+def test_stop_sequence_cuts_streamed_chunks():
+    provider, model = make_model()
+    config = genai.types.GenerationConfig(stop_sequences=['\nNgười dùng:'])
+    streamed = ''.join(chunk.text for chunk in model.generate_content('Chào cháu', generation_config=config,
+                                                                      stream=True))
+    assert 'Người dùng' not in streamed
+    assert streamed.split() == "Dạ cháu chào bác ạ.".split()
+    assert provider.get_stats()['output_tokens'] == 5
+
+
+def test_stop_sequence_survives_max_output_tokens():
+    _, model = make_model()
+    # The token cap is above the cut reply but below the uncut one
+    config = genai.types.GenerationConfig(stop_sequences=['\nNgười dùng:'], max_output_tokens=10)
+    response = model.generate_content('Chào cháu', generation_config=config)
+    assert response.text == "Dạ cháu chào bác ạ."
+
+
+def test_provider_without_create_model_fails_at_construction():
+    class IncompleteProvider(LLMProvider):
+        name = 'incomplete'
+
+    with pytest.raises(TypeError, match='create_model'):
+        IncompleteProvider()
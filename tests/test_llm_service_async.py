@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.llm_provider import FakeLLMConfig, FakeProvider
+from utils.llm_service import LLMService
+from utils.model_router import TASK_CHAT, ModelRoute, ModelRouter
+
+REPLY = "Dạ cháu chào bác ạ. Hôm nay trời đẹp lắm. Bác nhớ uống đủ nước nhé."
+
+
+def make_router(max_concurrency):
+    return ModelRouter(routes={TASK_CHAT: ModelRoute('fake-chat', max_concurrency=max_concurrency)},
+                       provider=FakeProvider())
+
+
+async def hold_async(router, name, order, hold=0.0):
+    async with router.acquire_async(TASK_CHAT):
+        order.append(name)
+        await asyncio.sleep(hold)
+
+
+def test_waiters_get_the_slot_in_registration_order():
+    router = make_router(1)
+    order = []
+
+    async def main():
+        holder = asyncio.ensure_future(hold_async(router, 'holder', order, hold=0.05))
+        await asyncio.sleep(0)
+        waiters = []
+        for name in ('a', 'b', 'c'):
+            waiters.append(asyncio.ensure_future(hold_async(router, name, order)))
+            await asyncio.sleep(0)
+        await asyncio.gather(holder, *waiters)
+
+    asyncio.run(main())
+    assert order == ['holder', 'a', 'b', 'c']
+    assert router._async_waiters[TASK_CHAT] == []
+
+
+def test_concurrency_limit_is_respected_by_async_callers():
+    router = make_router(2)
+    running = []
+    peak = [0]
+
+    async def call():
+        async with router.acquire_async(TASK_CHAT):
+            running.append(1)
+            peak[0] = max(peak[0], len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(10)))
+
+    asyncio.run(main())
+    assert peak[0] == 2
+    stats = router.get_stats()[TASK_CHAT]
+    assert stats['calls'] == 10
+    assert stats['in_flight'] == 0
+
+
+def test_sync_release_wakes_an_async_waiter():
+    router = make_router(1)
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def hold_sync():
+        with router.acquire(TASK_CHAT):
+            acquired.set()
+            release.wait(2)
+
+    thread = threading.Thread(target=hold_sync)
+    thread.start()
+    acquired.wait(2)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, release.set)
+        released_at = time.time() + 0.05
+        async with router.acquire_async(TASK_CHAT):
+            return time.time() - released_at
+
+    delay = asyncio.run(main())
+    thread.join()
+    assert delay < 0.05
+
+
+def test_cancelled_waiter_leaves_no_entry_and_no_slot_behind():
+    router = make_router(1)
+
+    async def main():
+        holder = asyncio.ensure_future(hold_async(router, 'holder', [], hold=0.05))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(hold_async(router, 'waiter', []))
+        await asyncio.sleep(0.01)
+        assert len(router._async_waiters[TASK_CHAT]) == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert router._async_waiters[TASK_CHAT] == []
+        await holder
+        order = []
+        await asyncio.wait_for(hold_async(router, 'next', order), 1)
+        return order
+
+    assert asyncio.run(main()) == ['next']
+
+
+def make_service(chat_concurrency=16, reply=REPLY):
+    provider = FakeProvider(FakeLLMConfig(ttft_distribution='fixed', ttft_median=0.0, tokens_per_second=1e6,
+                                          chunk_pattern='fixed', chunk_tokens=(2, 2),
+                                          responder=lambda prompt: reply))
+    return LLMService(api_key=None, model_name='fake-chat', provider=provider,
+                      routes={TASK_CHAT: ModelRoute('fake-chat', max_concurrency=chat_concurrency)})
+
+
+def test_agenerate_returns_text_and_usage():
+    service = make_service()
+    text, usage_info, success = asyncio.run(service.agenerate("Chào cháu"))
+    assert success
+    assert text == REPLY
+    assert usage_info['model'] == 'fake-chat'
+    assert usage_info['output_tokens'] == len(REPLY.split())
+    assert service.get_route_stats()[TASK_CHAT]['calls'] == 1
+
+
+def test_agenerate_calls_run_concurrently():
+    service = make_service()
+
+    async def main():
+        return await asyncio.gather(*(service.agenerate(f"Câu {index}") for index in range(5)))
+
+    results = asyncio.run(main())
+    assert [success for _, _, success in results] == [True] * 5
+    assert service.get_route_stats()[TASK_CHAT]['in_flight'] == 0
+
+
+def test_astream_yields_pieces_in_order():
+    service = make_service()
+
+    async def main():
+        return [piece async for piece in service.astream("Chào cháu")]
+
+    pieces = asyncio.run(main())
+    words = REPLY.split()
+    assert len(pieces) > 1
+    assert [piece.split() for piece in pieces] == [words[index:index + 2] for index in range(0, len(words), 2)]
+    assert ''.join(pieces) == REPLY
+
+
+def test_early_aclose_releases_the_route_slot():
+    service = make_service(chat_concurrency=1)
+
+    async def main():
+        stream = service.astream("Chào cháu")
+        first = await stream.__anext__()
+        assert service.get_route_stats()[TASK_CHAT]['in_flight'] == 1
+        await stream.aclose()
+        assert service.get_route_stats()[TASK_CHAT]['in_flight'] == 0
+        # The only slot is free again: the next call does not wait for the abandoned stream
+        second = await asyncio.wait_for(service.agenerate("Còn gì nữa không?"), 1)
+        return first, second
+
+    first, (text, _, success) = asyncio.run(main())
+    assert first and success and text == REPLY
+
+
+def test_closing_astream_early_cancels_the_upstream_stream():
+    service = make_service()
+
+    async def main():
+        stream = service.astream("Chào cháu")
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(main()) == "Dạ cháu "
+    assert service.provider.get_stats()['cancelled_streams'] == 1
+
+
+def test_closing_generate_stream_early_cancels_the_upstream_stream():
+    service = make_service()
+    stream = service.generate_stream("Chào cháu")
+    assert next(stream) == "Dạ cháu "
+    stream.close()
+    assert service.provider.get_stats()['cancelled_streams'] == 1
+    assert service.get_route_stats()[TASK_CHAT]['in_flight'] == 0
+
+
+def test_fully_read_streams_are_not_cancelled():
+    service = make_service()
+
+    async def main():
+        return [piece async for piece in service.astream("Chào cháu")]
+
+    assert ''.join(asyncio.run(main())) == ''.join(service.generate_stream("Chào cháu")) == REPLY
+    assert service.provider.get_stats()['cancelled_streams'] == 0
+
+
+def test_consumer_closing_a_context_chat_stream_releases_the_slot():
+    service = make_service(chat_concurrency=1)
+
+    async def main():
+        stream = service.astream_chat_with_context("Bác kể chuyện quê cho cháu nghe")
+        await stream.__anext__()
+        await stream.aclose()
+        return service.get_route_stats()[TASK_CHAT]
+
+    stats = asyncio.run(main())
+    assert stats['in_flight'] == 0
+    assert stats['errors'] == 0
+    assert service.provider.get_stats()['cancelled_streams'] == 1
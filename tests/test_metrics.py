@@ -0,0 +1,146 @@
+import threading
+
+import pytest
+
+from utils.metrics import MetricsCollector, RequestTrace
+
+
+def make_collector(**kwargs):
+    return MetricsCollector(save_to_file=False, log_metrics=False, **kwargs)
+
+
+def make_trace(spans, samples=None, name='chat'):
+    trace = RequestTrace(name, start_time=0.0)
+    for phase, duration in spans.items():
+        trace.add_span(phase, duration)
+    for sample_name, values in (samples or {}).items():
+        for value in values:
+            trace.add_sample(sample_name, value)
+    return trace
+
+
+def test_trace_adds_up_repeated_phases_and_collects_samples():
+    trace = make_trace({'retrieval': 0.010}, {'inter_chunk': [0.002, 0.004]})
+    trace.add_span('retrieval', 0.005)
+    with trace.span('generation'):
+        pass
+
+    assert trace.spans['retrieval'] == pytest.approx(0.015)
+    assert trace.spans['generation'] >= 0.0
+    assert trace.samples == {'inter_chunk': [0.002, 0.004]}
+
+    trace.finish()
+    assert trace.spans['total'] > 0.0
+
+
+def test_percentiles_per_phase():
+    metrics = make_collector()
+    # 1..100 ms for ttft, 10x that for total; shuffled order must not matter
+    for ms in list(range(100, 0, -2)) + list(range(1, 100, 2)):
+        metrics.record_trace(make_trace({'ttft': ms / 1000, 'total': ms / 100}))
+
+    histograms = metrics.get_latency_histograms('chat')
+    ttft = histograms['chat']['ttft']
+    assert ttft['count'] == 100
+    assert ttft['p50_ms'] == pytest.approx(50)
+    assert ttft['p95_ms'] == pytest.approx(95)
+    assert ttft['p99_ms'] == pytest.approx(99)
+    assert ttft['max_ms'] == pytest.approx(100)
+    assert ttft['avg_ms'] == pytest.approx(50.5)
+
+    total = histograms['chat']['total']
+    assert total['p50_ms'] == pytest.approx(500)
+    assert total['p95_ms'] == pytest.approx(950)
+    assert total['p99_ms'] == pytest.approx(990)
+
+
+def test_samples_are_histogrammed_under_their_own_name():
+    metrics = make_collector()
+    metrics.record_trace(make_trace({'ttft': 0.2}, {'inter_chunk': [0.001, 0.002, 0.003, 0.004]}))
+
+    histograms = metrics.get_latency_histograms()['chat']
+    assert histograms['ttft']['count'] == 1
+    assert histograms['inter_chunk']['count'] == 4
+    assert histograms['inter_chunk']['p50_ms'] == pytest.approx(2)
+    assert histograms['inter_chunk']['max_ms'] == pytest.approx(4)
+
+
+def test_histograms_are_kept_per_trace_name():
+    metrics = make_collector()
+    metrics.record_trace(make_trace({'ttft': 0.1}, name='chat'))
+    metrics.record_trace(make_trace({'ttft': 0.3}, name='summary'))
+
+    assert set(metrics.get_latency_histograms()) == {'chat', 'summary'}
+    assert metrics.get_latency_histograms('summary')['summary']['ttft']['p50_ms'] == pytest.approx(300)
+    assert metrics.get_latency_histograms('missing') == {'missing': {}}
+
+
+def test_window_keeps_only_the_latest_values():
+    metrics = make_collector(histogram_window=10)
+    for ms in range(1, 21):
+        metrics.record_trace(make_trace({'ttft': ms / 1000}))
+
+    ttft = metrics.get_latency_histograms('chat')['chat']['ttft']
+    assert ttft['count'] == 10
+    assert ttft['p50_ms'] == pytest.approx(15)
+    assert ttft['max_ms'] == pytest.approx(20)
+
+
+def test_record_trace_waits_for_the_histogram_lock():
+    metrics = make_collector()
+    done = threading.Event()
+
+    def record():
+        metrics.record_trace(make_trace({'ttft': 0.1}))
+        done.set()
+
+    with metrics._histogram_lock:
+        thread = threading.Thread(target=record)
+        thread.start()
+        assert not done.wait(0.1)
+        assert metrics.span_histograms == {}
+    thread.join(timeout=2)
+
+    assert done.is_set()
+    assert metrics.get_latency_histograms('chat')['chat']['ttft']['count'] == 1
+
+
+def test_concurrent_record_and_read_lose_nothing():
+    metrics = make_collector(histogram_window=100000)
+    writers, traces_per_writer = 8, 200
+    errors = []
+    stop = threading.Event()
+
+    def write(index):
+        for i in range(traces_per_writer):
+            metrics.record_trace(make_trace(
+                {'ttft': 0.001, f'phase_{i % 5}': 0.002},
+                {'inter_chunk': [0.001] * 3},
+                name=f'chat_{index % 2}'
+            ))
+
+    def read():
+        while not stop.is_set():
+            try:
+                metrics.get_latency_histograms()
+            except RuntimeError as e:  # deque/dict mutated during iteration
+                errors.append(e)
+                return
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    reader.join()
+
+    assert errors == []
+    histograms = metrics.get_latency_histograms()
+    per_name = writers // 2 * traces_per_writer
+    for name in ('chat_0', 'chat_1'):
+        assert histograms[name]['ttft']['count'] == per_name
+        assert histograms[name]['inter_chunk']['count'] == per_name * 3
+        assert sum(histograms[name][f'phase_{i}']['count'] for i in range(5)) == per_name
@@ -0,0 +1,136 @@
+import threading
+
+from utils.llm_provider import FakeLLMConfig, FakeProvider
+from utils.llm_service import LLMService
+from utils.model_router import (DEFAULT_ROUTES, TASK_CHAT, TASK_CONNECTION_TEST, TASK_EMOTION, TASK_SUMMARY,
+                                TASK_TIPS, ModelRoute, ModelRouter)
+
+REPLY = "Bác nhớ uống đủ nước, ăn nhiều rau xanh và đi bộ nhẹ nhàng mỗi sáng nhé ạ."
+
+
+def make_provider(**config):
+    config = dict(dict(ttft_distribution='fixed', ttft_median=0.0, tokens_per_second=1e6,
+                       responder=lambda prompt: REPLY), **config)
+    return FakeProvider(FakeLLMConfig(**config))
+
+
+def make_service(routes=None):
+    return LLMService(api_key=None, model_name='fake-chat', provider=make_provider(), routes=routes)
+
+
+def test_background_tasks_use_the_lightweight_model():
+    router = ModelRouter(provider=make_provider())
+    chat_model = router.get_model(TASK_CHAT)
+    assert chat_model.model_name == DEFAULT_ROUTES[TASK_CHAT].model_name
+    assert router.get_generation_config(TASK_CHAT) is None
+
+    for task in (TASK_SUMMARY, TASK_TIPS, TASK_EMOTION, TASK_CONNECTION_TEST):
+        route = DEFAULT_ROUTES[task]
+        model = router.get_model(task)
+        assert route.model_name != DEFAULT_ROUTES[TASK_CHAT].model_name
+        assert model.model_name == route.model_name
+        assert model._generation_config.temperature == route.temperature
+        assert model._generation_config.max_output_tokens == route.max_output_tokens
+
+
+def test_models_are_cached_per_route_and_instruction():
+    router = ModelRouter(provider=make_provider())
+    assert router.get_model(TASK_SUMMARY) is router.get_model(TASK_SUMMARY)
+    assert router.get_model(TASK_CHAT, 'Gợi ý') is router.get_model(TASK_CHAT, 'Gợi ý')
+    assert router.get_model(TASK_CHAT, 'Gợi ý') is not router.get_model(TASK_CHAT)
+
+
+def test_update_route_replaces_the_model():
+    router = ModelRouter(provider=make_provider())
+    old_model = router.get_model(TASK_SUMMARY)
+    router.update_route(TASK_SUMMARY, model_name='fake-summary', max_output_tokens=64)
+    model = router.get_model(TASK_SUMMARY)
+    assert model is not old_model
+    assert model.model_name == 'fake-summary'
+    assert model._generation_config.max_output_tokens == 64
+    assert router.get_route(TASK_SUMMARY).temperature == DEFAULT_ROUTES[TASK_SUMMARY].temperature
+
+
+def test_calls_are_counted_on_their_own_route():
+    router = ModelRouter(provider=make_provider())
+    with router.acquire(TASK_SUMMARY) as model:
+        assert model.generate_content("Tóm tắt").text == REPLY
+    stats = router.get_stats()
+    assert stats[TASK_SUMMARY]['calls'] == 1
+    assert stats[TASK_SUMMARY]['model_name'] == DEFAULT_ROUTES[TASK_SUMMARY].model_name
+    assert stats[TASK_CHAT]['calls'] == 0
+
+
+def test_busy_summary_route_does_not_block_chat():
+    router = ModelRouter(routes={TASK_SUMMARY: ModelRoute('fake-lite', max_concurrency=1)},
+                         provider=make_provider())
+    holding = threading.Event()
+    release = threading.Event()
+
+    def hold_summary():
+        with router.acquire(TASK_SUMMARY):
+            holding.set()
+            release.wait(2)
+
+    thread = threading.Thread(target=hold_summary)
+    thread.start()
+    try:
+        assert holding.wait(2)
+        with router.acquire(TASK_CHAT):
+            assert router.get_stats()[TASK_SUMMARY]['in_flight'] == 1
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_unknown_task_falls_back_to_chat():
+    router = ModelRouter(provider=make_provider())
+    assert router.get_route('translate') is router.get_route(TASK_CHAT)
+    assert router.get_model('translate') is router.get_model(TASK_CHAT)
+    assert router.get_breaker('translate') is router.get_breaker(TASK_CHAT)
+    with router.acquire('translate'):
+        pass
+    stats = router.get_stats()
+    assert 'translate' not in stats
+    assert stats[TASK_CHAT]['calls'] == 1
+
+
+def test_utility_calls_reach_their_route_config():
+    service = make_service(routes={TASK_TIPS: ModelRoute('fake-lite', temperature=0.3, max_output_tokens=5)})
+    text, usage_info, success = service.get_daily_tips(use_cache=False)
+    assert success
+    # The route's token cap reached the model
+    assert text == ' '.join(REPLY.split()[:5])
+    assert usage_info['model'] == 'fake-lite'
+    stats = service.get_route_stats()
+    assert stats[TASK_TIPS]['calls'] == 1
+    assert stats[TASK_CHAT]['calls'] == 0
+
+
+def test_health_advice_and_connection_test_use_their_routes():
+    service = make_service()
+    _, usage_info, success = service.get_health_advice("Bị mất ngủ thì nên làm gì?", use_cache=False)
+    assert success
+    assert usage_info['model'] == DEFAULT_ROUTES[TASK_TIPS].model_name
+    assert service.test_connection()
+    stats = service.get_route_stats()
+    assert stats[TASK_TIPS]['calls'] == 1
+    assert stats[TASK_CONNECTION_TEST]['calls'] == 1
+    assert stats[TASK_CHAT]['calls'] == 0
+
+
+def test_chat_route_follows_the_service_model():
+    service = make_service()
+    assert service.router.get_route(TASK_CHAT).model_name == 'fake-chat'
+    service.change_model('fake-chat-2')
+    assert service.router.get_route(TASK_CHAT).model_name == 'fake-chat-2'
+    _, usage_info, success = service.generate_response("Chào cháu")
+    assert success
+    assert usage_info['model'] == 'fake-chat-2'
+
+
+def test_unknown_task_in_the_service_is_served_by_chat():
+    service = make_service()
+    text, usage_info, success = service.generate_response("Chào cháu", task='translate')
+    assert success and text == REPLY
+    assert service.get_route_stats()[TASK_CHAT]['calls'] == 1
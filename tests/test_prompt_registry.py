@@ -0,0 +1,82 @@
+import pytest
+
+from utils.prompt_registry import PromptRegistry, compress_prompt
+
+
+def test_whitespace_is_collapsed():
+    text = "  === VAI TRÒ ===  \n   Cháu là người bạn tâm sự.   \n\n\n\n  Trả lời ngắn gọn.  "
+    assert compress_prompt(text) == "=== VAI TRÒ ===\nCháu là người bạn tâm sự.\n\nTrả lời ngắn gọn."
+
+
+def test_repeated_rule_is_dropped():
+    text = ("QUY TẮC:\n- Không dùng markdown, không in đậm, không ký tự đặc biệt.\n\n"
+            "LƯU Ý:\n• KHÔNG dùng **, markdown, kí tự đặc biệt\n• Xưng cháu, gọi bác")
+    compressed = compress_prompt(text)
+    assert "KHÔNG dùng **" not in compressed
+    assert "• Xưng cháu, gọi bác" in compressed
+
+
+def test_exact_duplicate_bullet_is_dropped():
+    text = "- Trả lời bằng tiếng Việt có dấu\n\n- Trả lời bằng tiếng Việt có dấu"
+    assert compress_prompt(text) == "- Trả lời bằng tiếng Việt có dấu"
+
+
+@pytest.mark.parametrize('earlier, rule', [
+    # Standing rule whose words appear in a longer rule that only applies when the user is sad
+    ("- Nếu người dùng buồn, cô đơn, hãy an ủi, nhắc nhở về những điều tốt đẹp, gợi ý hoạt động tích cực.",
+     "• HƯỚNG TÍCH CỰC: Về những điều tốt đẹp"),
+    # Encouraging questions vs a rule restricting them
+    ("• HỎI CÓ CHỌN LỌC: Chỉ hỏi han khi thực sự cần thiết hoặc để khơi gợi kỷ niệm đẹp",
+     "• Hỏi han để KHƠI GỢI KỶ NIỆM đẹp"),
+    # Same words, opposite meaning
+    ("- Nhắc bác uống thuốc đúng giờ", "- Không nhắc bác uống thuốc đúng giờ"),
+])
+def test_distinct_rules_are_kept(earlier, rule):
+    compressed = compress_prompt(f"{earlier}\n{rule}")
+    assert rule in compressed
+
+
+def test_header_left_empty_by_dedupe_is_dropped():
+    text = "- Không dùng markdown, không in đậm\n\nTRÁNH:\n• Không dùng markdown, không in đậm\n\nKẾT THÚC"
+    compressed = compress_prompt(text)
+    assert "TRÁNH:" not in compressed
+    assert compressed.endswith("KẾT THÚC")
+
+
+def test_header_followed_by_subheader_is_kept():
+    text = "=== KHUNG TƯ DUY ===\nTrước khi trả lời, thực hiện 2 bước:\n1. Hiểu cảm xúc\n2. Trả lời"
+    assert compress_prompt(text) == text
+
+
+def test_numbered_steps_and_tables_are_not_deduplicated():
+    text = "- BUỒN → An ủi và gợi mở điều tích cực\nBUỒN → An ủi và gợi mở điều tích cực"
+    assert compress_prompt(text) == text
+
+
+def test_drop_sections():
+    text = ("=== VAI TRÒ ===\nNgười bạn tâm sự\n\n=== KỸ THUẬT TỐI ƯU TOKEN ===\n• Dùng từ ngắn\n"
+            "• Tránh lặp thông tin\n\n=== KẾT ===\nChào bác")
+    compressed = compress_prompt(text, drop_sections=['KỸ THUẬT TỐI ƯU TOKEN'])
+    assert "TỐI ƯU" not in compressed and "Dùng từ ngắn" not in compressed
+    assert "Người bạn tâm sự" in compressed and "Chào bác" in compressed
+
+
+def test_registry_records_tokens_per_variant():
+    registry = PromptRegistry()
+    registry.register('full', lambda topic_key, user_input, user_info: f"Chủ đề {topic_key}. " * 50)
+    registry.register('short', lambda topic_key, user_input, user_info: f"Chủ đề {topic_key}.")
+    registry.build('full', 'que_huong')
+    registry.build('short', 'que_huong')
+
+    stats = registry.get_stats()
+    assert stats['full']['builds'] == 1
+    assert stats['full']['last_tokens'] > stats['short']['last_tokens'] > 0
+
+    report = registry.measure([('que_huong', None), ('suc_khoe', {})])
+    assert report['full']['avg_tokens'] > report['short']['avg_tokens']
+    assert registry.get_stats()['full']['builds'] == 1  # measure() does not record builds
+
+
+def test_unknown_variant():
+    with pytest.raises(ValueError):
+        PromptRegistry().build('missing', 'que_huong')
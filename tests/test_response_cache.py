@@ -0,0 +1,93 @@
+import os
+import unicodedata
+
+import pytest
+
+from utils.response_cache import ResponseCache, make_cache_key
+
+
+def test_key_ignores_case_whitespace_and_unicode_form():
+    composed = unicodedata.normalize('NFC', 'Mẹo  sức khỏe\nhôm nay')
+    decomposed = unicodedata.normalize('NFD', 'mẹo sức khỏe HÔM NAY ')
+    assert make_cache_key('m', {'temperature': 0.7}, composed) == make_cache_key('m', {'temperature': 0.7}, decomposed)
+
+
+@pytest.mark.parametrize('other', [
+    ('other-model', {'temperature': 0.7}, 'prompt', None),
+    ('m', {'temperature': 0.2}, 'prompt', None),
+    ('m', {'temperature': 0.7}, 'prompt', '2026-10-19'),
+])
+def test_key_changes_with_model_config_and_scope(other):
+    assert make_cache_key('m', {'temperature': 0.7}, 'prompt') != make_cache_key(*other)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResponseCache(ttl=60, clock=clock)
+    cache.set('k', 'value')
+    clock.advance(59)
+    assert cache.get('k') == 'value'
+    clock.advance(1)
+    assert cache.get('k') is None
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['expirations'], stats['entries']) == (1, 1, 1, 0)
+
+
+def test_per_entry_ttl_overrides_default(clock):
+    cache = ResponseCache(ttl=3600, clock=clock)
+    cache.set('daily', 'tip', ttl=10)
+    clock.advance(10)
+    assert cache.get('daily') is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(max_entries=2, clock=clock)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path, clock):
+    ResponseCache(cache_dir=str(tmp_path), clock=clock).set('k', {'text': 'Chào bác'})
+    cache = ResponseCache(cache_dir=str(tmp_path), clock=clock)
+    assert cache.get('k') == {'text': 'Chào bác'}
+    # Promoted to memory: the next lookup is a memory hit
+    assert cache.get('k') == {'text': 'Chào bác'}
+    stats = cache.get_stats()
+    assert (stats['disk_hits'], stats['hits'], stats['entries']) == (1, 1, 1)
+
+
+def test_entry_evicted_from_memory_is_read_back_from_disk(tmp_path, clock):
+    cache = ResponseCache(max_entries=1, cache_dir=str(tmp_path), clock=clock)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    assert cache.get_stats()['disk_hits'] == 1
+
+
+def test_expired_disk_entry_is_removed(tmp_path, clock):
+    ResponseCache(ttl=60, cache_dir=str(tmp_path), clock=clock).set('k', 'value')
+    clock.advance(60)
+    cache = ResponseCache(ttl=60, cache_dir=str(tmp_path), clock=clock)
+    assert cache.get('k') is None
+    assert not os.path.exists(tmp_path / 'k.json')
+
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path, clock):
+    (tmp_path / 'k.json').write_text('{not json', encoding='utf-8')
+    cache = ResponseCache(cache_dir=str(tmp_path), clock=clock)
+    assert cache.get('k') is None
+    assert cache.get_stats()['misses'] == 1
+
+
+def test_clear_drops_memory_and_disk(tmp_path, clock):
+    cache = ResponseCache(cache_dir=str(tmp_path), clock=clock)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.clear()
+    assert cache.get('a') is None
+    assert not any(name.endswith('.json') for name in os.listdir(tmp_path))
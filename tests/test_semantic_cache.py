@@ -0,0 +1,147 @@
+import pytest
+
+from utils.semantic_cache import SemanticCache, guard_signature, tokenize
+
+QUESTION = "Bác bị cao huyết áp thì nên ăn gì?"
+
+
+@pytest.fixture
+def cache():
+    return SemanticCache(threshold=0.8)
+
+
+def test_tokenize_drops_stop_words_and_trailing_particles():
+    assert tokenize("Bác bị cao huyết áp thì nên ăn gì ạ?") == ['cao', 'huyết', 'áp', 'ăn']
+    assert tokenize("Uống trà có tốt không?") == ['uống', 'trà']
+
+
+@pytest.mark.parametrize('query', ["bác bị cao huyết áp nên ăn gì ạ", "Cao huyết áp nên ăn gì", QUESTION])
+def test_rephrased_question_hits(cache, query):
+    cache.add(QUESTION, 'answer', 'suc_khoe:Lan')
+    answer, similarity = cache.lookup(query, 'suc_khoe:Lan')
+    assert answer == 'answer'
+    assert similarity >= 0.8
+
+
+def test_different_question_misses(cache):
+    cache.add(QUESTION, 'answer', 'suc_khoe:Lan')
+    assert cache.lookup("Bác bị tiểu đường thì nên ăn gì?", 'suc_khoe:Lan') is None
+    assert cache.get_stats()['misses'] == 1
+
+
+def test_negation_blocks_a_hit_above_the_threshold(cache):
+    negated = "Bác bị cao huyết áp thì không nên ăn gì?"
+    assert guard_signature(negated) == {'cao', 'không'}
+    cache.add(QUESTION, 'answer', 'suc_khoe:Lan')
+    vector = cache.embedder.embed(negated)
+    # Similar enough to hit on similarity alone: only the guard words keep them apart
+    assert float(cache._scopes['suc_khoe:Lan'].vectors[0] @ vector) >= cache.threshold
+    assert cache.lookup(negated, 'suc_khoe:Lan') is None
+
+
+def test_guard_words_pick_the_matching_entry():
+    cache = SemanticCache(threshold=0.5)
+    cache.add("Uống cà phê buổi sáng có tốt không?", 'morning', 'suc_khoe:Lan')
+    assert cache.lookup("Uống cà phê buổi tối có tốt không?", 'suc_khoe:Lan') is None
+    cache.add("Uống cà phê buổi tối có tốt không?", 'evening', 'suc_khoe:Lan')
+    assert cache.lookup("uống cà phê buổi tối có tốt không ạ", 'suc_khoe:Lan')[0] == 'evening'
+    assert cache.lookup("Uống cà phê buổi sáng có tốt không?", 'suc_khoe:Lan')[0] == 'morning'
+
+
+def test_scopes_are_isolated(cache):
+    cache.add(QUESTION, 'for Lan', 'suc_khoe:Lan')
+    assert cache.lookup(QUESTION, 'suc_khoe:Tư') is None
+    assert cache.lookup(QUESTION, 'que_huong:Lan') is None
+
+
+def test_clear_prefix_drops_only_the_topic_scopes(cache):
+    cache.add(QUESTION, 'a', 'suc_khoe:Lan')
+    cache.add(QUESTION, 'b', 'suc_khoe:Tư')
+    cache.add(QUESTION, 'c', 'suc_khoe_tam_ly:Lan')
+    cache.add(QUESTION, 'd', 'que_huong:Lan')
+
+    assert cache.clear_prefix('suc_khoe:') == 2
+    assert cache.lookup(QUESTION, 'suc_khoe:Lan') is None
+    assert cache.lookup(QUESTION, 'suc_khoe:Tư') is None
+    assert cache.lookup(QUESTION, 'suc_khoe_tam_ly:Lan')[0] == 'c'
+    assert cache.lookup(QUESTION, 'que_huong:Lan')[0] == 'd'
+    assert cache.clear_prefix('suc_khoe:') == 0
+
+
+def test_clear_one_scope_or_everything(cache):
+    cache.add(QUESTION, 'a', 'suc_khoe:Lan')
+    cache.add(QUESTION, 'b', 'que_huong:Lan')
+    cache.clear('suc_khoe:Lan')
+    assert cache.get_stats()['scopes'] == {'que_huong:Lan': 1}
+    cache.clear()
+    assert cache.get_stats()['scopes'] == {}
+
+
+def test_oldest_entry_is_overwritten_when_the_scope_is_full():
+    cache = SemanticCache(max_entries_per_scope=2)
+    cache.add("Cao huyết áp nên ăn gì?", 'a', 's')
+    cache.add("Tiểu đường nên ăn gì?", 'b', 's')
+    cache.add("Mất ngủ nên uống gì?", 'c', 's')
+    assert cache.lookup("Cao huyết áp nên ăn gì?", 's') is None
+    assert cache.lookup("Tiểu đường nên ăn gì?", 's')[0] == 'b'
+    assert cache.get_stats()['scopes'] == {'s': 2}
+
+
+QUESTIONS = ["Cao huyết áp nên ăn gì?", "Tiểu đường nên ăn gì?", "Mất ngủ nên uống gì?",
+             "Đau lưng nên tập gì?", "Bị cảm lạnh nên uống thuốc gì?"]
+
+
+def test_scope_matrix_grows_by_doubling_up_to_the_cap():
+    cache = SemanticCache(max_entries_per_scope=20)
+    cache.add(QUESTION, 'a', 's')
+    index = cache._scopes['s']
+    assert index.vectors.shape == (8, cache.embedder.dim)
+
+    for number in range(9):
+        cache.add(f"Câu hỏi số {number} về huyết áp", number, 's')
+    assert index.vectors.shape[0] == 16
+    for number in range(9, 30):
+        cache.add(f"Câu hỏi số {number} về huyết áp", number, 's')
+    assert index.vectors.shape[0] == 20
+    assert cache.get_stats()['scopes'] == {'s': 20}
+    assert cache.lookup(QUESTION, 's') is None
+    assert cache.lookup("Câu hỏi số 29 về huyết áp", 's')[0] == 29
+
+
+def test_entries_survive_growth():
+    cache = SemanticCache(max_entries_per_scope=500)
+    for number, question in enumerate(QUESTIONS * 4):
+        cache.add(question, number, 's')
+    assert len(cache._scopes['s'].vectors) == 32
+    for question in QUESTIONS:
+        assert cache.lookup(question, 's') is not None
+
+
+def test_least_recently_used_scope_is_dropped_beyond_max_scopes():
+    cache = SemanticCache(max_scopes=2)
+    cache.add(QUESTION, 'a', 'suc_khoe:Lan|70')
+    cache.add(QUESTION, 'b', 'suc_khoe:Lan|71')
+    assert cache.lookup(QUESTION, 'suc_khoe:Lan|70')[0] == 'a'
+
+    cache.add(QUESTION, 'c', 'suc_khoe:Lan|72')
+    stats = cache.get_stats()
+    assert set(stats['scopes']) == {'suc_khoe:Lan|70', 'suc_khoe:Lan|72'}
+    assert stats['evicted_scopes'] == 1
+    assert cache.lookup(QUESTION, 'suc_khoe:Lan|71') is None
+
+
+def test_idle_scopes_are_dropped(clock):
+    cache = SemanticCache(scope_idle_ttl=3600, clock=clock)
+    cache.add(QUESTION, 'old profile', 'suc_khoe:Lan|70')
+    clock.advance(1800)
+    cache.add(QUESTION, 'new profile', 'suc_khoe:Lan|71')
+    clock.advance(1801)
+
+    # Adding to another scope sweeps the stale profile, the recently used one stays
+    cache.add(QUESTION, 'other topic', 'dinh_duong:Lan|71')
+    assert set(cache.get_stats()['scopes']) == {'suc_khoe:Lan|71', 'dinh_duong:Lan|71'}
+
+    clock.advance(3601)
+    assert cache.lookup(QUESTION, 'suc_khoe:Lan|71') is None
+    assert cache.get_stats()['evicted_scopes'] == 2
+    assert 'suc_khoe:Lan|71' not in cache.get_stats()['scopes']
@@ -0,0 +1,83 @@
+import asyncio
+import random
+
+import pytest
+
+from utils.circuit_breaker import STATE_CLOSED
+from utils.llm_provider import FakeLLMConfig, FakeProvider
+from utils.llm_service import CHAT_MAX_SENTENCES, LLMService
+from utils.model_router import TASK_CHAT
+from utils.sentence_budget import SentenceBudget, truncate_sentences
+
+REPLY = ("Dạ, cháu chào bác ạ. Hôm nay bác thấy trong người thế nào? Cháu mong bác luôn khỏe! "
+         "Bác nhớ uống đủ nước nhé… Tối nay bác ngủ sớm một chút ạ. Mai cháu lại hỏi thăm bác.")
+
+
+def feed_all(budget, pieces):
+    return ''.join(budget.feed(piece) for piece in pieces)
+
+
+def test_truncate_keeps_the_final_punctuation():
+    assert truncate_sentences(REPLY, 2) == "Dạ, cháu chào bác ạ. Hôm nay bác thấy trong người thế nào?"
+
+
+def test_truncate_with_fewer_sentences_returns_everything():
+    assert truncate_sentences("Dạ vâng ạ. Cháu hiểu rồi.", 5) == "Dạ vâng ạ. Cháu hiểu rồi."
+
+
+@pytest.mark.parametrize('limit', [None, 0])
+def test_no_limit(limit):
+    budget = SentenceBudget(max_sentences=limit)
+    assert feed_all(budget, [REPLY, " Thêm nữa."]) == REPLY + " Thêm nữa."
+    assert not budget.exhausted
+
+
+def test_short_fragments_do_not_count():
+    text = "1. Dạ. Uống nước ấm. 2. Ngủ sớm. Đi bộ nhẹ nhàng."
+    # "1.", "Dạ." and "2." are shorter than min_sentence_chars
+    assert truncate_sentences(text, 2) == "1. Dạ. Uống nước ấm. 2. Ngủ sớm."
+
+
+def test_line_breaks_end_sentences():
+    assert truncate_sentences("Dòng thứ nhất\nDòng thứ hai\nDòng thứ ba", 2) == "Dòng thứ nhất\nDòng thứ hai"
+
+
+def test_exhausted_budget_drops_the_rest():
+    budget = SentenceBudget(max_sentences=1)
+    assert budget.feed("Câu đầu tiên. Câu thứ hai.") == "Câu đầu tiên."
+    assert budget.exhausted
+    assert budget.feed("Còn nữa.") == ''
+    assert budget.sentences == 1
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_cut_does_not_depend_on_chunking(seed):
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(REPLY)), rng.randint(1, 20)))
+    pieces = [REPLY[start:end] for start, end in zip([0] + cuts, cuts + [len(REPLY)])]
+    budget = SentenceBudget(max_sentences=3)
+    assert feed_all(budget, pieces) == truncate_sentences(REPLY, 3)
+    assert budget.exhausted and budget.sentences == 3
+
+
+def test_budget_cut_replies_are_not_upstream_failures():
+    long_reply = ' '.join(f"Đây là câu số {index} của cháu." for index in range(12))
+    provider = FakeProvider(FakeLLMConfig(ttft_distribution='fixed', ttft_median=0.0, tokens_per_second=1e6,
+                                          chunk_pattern='sentence', responder=lambda prompt: long_reply))
+    service = LLMService(api_key=None, model_name='fake-chat', provider=provider)
+
+    async def reply(index):
+        return ''.join([text async for text in service.astream_chat_with_context(f"Bác kể chuyện {index}")])
+
+    async def main():
+        return [await reply(index) for index in range(8)]
+
+    for text in asyncio.run(main()):
+        assert text == truncate_sentences(long_reply, CHAT_MAX_SENTENCES)
+
+    stats = service.get_route_stats()[TASK_CHAT]
+    assert stats['errors'] == 0
+    assert stats['cancelled'] == 8  # every stream was cut by the budget
+    assert stats['in_flight'] == 0
+    assert stats['circuit']['state'] == STATE_CLOSED
+    assert stats['circuit']['failure_rate'] == 0.0
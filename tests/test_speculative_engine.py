@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+
+import google.generativeai as genai
+import pytest
+
+from conftest import wait_for
+from utils.speculative_engine import QUICK_REPLY_TEMPLATES, SpeculativeEngine, normalize_short_message
+
+
+@pytest.mark.parametrize('message, intent', [
+    ("Cảm ơn cháu nhé!!", 'thanks'),
+    ("  vâng ạ 😊", 'ack'),
+    ("Tạm biệt cháu.", 'goodbye'),
+    ("OK", 'ack'),
+])
+def test_common_short_messages_match_their_intent(message, intent):
+    assert SpeculativeEngine().match_intent(message) == intent
+
+
+@pytest.mark.parametrize('message', [
+    "",
+    "Cảm ơn cháu, nhưng bác vẫn còn đau lưng lắm",
+    "vâng ạ nhưng mà bác chưa hiểu lắm cháu ơi",
+    "Hôm nay trời mưa",
+])
+def test_other_messages_need_the_model(message):
+    engine = SpeculativeEngine()
+    assert engine.match_intent(message) is None
+    assert engine.quick_reply(message, 'gia_dinh', 'Gia đình') is None
+    assert engine.get_stats()['quick_misses'] == 1
+
+
+def test_normalize_drops_punctuation_and_case():
+    assert normalize_short_message("  Dạ,   VÂNG ạ!!! ") == "dạ vâng ạ"
+
+
+def test_quick_reply_is_personalized_and_rotates_per_topic():
+    engine = SpeculativeEngine()
+    user_info = {'call_style': 'ông'}
+    replies = [engine.quick_reply("cảm ơn cháu", 'gia_dinh', 'Gia đình', user_info) for _ in range(4)]
+
+    templates = QUICK_REPLY_TEMPLATES['thanks']
+    expected = [template.format(call_style='ông', Call_style='Ông', topic='gia đình') for template in templates]
+    assert replies == expected + expected[:1]
+    assert all('{' not in reply for reply in replies)
+    # Another topic starts its own rotation; the default address is "bác"
+    assert engine.quick_reply("cảm ơn cháu", 'suc_khoe', 'Sức khỏe') == templates[0].format(
+        call_style='bác', Call_style='Bác', topic='sức khỏe')
+    assert engine.get_stats()['quick_hits'] == 5
+
+
+def test_counters_are_exact_under_concurrent_requests():
+    engine = SpeculativeEngine(warm=lambda topic_key: None, min_warm_interval=0)
+    threads_count, calls = 8, 500
+
+    def chat():
+        for index in range(calls):
+            engine.quick_reply("cảm ơn cháu" if index % 2 else "Hôm nay trời mưa", 'gia_dinh', 'Gia đình')
+
+    threads = [threading.Thread(target=chat) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for index in range(50):
+        engine.on_typing(f"topic_{index}")
+    for thread in threads:
+        thread.join()
+
+    assert wait_for(lambda: engine.get_stats()['warmups'] == 50)
+    stats = engine.get_stats()
+    assert stats['quick_hits'] == stats['quick_misses'] == threads_count * calls // 2
+    assert stats['quick_hit_rate'] == 0.5
+    assert stats['typing_pings'] == 50
+
+
+def test_typing_warms_in_the_background_and_is_debounced():
+    warmed = []
+    engine = SpeculativeEngine(warm=warmed.append, min_warm_interval=60)
+    assert engine.on_typing('gia_dinh')
+    assert wait_for(lambda: engine.get_stats()['warmups'] == 1)
+    assert warmed == ['gia_dinh']
+
+    assert not engine.on_typing('gia_dinh')
+    assert engine.on_typing('suc_khoe')
+    assert wait_for(lambda: engine.get_stats()['warmups'] == 2)
+    assert engine.get_stats()['typing_pings'] == 3
+
+
+def test_topic_is_not_warmed_twice_at_the_same_time():
+    release = threading.Event()
+    engine = SpeculativeEngine(warm=lambda topic_key: release.wait(2), min_warm_interval=0)
+    assert engine.on_typing('gia_dinh')
+    assert not engine.on_typing('gia_dinh')
+    assert engine.get_stats()['warming'] == ['gia_dinh']
+    release.set()
+    assert wait_for(lambda: engine.get_stats()['warming'] == [])
+    assert engine.on_typing('gia_dinh')
+
+
+def test_failed_warm_up_frees_the_topic():
+    def fail(topic_key):
+        raise RuntimeError("restore failed")
+
+    engine = SpeculativeEngine(warm=fail, min_warm_interval=0)
+    assert engine.on_typing('gia_dinh')
+    assert wait_for(lambda: engine.get_stats()['warming'] == [])
+    assert engine.get_stats()['warmups'] == 0
+
+
+def read_events(buffer):
+    return [json.loads(data) for _, data in buffer.read(keepalive=1) if data]
+
+
+def set_last_bot_turn(chatbot, topic_key, text):
+    session = chatbot.get_topic_session(topic_key)
+    session.history.append(genai.protos.Content(role='model', parts=[genai.protos.Part(text=text)]))
+    return session
+
+
+def test_short_acknowledgement_gets_a_template_reply(chatbot_app, monkeypatch):
+    chatbot = chatbot_app
+    monkeypatch.setattr(chatbot, 'speculative_engine', SpeculativeEngine())
+    set_last_bot_turn(chatbot, 'gia_dinh', "Dạ, cháu nhớ rồi ạ.")
+    calls = chatbot.llm_provider.get_stats()['calls']
+
+    events = read_events(chatbot.start_chat_turn('gia_dinh', "Cảm ơn cháu nhé", time.time()))
+    assert events[-1]['done'] and events[-1]['quick_reply']
+    assert events[0]['text'] in [template.format(call_style='bác', Call_style='Bác', topic='gia đình')
+                                 for template in QUICK_REPLY_TEMPLATES['thanks']]
+    assert chatbot.llm_provider.get_stats()['calls'] == calls
+    assert chatbot.load_chat_history('gia_dinh')[-1]['user'] == "Cảm ơn cháu nhé"
+
+
+def test_no_template_reply_after_a_bot_question(chatbot_app, monkeypatch):
+    chatbot = chatbot_app
+    engine = SpeculativeEngine()
+    monkeypatch.setattr(chatbot, 'speculative_engine', engine)
+    session = set_last_bot_turn(chatbot, 'gia_dinh', "Bác có muốn cháu nhắc giờ uống thuốc không?")
+    assert chatbot.bot_asked_question(session)
+    calls = chatbot.llm_provider.get_stats()['calls']
+
+    events = read_events(chatbot.start_chat_turn('gia_dinh', "Vâng ạ", time.time()))
+    assert events[-1]['done']
+    assert not events[-1].get('quick_reply')
+    # "Vâng" answered the question: the model was asked and the engine not consulted
+    assert chatbot.llm_provider.get_stats()['calls'] == calls + 1
+    assert engine.get_stats()['quick_hits'] == engine.get_stats()['quick_misses'] == 0
+
+
+def test_typing_ping_restores_the_topic_session(chatbot_app, monkeypatch):
+    chatbot = chatbot_app
+    engine = SpeculativeEngine(warm=chatbot.warm_topic_session)
+    monkeypatch.setattr(chatbot, 'speculative_engine', engine)
+    assert chatbot.get_active_session('suc_khoe') is None
+
+    client = chatbot.app.test_client()
+    response = client.post('/api/typing', json={'topic_key': 'suc_khoe'})
+    assert response.get_json() == {'success': True, 'warming': True}
+    assert wait_for(lambda: engine.get_stats()['warmups'] == 1)
+    session = chatbot.get_active_session('suc_khoe')
+    assert session is not None
+
+    # A second ping within the debounce interval keeps the warmed session
+    assert client.post('/api/typing', json={'topic_key': 'suc_khoe'}).get_json()['warming'] is False
+    assert chatbot.get_active_session('suc_khoe') is session
+    assert client.post('/api/typing', json={'topic_key': 'khong_co'}).status_code == 400
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from utils.stream_buffer import StreamBuffer, StreamRegistry
+
+
+def fill(buffer, count):
+    return [buffer.append(f'event {index}') for index in range(1, count + 1)]
+
+
+def test_resume_returns_only_events_after_last_event_id():
+    buffer = StreamBuffer('s', max_events=10)
+    assert fill(buffer, 5) == [1, 2, 3, 4, 5]
+    buffer.close()
+    assert list(buffer.read(0)) == [(index, f'event {index}') for index in range(1, 6)]
+    assert list(buffer.read(3)) == [(4, 'event 4'), (5, 'event 5')]
+    assert list(buffer.read(5)) == []
+
+
+def test_reader_waits_for_events_appended_later():
+    buffer = StreamBuffer('s')
+    buffer.append('first')
+
+    def produce():
+        time.sleep(0.05)
+        buffer.append('second')
+        buffer.close()
+
+    threading.Thread(target=produce).start()
+    assert list(buffer.read(1, keepalive=2.0)) == [(2, 'second')]
+
+
+def test_keepalive_is_yielded_while_the_producer_is_silent():
+    buffer = StreamBuffer('s')
+    reader = buffer.read(0, keepalive=0.01)
+    assert next(reader) is None
+    buffer.append('late')
+    assert next(reader) == (1, 'late')
+    buffer.close()
+    assert list(reader) == []
+
+
+def test_evicted_events_are_skipped_on_resume():
+    buffer = StreamBuffer('s', max_events=3)
+    fill(buffer, 6)
+    buffer.close()
+    # Events 1-3 fell out of the ring buffer; resuming continues with the oldest kept event
+    assert [event_id for event_id, _ in buffer.read(1)] == [4, 5, 6]
+    assert [event_id for event_id, _ in buffer.read(4)] == [5, 6]
+
+
+def test_detached_for_counts_from_the_last_reader_leaving():
+    buffer = StreamBuffer('s')
+    buffer.append('a')
+    reader = buffer.read(0)
+    next(reader)
+    assert buffer.detached_for() == 0.0
+    reader.close()
+    time.sleep(0.02)
+    assert buffer.detached_for() >= 0.02
+
+
+def test_registry_resumes_by_stream_id():
+    registry = StreamRegistry(max_events=4)
+    buffer = registry.create()
+    buffer.append('a')
+    buffer.append('b')
+    resumed = registry.get(buffer.stream_id)
+    assert resumed is buffer
+    assert registry.get('unknown') is None
+    assert registry.get_stats() == {'streams': 1, 'active': 1}
+
+
+def test_registry_drops_finished_streams_after_ttl():
+    registry = StreamRegistry(ttl=60)
+    running = registry.create()
+    recent = registry.create()
+    expired = registry.create()
+    recent.close()
+    expired.close()
+    expired.closed_at -= 61
+
+    assert registry.get(expired.stream_id) is None
+    assert registry.get(recent.stream_id) is recent
+    assert registry.get(running.stream_id) is running
+    assert registry.get_stats() == {'streams': 2, 'active': 1}
@@ -0,0 +1,49 @@
+import pytest
+
+from utils.stream_coalescer import StreamCoalescer
+
+
+def make_coalescer(clock, **overrides):
+    config = dict(flush_on_sentence=True, max_bytes=200, max_latency=0.25, flush_first=False, clock=clock)
+    config.update(overrides)
+    return StreamCoalescer(**config)
+
+
+def test_partial_sentence_is_held_until_poll_after_max_latency(clock):
+    coalescer = make_coalescer(clock)
+    assert coalescer.add("Dạ bác") is None
+    assert coalescer.time_until_flush() == pytest.approx(0.25)
+
+    clock.advance(0.1)
+    assert coalescer.poll() is None
+    assert coalescer.time_until_flush() == pytest.approx(0.15)
+
+    clock.advance(0.15)
+    assert coalescer.time_until_flush() == 0.0
+    assert coalescer.poll() == "Dạ bác"
+    assert coalescer.time_until_flush() is None
+
+
+def test_latency_counts_from_the_oldest_buffered_piece(clock):
+    coalescer = make_coalescer(clock)
+    coalescer.add("Dạ")
+    clock.advance(0.2)
+    assert coalescer.add(" bác") is None
+    assert coalescer.time_until_flush() == pytest.approx(0.05)
+
+
+def test_rest_after_a_sentence_flush_restarts_the_timer(clock):
+    coalescer = make_coalescer(clock)
+    coalescer.add("Dạ")
+    clock.advance(0.2)
+    assert coalescer.add(" bác ơi. Cháu") == "Dạ bác ơi. "
+    assert coalescer.time_until_flush() == pytest.approx(0.25)
+    clock.advance(0.25)
+    assert coalescer.poll() == "Cháu"
+
+
+def test_nothing_buffered_has_no_deadline(clock):
+    coalescer = make_coalescer(clock, flush_first=True)
+    assert coalescer.add("Dạ") == "Dạ"
+    assert coalescer.time_until_flush() is None
+    assert coalescer.poll() is None
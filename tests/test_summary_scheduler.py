@@ -0,0 +1,174 @@
+import json
+import time
+
+import pytest
+
+from conftest import wait_for
+from utils.circuit_breaker import STATE_OPEN
+from utils.llm_provider import FakeLLMConfig, FakeProvider
+from utils.model_router import ModelRouter
+from utils.summary_scheduler import IdleSummaryScheduler
+
+
+class Recorder:
+    def __init__(self, fail_on=(), on_call=None):
+        self.calls = []
+        self.fail_on = set(fail_on)
+        self.on_call = on_call
+
+    def __call__(self, topic_key):
+        self.calls.append(topic_key)
+        if self.on_call is not None:
+            self.on_call(topic_key)
+        if topic_key in self.fail_on:
+            raise RuntimeError(f"summary of {topic_key} failed")
+
+
+def make_scheduler(topics, summarize, precompute=None, **overrides):
+    config = dict(check_interval=0.01, idle_window=60, max_idle_requests=2, max_topics_per_run=3)
+    config.update(overrides)
+    return IdleSummaryScheduler(find_backlog=lambda: list(topics), summarize=summarize,
+                                precompute=precompute, **config)
+
+
+def test_runs_only_while_idle():
+    summarize, precompute = Recorder(), Recorder()
+    scheduler = make_scheduler(['a', 'b'], summarize, precompute)
+    for _ in range(3):
+        scheduler.record_request()
+    assert not scheduler.is_idle()
+    assert scheduler.run_once() == []
+    assert summarize.calls == []
+
+    scheduler = make_scheduler(['a', 'b'], summarize, precompute)
+    scheduler.record_request()
+    assert scheduler.run_once() == ['a', 'b']
+    assert summarize.calls == precompute.calls == ['a', 'b']
+    assert scheduler.get_status()['topics_summarized'] == 2
+
+
+def test_old_requests_leave_the_idle_window():
+    scheduler = make_scheduler(['a'], Recorder(), idle_window=0.05)
+    for _ in range(3):
+        scheduler.record_request()
+    assert not scheduler.is_idle()
+    time.sleep(0.06)
+    assert scheduler.is_idle()
+
+
+def test_topics_per_run_are_limited():
+    summarize = Recorder()
+    scheduler = make_scheduler(['a', 'b', 'c'], summarize, max_topics_per_run=1)
+    assert scheduler.run_once() == ['a']
+    assert summarize.calls == ['a']
+
+
+def test_new_activity_stops_the_run():
+    scheduler = None
+
+    def busy(topic_key):
+        # Requests arrive while the first topic is being summarized
+        for _ in range(3):
+            scheduler.record_request()
+
+    summarize = Recorder(on_call=busy)
+    scheduler = make_scheduler(['a', 'b', 'c'], summarize)
+    assert scheduler.run_once() == ['a']
+    assert summarize.calls == ['a']
+
+
+def test_failed_summary_is_not_counted_or_precomputed():
+    summarize, precompute = Recorder(fail_on={'b'}), Recorder()
+    scheduler = make_scheduler(['a', 'b', 'c'], summarize, precompute)
+    assert scheduler.run_once() == ['a']
+    assert summarize.calls == ['a', 'b']
+    assert precompute.calls == ['a']
+    status = scheduler.get_status()
+    assert status['failures'] == 1
+    assert status['topics_summarized'] == 1
+    assert 'summary of b failed' in status['last_error']
+
+
+def test_background_thread_runs_and_stops():
+    summarize = Recorder()
+    scheduler = make_scheduler(['a'], summarize)
+    scheduler.start()
+    try:
+        assert wait_for(lambda: summarize.calls)
+        assert scheduler.get_status()['running']
+    finally:
+        scheduler.stop()
+    assert summarize.calls
+    assert not scheduler.get_status()['running']
+
+
+def use_summary_backend(chatbot, monkeypatch, **config):
+    router = ModelRouter(provider=FakeProvider(FakeLLMConfig(ttft_distribution='fixed', ttft_median=0.0,
+                                                             tokens_per_second=1e6, **config)))
+    monkeypatch.setattr(chatbot, 'model_router', router)
+    return router
+
+
+def write_backlog(chatbot, topic_key):
+    story = "Hồi đó ở quê cháu ạ, bác hay ra đồng gặt lúa với mấy cô chú trong xóm rồi chiều về nấu cơm. " * 4
+    messages = [{'user': f"{story} Lượt {index}.", 'bot': "Dạ, bác kể tiếp cho cháu nghe với ạ."}
+                for index in range(30)]
+    chatbot.save_chat_history(topic_key, messages)
+    chatbot.save_summary_data(topic_key, {'topic': topic_key, 'summary': 'Tóm tắt cũ', 'summary_version': 3,
+                                          'key_topics': ['quê'], 'important_facts': ['Bác quê Nam Định']})
+    assert chatbot.find_topics_with_summary_backlog() == [topic_key]
+    return messages
+
+
+def read_topic_file(chatbot, topic_key, file_type):
+    with open(chatbot.get_topic_file_path(topic_key, file_type), encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('error_kind', ['unavailable', 'circuit_open'])
+def test_failed_background_summary_keeps_history_and_summary(chatbot_app, monkeypatch, error_kind):
+    chatbot = chatbot_app
+    router = use_summary_backend(chatbot, monkeypatch, error_rate=1.0, error_kinds=('unavailable',))
+    if error_kind == 'circuit_open':
+        breaker = router.get_breaker('summary')
+        for _ in range(breaker.min_calls):
+            breaker.before_call()
+            breaker.record_failure()
+        assert breaker.state == STATE_OPEN
+    messages = write_backlog(chatbot, 'que_huong')
+    summary_before = read_topic_file(chatbot, 'que_huong', 'summary')
+
+    scheduler = IdleSummaryScheduler(find_backlog=chatbot.find_topics_with_summary_backlog,
+                                     summarize=chatbot.summarize_topic_backlog,
+                                     precompute=chatbot.get_summary_prompt_fragment)
+    assert scheduler.run_once() == []
+    assert scheduler.get_status()['failures'] == 1
+
+    assert chatbot.load_chat_history('que_huong') == messages
+    assert read_topic_file(chatbot, 'que_huong', 'summary') == summary_before
+
+
+def test_failed_summary_in_the_request_path_keeps_history(chatbot_app, monkeypatch):
+    chatbot = chatbot_app
+    use_summary_backend(chatbot, monkeypatch, error_rate=1.0, error_kinds=('unavailable',))
+    messages = write_backlog(chatbot, 'que_huong')
+    assert chatbot.manage_context_and_summary('que_huong', messages) == messages
+    assert read_topic_file(chatbot, 'que_huong', 'summary')['summary'] == 'Tóm tắt cũ'
+
+
+def test_background_summary_moves_the_batch_into_the_summary(chatbot_app, monkeypatch):
+    chatbot = chatbot_app
+    use_summary_backend(chatbot, monkeypatch)
+    messages = write_backlog(chatbot, 'que_huong')
+
+    scheduler = IdleSummaryScheduler(find_backlog=chatbot.find_topics_with_summary_backlog,
+                                     summarize=chatbot.summarize_topic_backlog)
+    assert scheduler.run_once() == ['que_huong']
+
+    remaining = chatbot.load_chat_history('que_huong')
+    assert 0 < len(remaining) < len(messages)
+    assert remaining == messages[len(messages) - len(remaining):]
+    summary = read_topic_file(chatbot, 'que_huong', 'summary')
+    assert summary['summary_version'] == 4
+    assert summary['summary'] != 'Tóm tắt cũ'
+    assert 'Bác quê Nam Định' in summary['important_facts']
@@ -0,0 +1,72 @@
+import random
+import re
+
+import pytest
+
+from utils.text_cleaner import StreamingPatternRemover, StreamingTextCleaner, clean_response_text
+
+SAMPLES = [
+    "Dạ **bác** ơi,cháu hiểu rồi.Bác *nhớ* quê lắm phải không?",
+    "# Món ngon quê mình\n\n• Bún bò Huế\n• Bánh bèo → ăn với nước mắm\n\n\n\nBác thích món nào nhất?",
+    "### Lời khuyên\n\n\n**Uống nước** đều đặn,  ngủ sớm.  Dùng `thuốc` đúng giờ nhé!",
+    "Bác ơi***rất quan trọng*** đó:nghỉ ngơi,đi bộ nhẹ.\n## \n\nTiếp theo là `````code````` và * lẻ",
+    "**** ** * *a* **b** ***c*** `d` ``e`` ```f``` # g\n#\n\n  x  ",
+    "  \n\nChào bác!Hôm nay trời đẹp quá.\n\n\n\n\nBác đi dạo chưa?  \n  ",
+    "Câu hỏi:bác có khỏe không?\n# Tiêu đề **đậm**\nNội dung *nghiêng*#không phải tiêu đề",
+]
+
+
+def stream_clean(chunks):
+    cleaner = StreamingTextCleaner()
+    return ''.join(cleaner.feed(chunk) for chunk in chunks) + cleaner.finish()
+
+
+def random_split(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(0, min(12, len(text) - 1))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize('text', SAMPLES)
+def test_whole_text_in_one_chunk(text):
+    assert stream_clean([text]) == clean_response_text(text)
+
+
+@pytest.mark.parametrize('text', SAMPLES)
+def test_character_by_character(text):
+    assert stream_clean(list(text)) == clean_response_text(text)
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_random_splits_match_whole_text_cleaning(seed):
+    rng = random.Random(seed)
+    # Mix of samples so markdown also spans sample boundaries
+    text = ''.join(rng.sample(SAMPLES, rng.randint(1, 3)))
+    chunks = random_split(text, rng)
+    assert stream_clean(chunks) == clean_response_text(text), chunks
+
+
+def test_output_is_emitted_before_finish():
+    cleaner = StreamingTextCleaner()
+    emitted = cleaner.feed("Dạ **bác** ơi, cháu đây. Bác khỏe không")
+    assert emitted.startswith("Dạ bác ơi")
+
+
+HINT_PATTERN = re.compile(r'PHÁT HIỆN CẢM XÚC[^\n:]*:|TRÁNH:[^\n]*')
+HINT_TEXT = "Dạ bác ơi. PHÁT HIỆN CẢM XÚC BUỒN: Cháu hiểu. TRÁNH: Khuyên giải ngay\nBác nghỉ nhé TRÁNH"
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_pattern_split_across_pieces_is_removed(seed):
+    rng = random.Random(seed)
+    remover = StreamingPatternRemover(HINT_PATTERN, ('PHÁT HIỆN ', 'TRÁNH:'))
+    pieces = random_split(HINT_TEXT, rng)
+    output = ''.join(remover.feed(piece) for piece in pieces) + remover.finish()
+    assert output == HINT_PATTERN.sub('', HINT_TEXT)
+    assert remover.removed == 2
+
+
+def test_text_before_an_opener_is_not_held_back():
+    remover = StreamingPatternRemover(HINT_PATTERN, ('PHÁT HIỆN ', 'TRÁNH:'))
+    assert remover.feed("Dạ bác ơi. PHÁT HI") == "Dạ bác ơi. "
+    assert remover.feed("ỆN CẢM XÚC VUI: Hay quá") == ""
+    assert remover.finish() == " Hay quá"
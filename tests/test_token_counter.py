@@ -0,0 +1,116 @@
+import pytest
+
+from utils.llm_provider import FakeLLMConfig, FakeModel, FakeProvider
+from utils.llm_service import LLMService
+from utils.metrics import MetricsCollector
+from utils.token_counter import TokenEstimator, default_estimator, estimate_cost
+
+TEXT = ("Hôm nay bác thấy trong người khỏe hơn, sáng ra vườn tưới rau rồi đi bộ một vòng quanh xóm. "
+        "Chiều con gái gọi điện hỏi thăm, bác vui lắm.")
+REPLY = "Dạ, cháu mừng cho bác quá. Bác nhớ giữ ấm khi ra vườn buổi sáng nhé."
+
+
+@pytest.fixture(autouse=True)
+def fresh_default_estimator(monkeypatch):
+    # LLMService calibrates the shared estimator; keep tests independent of each other
+    monkeypatch.setattr(default_estimator, 'correction', 1.0)
+    monkeypatch.setattr(default_estimator, 'observations', 0)
+
+
+def test_estimates_count_diacritic_syllables_higher():
+    estimator = TokenEstimator()
+    assert estimator.estimate('') == 0
+    assert estimator.estimate("con ban") == 2
+    assert estimator.estimate("người việt") > estimator.estimate("nguoi viet")
+    assert estimator.estimate("2024") == 4
+
+
+@pytest.mark.parametrize('factor', [0.7, 1.5])
+def test_calibration_moves_estimates_toward_reported_counts(factor):
+    estimator = TokenEstimator(smoothing=0.2)
+    raw = estimator.raw_estimate(TEXT)
+    actual = round(raw * factor)
+    errors = []
+    for _ in range(30):
+        errors.append(abs(estimator.estimate(TEXT) - actual))
+        estimator.observe(TEXT, actual)
+    assert errors == sorted(errors, reverse=True)
+    assert estimator.estimate(TEXT) == pytest.approx(actual, abs=1)
+    assert estimator.get_stats()['observations'] == 30
+
+
+def test_calibration_is_clamped_and_ignores_short_texts():
+    estimator = TokenEstimator(smoothing=1.0, max_correction=2.0)
+    estimator.observe("Dạ vâng ạ.", 50)
+    assert estimator.correction == 1.0
+    estimator.observe(TEXT, 10 * round(estimator.raw_estimate(TEXT)))
+    assert estimator.correction == 2.0
+
+
+def test_cost_uses_the_longest_matching_model_prefix():
+    assert estimate_cost('models/gemini-2.5-flash-lite-001', 1_000_000, 0) == pytest.approx(0.10)
+    assert estimate_cost('gemini-2.5-flash', 0, 1_000_000) == pytest.approx(2.50)
+    assert estimate_cost('unknown-model', 1_000_000, 1_000_000) == pytest.approx(2.80)
+
+
+class NoUsageModel(FakeModel):
+    def generate_content(self, *args, **kwargs):
+        response = super().generate_content(*args, **kwargs)
+        response.usage_metadata = None
+        return response
+
+
+class NoUsageProvider(FakeProvider):
+    def create_model(self, model_name, generation_config=None, system_instruction=None):
+        return NoUsageModel(self, model_name, generation_config, system_instruction)
+
+
+def make_service(provider_class=FakeProvider):
+    provider = provider_class(FakeLLMConfig(ttft_distribution='fixed', ttft_median=0.0, tokens_per_second=1e6,
+                                            responder=lambda prompt: REPLY))
+    metrics = MetricsCollector(save_to_file=False, log_metrics=False)
+    return LLMService(api_key=None, model_name='gemini-2.5-flash', provider=provider, metrics=metrics), metrics
+
+
+def test_costs_are_accounted_to_user_and_topic():
+    service, metrics = make_service()
+    _, first, _ = service.generate_response(TEXT, user_id='bac_an', topic='suc_khoe')
+    _, second, _ = service.generate_response(TEXT + " Thêm nữa.", user_id='bac_an', topic='gia_dinh')
+    _, third, _ = service.generate_response(TEXT, user_id='ba_binh')
+
+    summary = metrics.get_token_usage_summary()
+    assert summary['by_user']['bac_an']['calls'] == 2
+    assert summary['by_user']['bac_an']['cost'] == pytest.approx(first['cost'] + second['cost'])
+    assert summary['by_user']['ba_binh']['input_tokens'] == third['input_tokens']
+    assert summary['by_topic']['suc_khoe']['calls'] == 1
+    assert summary['by_topic']['gia_dinh']['calls'] == 1
+    # Without a topic the call is accounted to its route
+    assert summary['by_topic']['chat']['calls'] == 1
+    assert first['cost'] == pytest.approx(estimate_cost('gemini-2.5-flash', first['input_tokens'],
+                                                        first['output_tokens']))
+    assert summary['estimated_share'] == 0.0
+
+
+def test_reported_usage_calibrates_the_shared_estimator():
+    service, _ = make_service()
+    _, usage_info, success = service.generate_response(TEXT)
+    assert success
+    assert not usage_info.get('estimated')
+    # The fake backend reports one token per word, fewer than the local estimate of the prompt
+    assert default_estimator.observations >= 1
+    assert default_estimator.correction < 1.0
+
+
+def test_missing_usage_falls_back_to_local_estimates():
+    service, metrics = make_service(NoUsageProvider)
+    _, usage_info, success = service.generate_response(TEXT, user_id='bac_an')
+    assert success
+    assert usage_info['estimated']
+    assert usage_info['input_tokens'] == default_estimator.estimate(TEXT)
+    assert usage_info['output_tokens'] == default_estimator.estimate(REPLY)
+    assert usage_info['total_tokens'] == usage_info['input_tokens'] + usage_info['output_tokens']
+    assert default_estimator.observations == 0
+
+    summary = metrics.get_token_usage_summary()
+    assert summary['estimated_share'] == 1.0
+    assert summary['by_user']['bac_an']['output_tokens'] == usage_info['output_tokens']
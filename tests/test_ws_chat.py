@@ -0,0 +1,182 @@
+import json
+import queue
+import threading
+
+import pytest
+
+from conftest import CHAT_REPLY, wait_for
+from utils.speculative_engine import SpeculativeEngine
+
+
+class FakeSocket:
+    """The part of a flask_sock socket that ws_chat uses: receive() (None = closed) and send()"""
+
+    def __init__(self):
+        self.incoming = queue.Queue()
+        self.sent = []
+
+    def receive(self):
+        return self.incoming.get(timeout=5)
+
+    def send(self, frame):
+        self.sent.append(frame)
+
+    def push(self, frame):
+        self.incoming.put(frame if isinstance(frame, str) else json.dumps(frame))
+
+    def json_frames(self, frame_type=None, request_id=None):
+        frames = [json.loads(frame) for frame in list(self.sent) if isinstance(frame, str)]
+        return [frame for frame in frames
+                if (frame_type is None or frame['type'] == frame_type)
+                and (request_id is None or frame.get('request_id') == request_id)]
+
+    def events(self, request_id):
+        return self.json_frames('event', request_id)
+
+    def is_done(self, request_id):
+        events = self.events(request_id)
+        return bool(events) and events[-1]['data'].get('done', False)
+
+
+@pytest.fixture
+def ws(chatbot_app):
+    socket = FakeSocket()
+    session = threading.Thread(target=chatbot_app.ws_chat, args=(socket,), daemon=True)
+    session.start()
+    yield socket
+    socket.incoming.put(None)
+    session.join(timeout=5)
+    assert not session.is_alive()
+
+
+def message(request_id, text, topic_key='gia_dinh'):
+    return {'type': 'message', 'request_id': request_id, 'message': text, 'topic_key': topic_key}
+
+
+def reply_text(events):
+    return ''.join(event['data'].get('text', '') for event in events)
+
+
+def test_message_streams_events_tagged_with_the_request_id(chatbot_app, ws):
+    ws.push(message('r1', "Hôm nay bác đi chợ mua được con cá rất tươi"))
+    assert wait_for(lambda: ws.is_done('r1'))
+
+    events = ws.events('r1')
+    assert reply_text(events) == CHAT_REPLY
+    assert [event['event_id'] for event in events] == list(range(1, len(events) + 1))
+    assert len({event['stream_id'] for event in events}) == 1
+    assert chatbot_app.load_chat_history('gia_dinh')[-1]['user'] == "Hôm nay bác đi chợ mua được con cá rất tươi"
+
+
+def test_concurrent_requests_are_multiplexed_by_request_id(ws):
+    ws.push(message('a', "Cháu ơi, tuần sau con trai bác về thăm nhà", 'gia_dinh'))
+    ws.push(message('b', "Dạo này bác hay bị đau lưng vào buổi sáng", 'suc_khoe'))
+    assert wait_for(lambda: ws.is_done('a') and ws.is_done('b'))
+
+    first, second = ws.events('a'), ws.events('b')
+    assert reply_text(first) == reply_text(second) == CHAT_REPLY
+    assert {event['stream_id'] for event in first}.isdisjoint(event['stream_id'] for event in second)
+    assert ws.json_frames('error') == []
+
+
+def test_resume_replays_events_after_last_event_id(ws):
+    ws.push(message('r1', "Bác vừa trồng thêm mấy luống rau cải sau nhà"))
+    assert wait_for(lambda: ws.is_done('r1'))
+    original = ws.events('r1')
+
+    ws.push({'type': 'resume', 'request_id': 'r2', 'stream_id': original[0]['stream_id'], 'last_event_id': 1})
+    assert wait_for(lambda: ws.is_done('r2'))
+    assert [event['data'] for event in ws.events('r2')] == [event['data'] for event in original[1:]]
+
+
+def test_typing_frames_warm_the_topic(chatbot_app, ws, monkeypatch):
+    warmed = []
+    monkeypatch.setattr(chatbot_app, 'speculative_engine', SpeculativeEngine(warm=warmed.append,
+                                                                              min_warm_interval=60))
+    ws.push({'type': 'typing', 'topic_key': 'suc_khoe'})
+    ws.push({'type': 'typing', 'topic_key': 'suc_khoe'})
+    ws.push({'type': 'typing', 'topic_key': 'khong_co'})
+    assert wait_for(lambda: warmed == ['suc_khoe'])
+
+    # Typing pings get no reply, not even for an unknown topic
+    ws.push(message('after', "Bác đang gõ xong rồi, cháu kể chuyện vui đi"))
+    assert wait_for(lambda: ws.is_done('after'))
+    assert ws.json_frames('error') == []
+    assert warmed == ['suc_khoe']
+
+
+class FakeTTS:
+    def __init__(self, audio, success=True):
+        self.audio = audio
+        self.success = success
+        self.texts = []
+
+    def text_to_speech_stream(self, text):
+        self.texts.append(text)
+        return self.audio, {}, self.success
+
+
+def test_tts_audio_is_sent_as_binary_frames(chatbot_app, ws, monkeypatch):
+    audio = bytes(range(256)) * (chatbot_app.AUDIO_FRAME_SIZE // 128) + b'tail'
+    tts = FakeTTS(audio)
+    monkeypatch.setattr(chatbot_app, 'get_tts_service', lambda: tts)
+
+    ws.push({'type': 'tts', 'request_id': 't1', 'text': " Chào bác ạ "})
+    assert wait_for(lambda: ws.json_frames('audio_end', 't1'))
+
+    assert tts.texts == ["Chào bác ạ"]
+    header_index = ws.sent.index(json.dumps({'type': 'audio', 'request_id': 't1', 'format': 'wav',
+                                             'bytes': len(audio)}))
+    binary = ws.sent[header_index + 1:-1]
+    assert all(isinstance(frame, bytes) for frame in binary)
+    assert [len(frame) for frame in binary] == [chatbot_app.AUDIO_FRAME_SIZE] * 2 + [4]
+    assert b''.join(binary) == audio
+
+
+def test_tts_and_chat_share_one_connection(chatbot_app, ws, monkeypatch):
+    monkeypatch.setattr(chatbot_app, 'get_tts_service', lambda: FakeTTS(b'RIFF' * 10))
+    ws.push(message('chat', "Bác muốn nghe cháu kể về thời tiết hôm nay"))
+    ws.push({'type': 'tts', 'request_id': 'voice', 'text': CHAT_REPLY})
+    assert wait_for(lambda: ws.is_done('chat') and ws.json_frames('audio_end', 'voice'))
+
+    assert reply_text(ws.events('chat')) == CHAT_REPLY
+    assert ws.json_frames('audio', 'voice')[0]['bytes'] == 40
+    assert b'RIFF' * 10 in ws.sent
+
+
+@pytest.mark.parametrize('service, error', [
+    (None, 'TTS chưa được cấu hình'),
+    (FakeTTS(b'', success=False), 'Lỗi tổng hợp giọng nói'),
+])
+def test_tts_failures_are_reported_per_request(chatbot_app, ws, monkeypatch, service, error):
+    monkeypatch.setattr(chatbot_app, 'get_tts_service', lambda: service)
+    ws.push({'type': 'tts', 'request_id': 't1', 'text': "Chào bác"})
+    assert wait_for(lambda: ws.json_frames('error', 't1'))
+    assert ws.json_frames('error', 't1')[0]['error'] == error
+    assert ws.json_frames('audio') == []
+
+
+@pytest.mark.parametrize('frame, request_id, error', [
+    ("{không phải json", None, 'Frame không phải JSON hợp lệ'),
+    ("[1, 2, 3]", None, 'Frame phải là JSON object'),
+    ({'type': 'message', 'request_id': 'x', 'message': 42, 'topic_key': 'gia_dinh'}, 'x',
+     'Trường message phải là chuỗi'),
+    ({'type': 'message', 'request_id': 'x', 'message': "  ", 'topic_key': 'gia_dinh'}, 'x',
+     'Tin nhắn không được để trống'),
+    ({'type': 'message', 'request_id': 'x', 'message': "Chào cháu", 'topic_key': 'khong_co'}, 'x',
+     'Chủ đề không hợp lệ: khong_co'),
+    ({'type': 'tts', 'request_id': 'x', 'text': ""}, 'x', 'Không có nội dung để đọc'),
+    ({'type': 'resume', 'request_id': 'x', 'stream_id': 'abc', 'last_event_id': 'abc'}, 'x',
+     'last_event_id không hợp lệ: abc'),
+    ({'type': 'resume', 'request_id': 'x', 'stream_id': 'khong_co'}, 'x',
+     'Stream không tồn tại hoặc đã hết hạn'),
+    ({'type': 'upload', 'request_id': 'x'}, 'x', 'Loại frame không hỗ trợ: upload'),
+])
+def test_malformed_frames_are_rejected_without_closing_the_session(ws, frame, request_id, error):
+    ws.push(frame)
+    assert wait_for(lambda: ws.json_frames('error'))
+    assert ws.json_frames('error') == [{'type': 'error', 'request_id': request_id, 'error': error}]
+
+    ws.push(message('next', "Bác vẫn ở đây, mình nói chuyện tiếp nhé"))
+    assert wait_for(lambda: ws.is_done('next'))
+    assert reply_text(ws.events('next')) == CHAT_REPLY
@@ -6,15 +6,51 @@ This package contains utility modules for the elderly care chatbot pipeline:
 - STT (Speech-to-Text) using Azure Speech Services
 - LLM (Large Language Model) using Google Gemini
 - TTS (Text-to-Speech) using Azure Speech Services
-- Metrics for performance monitoring
+- Metrics for performance monitoring (incl. per-phase latency histograms)
+- Extractive pre-summarizer for conversation batches
+- Model router mapping task types to models
+- Idle-time summarization scheduler
+- Incremental cleaner for streamed responses
+- Coalescing of streamed text into fewer SSE events
+- Resumable per-stream event buffers
+- Speculative session warm-up and quick replies
+- Hedged streaming calls with per-attempt timeouts
+- gzip/brotli response compression (streaming-aware)
+- LRU/TTL response cache with optional disk tier
+- Semantic cache for near-duplicate questions (hashed n-gram embeddings)
+- Pluggable LLM providers (Gemini, offline fake for load testing)
+- Per-route circuit breakers with adaptive timeouts
+- Sentence budget that cuts streamed replies after N sentences
+- System-prompt variants with token accounting and rule-deduplicating compression
 """
 
 from .stt_service import STTService
-from .llm_service import LLMService  
+from .llm_service import LLMService, BatchResult
 from .azure_tts_service import AzureTTSService
-from .metrics import MetricsCollector
+from .metrics import MetricsCollector, RequestTrace
+from .extractive_summarizer import ExtractiveSummarizer
+from .model_router import ModelRouter, ModelRoute
+from .summary_scheduler import IdleSummaryScheduler
+from .text_cleaner import StreamingTextCleaner, StreamingPatternRemover
+from .stream_coalescer import StreamCoalescer
+from .stream_buffer import StreamBuffer, StreamRegistry
+from .speculative_engine import SpeculativeEngine
+from .hedged_stream import HedgedStreamer
+from .compression import StreamCompressor
+from .response_cache import ResponseCache
+from .semantic_cache import SemanticCache, HashedNgramEmbedder
+from .llm_provider import LLMProvider, GeminiProvider, FakeProvider, FakeLLMConfig
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .sentence_budget import SentenceBudget
+from .prompt_registry import PromptRegistry, compress_prompt
 
-__all__ = ['STTService', 'LLMService', 'AzureTTSService', 'MetricsCollector']
+__all__ = ['STTService', 'LLMService', 'BatchResult', 'AzureTTSService', 'MetricsCollector',
+           'RequestTrace', 'ExtractiveSummarizer', 'ModelRouter', 'ModelRoute', 'IdleSummaryScheduler',
+           'StreamingTextCleaner', 'StreamingPatternRemover', 'StreamCoalescer', 'StreamBuffer', 'StreamRegistry',
+           'SpeculativeEngine', 'HedgedStreamer', 'StreamCompressor', 'ResponseCache',
+           'SemanticCache', 'HashedNgramEmbedder', 'LLMProvider', 'GeminiProvider', 'FakeProvider',
+           'FakeLLMConfig', 'CircuitBreaker', 'CircuitOpenError',
+           'SentenceBudget', 'PromptRegistry', 'compress_prompt']
 
 __version__ = '1.0.0'
 __author__ = 'IEC Team'
@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict
+
+# Circuit states
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker with half-open probing and latency-derived timeouts
+
+    The circuit opens when the failure rate of the calls in the last window_seconds
+    reaches failure_rate_threshold (with at least min_calls calls). After open_seconds
+    it lets half_open_max_calls probe calls through: a successful probe closes it,
+    a failed one opens it again.
+    """
+
+    def __init__(self, name: str = 'default', failure_rate_threshold: float = 0.5,
+                 window_seconds: float = 60.0, min_calls: int = 5, open_seconds: float = 30.0,
+                 half_open_max_calls: int = 1, timeout_quantile: float = 0.99,
+                 timeout_multiplier: float = 2.0, min_timeout: float = 2.0, max_timeout: float = 60.0,
+                 default_timeout: float = 30.0, latency_window: int = 200,
+                 clock: Callable[[], float] = time.time):
+        """
+        Initialize circuit breaker
+
+        Args:
+            name: Name used in logs and errors (the model route)
+            failure_rate_threshold: Failure rate (0-1) that opens the circuit
+            window_seconds: Seconds of call results considered for the failure rate
+            min_calls: Minimum calls in the window before the circuit can open
+            open_seconds: Seconds the circuit stays open before probing
+            half_open_max_calls: Probe calls allowed at the same time while half-open
+            timeout_quantile: Latency quantile of successful calls the timeout is based on
+            timeout_multiplier: Headroom factor applied to that quantile
+            min_timeout: Lower bound of the adaptive timeout
+            max_timeout: Upper bound of the adaptive timeout
+            default_timeout: Timeout until enough latency samples are collected
+            latency_window: Number of recent successful call latencies kept
+            clock: Time source in seconds (replaceable in tests)
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.timeout_quantile = timeout_quantile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.default_timeout = default_timeout
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._results = deque()  # (timestamp, success)
+        self._latencies = deque(maxlen=latency_window)
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        """Current state (an open circuit turns half-open once open_seconds have passed)"""
+        with self._lock:
+            return self._current_state(self.clock())
+
+    def _current_state(self, now: float) -> str:
+        """State at now (lock held)"""
+        if self._state == STATE_OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = STATE_HALF_OPEN
+            self._probes_in_flight = 0
+            self.logger.info(f"Circuit '{self.name}' half-open, probing")
+        return self._state
+
+    def before_call(self):
+        """
+        Reserve permission for one call
+
+        Raises:
+            CircuitOpenError: The circuit is open, or half-open with all probe slots taken
+        """
+        now = self.clock()
+        with self._lock:
+            state = self._current_state(now)
+            if state == STATE_CLOSED:
+                return
+            if state == STATE_HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return
+            self.rejected += 1
+            retry_after = max(0.0, self._opened_at + self.open_seconds - now)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self, latency: float = None):
+        """Record a successful call and its latency (seconds)"""
+        self._record(True, latency)
+
+    def record_failure(self):
+        """Record a failed or timed out call"""
+        self._record(False, None)
+
+    def release(self):
+        """End a call stopped by the caller (early stream close, cancellation) without recording a result"""
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _record(self, success: bool, latency: float = None):
+        now = self.clock()
+        with self._lock:
+            if success and latency is not None:
+                self._latencies.append(latency)
+
+            if self._state == STATE_HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if success:
+                    self._state = STATE_CLOSED
+                    self._results.clear()
+                    self.logger.info(f"Circuit '{self.name}' closed after successful probe")
+                else:
+                    self._open(now)
+                return
+            if self._state == STATE_OPEN:
+                # Call that started before the circuit opened
+                return
+
+            self._results.append((now, success))
+            while self._results and now - self._results[0][0] > self.window_seconds:
+                self._results.popleft()
+            calls = len(self._results)
+            failures = sum(1 for _, ok in self._results if not ok)
+            if calls >= self.min_calls and failures / calls >= self.failure_rate_threshold:
+                self._open(now)
+
+    def _open(self, now: float):
+        """Open the circuit (lock held)"""
+        self._state = STATE_OPEN
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self.times_opened += 1
+        self.logger.warning(f"Circuit '{self.name}' opened for {self.open_seconds:g}s")
+
+    def get_timeout(self) -> float:
+        """Adaptive call timeout: quantile of recent successful latencies times the multiplier, clamped"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 20:
+            return self.default_timeout
+        index = min(len(samples) - 1, int(self.timeout_quantile * len(samples)))
+        return min(self.max_timeout, max(self.min_timeout, samples[index] * self.timeout_multiplier))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get state, failure rate in the window and current timeout"""
+        now = self.clock()
+        with self._lock:
+            state = self._current_state(now)
+            results = [ok for timestamp, ok in self._results if now - timestamp <= self.window_seconds]
+            retry_after = max(0.0, self._opened_at + self.open_seconds - now) if state == STATE_OPEN else 0.0
+        failures = sum(1 for ok in results if not ok)
+        return {
+            'state': state,
+            'window_calls': len(results),
+            'failure_rate': failures / len(results) if results else 0.0,
+            'retry_after': retry_after,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected,
+            'timeout': self.get_timeout()
+        }
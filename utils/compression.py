@@ -0,0 +1,109 @@
+import gzip
+import zlib
+from typing import Iterable, Iterator, Optional
+
+try:
+    import brotli  # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Preferred order when the client accepts several encodings
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick a response encoding from an Accept-Encoding header
+
+    Args:
+        accept_encoding: Accept-Encoding header value
+
+    Returns:
+        'br', 'gzip' or None when no supported encoding is accepted
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        name = parts[0].strip().lower()
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+def compress_body(data: bytes, encoding: str, level: int = 6) -> bytes:
+    """Compress a complete response body"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class StreamCompressor:
+    """Incremental compressor that flushes after every piece so streamed events are not held back"""
+
+    def __init__(self, encoding: str, level: int = 6):
+        """
+        Initialize stream compressor
+
+        Args:
+            encoding: 'br' or 'gzip'
+            level: Compression level (brotli quality is capped at 11)
+        """
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=min(level, 11))
+        elif encoding == 'gzip':
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a piece and sync-flush it (output is decodable up to this point)"""
+        if self.encoding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """Terminate the compressed stream"""
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def compress_stream(pieces: Iterable[str], encoding: str, level: int = 6) -> Iterator[bytes]:
+    """
+    Compress streamed text pieces, flushing after each one
+
+    Args:
+        pieces: Text pieces (e.g. SSE events)
+        encoding: 'br' or 'gzip'
+        level: Compression level
+
+    Yields:
+        Compressed bytes for each piece, then the stream trailer
+    """
+    compressor = StreamCompressor(encoding, level)
+    try:
+        for piece in pieces:
+            yield compressor.compress(piece.encode('utf-8'))
+    finally:
+        close = getattr(pieces, 'close', None)
+        if close is not None:
+            close()
+    yield compressor.finish()
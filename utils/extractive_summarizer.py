@@ -0,0 +1,243 @@
+import math
+import re
+import logging
+from collections import Counter
+from typing import Dict, Any, List
+
+from .token_counter import estimate_tokens
+
+# Sentence boundaries: end punctuation followed by whitespace, or line breaks
+_SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?…])\s+|\n+")
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+_NUMBER_PATTERN = re.compile(r"\d")
+
+# Greetings, fillers and closers that carry no facts about the user
+_BOILERPLATE_PATTERN = re.compile(
+    r"^(xin )?chào|^dạ vâng|^vâng ạ|^cháu đây|^cháu hiểu|^ôi|^à|"
+    r"có muốn chia sẻ gì|kể cháu nghe|cháu luôn lắng nghe|có cháu ở đây|"
+    r"(bác|cô|chú|ông|bà) (còn )?nhớ không|"
+    r"(bác|cô|chú|ông|bà) (thấy )?(khỏe|đỡ hơn)[^.!?]*(không|chưa)",
+    re.IGNORECASE
+)
+
+# Function syllables that should not drive TF-IDF scores
+VIETNAMESE_STOPWORDS = {
+    'à', 'ạ', 'ơi', 'ừ', 'dạ', 'vâng', 'nhé', 'nha', 'nhỉ', 'lắm', 'quá', 'thôi',
+    'bác', 'cháu', 'cô', 'chú', 'ông', 'bà', 'mình', 'tôi', 'tui', 'em', 'anh', 'chị',
+    'là', 'và', 'của', 'có', 'không', 'thì', 'mà', 'này', 'đó', 'kia', 'cũng', 'được',
+    'với', 'cho', 'một', 'những', 'các', 'rất', 'đã', 'đang', 'sẽ', 'vậy', 'thế', 'như',
+    'để', 'khi', 'ở', 'trong', 'ra', 'vào', 'lại', 'rồi', 'người', 'nào', 'gì', 'sao',
+    'chưa', 'đi', 'nên', 'hay', 'hơn', 'thật', 'chút', 'nữa', 'luôn', 'ấy', 'đây'
+}
+
+# Emotion keywords shared with detect_emotion_and_optimize_response in chatbot.py
+EMOTION_KEYWORDS = {
+    'buồn': ['buồn', 'khóc', 'cô đơn', 'một mình', 'chán nản', 'tủi thân', 'u uất'],
+    'nhớ_quê': ['nhớ', 'quê', 'xa nhà', 'nước ngoài', 'hoài niệm', 'hương', 'làng'],
+    'lo_lắng': ['lo', 'sợ', 'băn khoăn', 'không biết', 'thế nào', 'làm sao', 'tìm đâu'],
+    'vui': ['vui', 'hạnh phúc', 'tốt', 'khỏe', 'hài lòng', 'sung sướng', 'phấn khích'],
+    'bệnh_tật': ['đau', 'ốm', 'bệnh', 'mệt', 'yếu', 'thuốc', 'khó chịu'],
+    'gia_đình': ['con', 'cháu', 'vợ', 'chồng', 'anh em', 'họ hàng', 'thăm']
+}
+
+
+class ExtractiveSummarizer:
+    """Local extractive pre-summarizer that shrinks conversation batches before LLM summarization"""
+
+    def __init__(self, keep_ratio: float = 0.4, min_sentences: int = 1,
+                 max_sentences: int = 3, user_max_tokens: int = 120,
+                 entity_bonus: float = 1.0, emotion_bonus: float = 0.5):
+        """
+        Initialize extractive summarizer
+
+        Args:
+            keep_ratio: Fraction of bot sentences kept per turn
+            min_sentences: Minimum sentences kept per bot turn
+            max_sentences: Maximum sentences kept per bot turn
+            user_max_tokens: User turns longer than this are compressed too
+            entity_bonus: Score bonus for sentences with named entities or numbers
+            emotion_bonus: Score bonus for sentences with emotion keywords
+        """
+        self.keep_ratio = keep_ratio
+        self.min_sentences = min_sentences
+        self.max_sentences = max_sentences
+        self.user_max_tokens = user_max_tokens
+        self.entity_bonus = entity_bonus
+        self.emotion_bonus = emotion_bonus
+        self.logger = logging.getLogger(__name__)
+
+        self.emotion_terms = {
+            keyword for keywords in EMOTION_KEYWORDS.values() for keyword in keywords
+        }
+
+    def split_sentences(self, text: str) -> List[str]:
+        """Split text into non-empty sentences"""
+        return [s.strip() for s in _SENTENCE_SPLIT_PATTERN.split(text or '') if s and s.strip()]
+
+    def tokenize(self, sentence: str) -> List[str]:
+        """
+        Tokenize a sentence into Vietnamese terms
+
+        Vietnamese words are often two syllables ("huyết áp", "gia đình"), so
+        adjacent syllable bigrams are added next to the single syllables.
+        """
+        syllables = [w.lower() for w in _WORD_PATTERN.findall(sentence)]
+        terms = [s for s in syllables if s not in VIETNAMESE_STOPWORDS]
+        bigrams = [
+            f"{a} {b}" for a, b in zip(syllables, syllables[1:])
+            if a not in VIETNAMESE_STOPWORDS or b not in VIETNAMESE_STOPWORDS
+        ]
+        return terms + bigrams
+
+    def has_named_entity(self, sentence: str) -> bool:
+        """Detect proper nouns (capitalized words after the first) or numbers"""
+        if _NUMBER_PATTERN.search(sentence):
+            return True
+        words = _WORD_PATTERN.findall(sentence)
+        return any(word[0].isupper() for word in words[1:])
+
+    def has_emotion(self, terms: List[str]) -> bool:
+        """Check whether any emotion keyword appears among the sentence terms"""
+        return any(term in self.emotion_terms for term in terms)
+
+    def is_boilerplate(self, sentence: str) -> bool:
+        """Greeting/filler sentences without facts are dropped"""
+        return bool(_BOILERPLATE_PATTERN.search(sentence.strip()))
+
+    def _score_sentences(self, sentences: List[str], idf: Dict[str, float]) -> List[float]:
+        """Score sentences by length-normalized TF-IDF plus entity/emotion bonuses"""
+        scores = []
+        for sentence in sentences:
+            terms = self.tokenize(sentence)
+            entity = self.has_named_entity(sentence)
+            emotion = self.has_emotion(terms)
+
+            if self.is_boilerplate(sentence) and not entity:
+                scores.append(-1.0)
+                continue
+
+            if terms:
+                tf = Counter(terms)
+                score = sum(count * idf.get(term, 0.0) for term, count in tf.items())
+                score /= math.sqrt(len(terms))
+            else:
+                score = 0.0
+
+            if entity:
+                score += self.entity_bonus
+            if emotion:
+                score += self.emotion_bonus
+            scores.append(score)
+        return scores
+
+    def _compute_idf(self, documents: List[List[str]]) -> Dict[str, float]:
+        """Smoothed inverse document frequency over all sentences in the batch"""
+        doc_freq = Counter()
+        for terms in documents:
+            doc_freq.update(set(terms))
+        total = len(documents)
+        return {term: math.log((1 + total) / (1 + freq)) + 1.0 for term, freq in doc_freq.items()}
+
+    def _select(self, sentences: List[str], scores: List[float]) -> str:
+        """Keep the best-scoring sentences, preserving their original order"""
+        candidates = [i for i, score in enumerate(scores) if score >= 0]
+        if not candidates:
+            return ''
+
+        keep = max(self.min_sentences, math.ceil(len(sentences) * self.keep_ratio))
+        keep = min(keep, self.max_sentences, len(candidates))
+
+        best = sorted(candidates, key=lambda i: scores[i], reverse=True)[:keep]
+        return ' '.join(sentences[i] for i in sorted(best))
+
+    def compress_conversations(self, conversations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Compress a batch of user/bot turns
+
+        Args:
+            conversations: Messages with 'user' and 'bot' text
+
+        Returns:
+            New list of messages with the same keys and shortened text
+        """
+        if not conversations:
+            return []
+
+        turns = []
+        documents = []
+        for conv in conversations:
+            user_sentences = self.split_sentences(conv.get('user', ''))
+            bot_sentences = self.split_sentences(conv.get('bot', ''))
+            turns.append((user_sentences, bot_sentences))
+            documents.extend(self.tokenize(s) for s in user_sentences + bot_sentences)
+
+        idf = self._compute_idf(documents)
+
+        compressed = []
+        for conv, (user_sentences, bot_sentences) in zip(conversations, turns):
+            user_text = conv.get('user', '')
+            if estimate_tokens(user_text) > self.user_max_tokens:
+                user_text = self._select(user_sentences, self._score_sentences(user_sentences, idf))
+
+            bot_text = self._select(bot_sentences, self._score_sentences(bot_sentences, idf))
+
+            new_conv = dict(conv)
+            new_conv['user'] = user_text
+            new_conv['bot'] = bot_text
+            compressed.append(new_conv)
+
+        return compressed
+
+
+def conversation_tokens(conversations: List[Dict[str, Any]]) -> int:
+    """Estimated tokens of the user/bot text in a batch"""
+    return sum(estimate_tokens(c.get('user', '')) + estimate_tokens(c.get('bot', '')) for c in conversations)
+
+
+def benchmark_fact_recall(summarizer: ExtractiveSummarizer,
+                          fixtures: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Measure token reduction and fact recall of the extractive stage
+
+    Args:
+        summarizer: Summarizer under test
+        fixtures: Items with 'conversations' and the 'facts' that must survive
+
+    Returns:
+        Dictionary with per-fixture and overall results
+    """
+    results = []
+    total_before = total_after = 0
+    total_facts = total_kept = 0
+
+    for fixture in fixtures:
+        conversations = fixture['conversations']
+        compressed = summarizer.compress_conversations(conversations)
+
+        before = conversation_tokens(conversations)
+        after = conversation_tokens(compressed)
+        kept_text = ' '.join(f"{c['user']} {c['bot']}" for c in compressed).lower()
+        facts = fixture.get('facts', [])
+        missing = [fact for fact in facts if fact.lower() not in kept_text]
+
+        total_before += before
+        total_after += after
+        total_facts += len(facts)
+        total_kept += len(facts) - len(missing)
+
+        results.append({
+            'name': fixture.get('name', f"fixture_{len(results) + 1}"),
+            'tokens_before': before,
+            'tokens_after': after,
+            'reduction': 1 - after / before if before else 0.0,
+            'fact_recall': (len(facts) - len(missing)) / len(facts) if facts else 1.0,
+            'missing_facts': missing
+        })
+
+    return {
+        'fixtures': results,
+        'tokens_before': total_before,
+        'tokens_after': total_after,
+        'reduction': 1 - total_after / total_before if total_before else 0.0,
+        'fact_recall': total_kept / total_facts if total_facts else 1.0
+    }
@@ -0,0 +1,297 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+# Messages from attempt threads
+_CHUNK = 'chunk'
+_END = 'end'
+_ERROR = 'error'
+
+
+class _Attempt:
+    """One upstream streaming call running in its own thread"""
+
+    def __init__(self, attempt_id: int, started_at: float, is_hedge: bool = False):
+        self.attempt_id = attempt_id
+        self.started_at = started_at
+        self.is_hedge = is_hedge
+        self.cancel_event = threading.Event()
+        self.stream = None
+        self.active = True
+        self.done = False
+
+
+class HedgedStreamer:
+    """
+    Streams from an upstream call with per-attempt timeouts and hedging
+
+    A second attempt is started when the first token has not arrived by the observed
+    p95 time-to-first-token; the attempt that produces the first chunk wins and the
+    others are cancelled. Attempts that fail before their first chunk are retried
+    until max_attempts. Failures after the first chunk are raised, since chunks
+    already handed to the caller cannot be replayed from another attempt.
+    """
+
+    def __init__(self, first_token_timeout: float = 15.0, chunk_timeout: float = 20.0,
+                 max_attempts: int = 3, hedge_quantile: float = 0.95,
+                 default_hedge_delay: float = 3.0, min_hedge_delay: float = 0.8,
+                 cancel_stream: Optional[Callable[[Any], None]] = None, window: int = 200,
+                 adaptive_timeout_multiplier: float = None, min_first_token_timeout: float = 3.0):
+        """
+        Initialize hedged streamer
+
+        Args:
+            first_token_timeout: Seconds an attempt may take to produce its first chunk
+            chunk_timeout: Seconds allowed between two chunks of the winning attempt
+            max_attempts: Total attempts per call (first call, hedges and retries)
+            hedge_quantile: Time-to-first-token quantile used as hedge delay
+            default_hedge_delay: Hedge delay until enough samples are collected
+            min_hedge_delay: Lower bound of the hedge delay
+            cancel_stream: Cancels an upstream stream object (optional)
+            window: Number of recent time-to-first-token samples kept
+            adaptive_timeout_multiplier: When set, the first-token timeout becomes p99 time-to-first-token
+                times this factor (between min_first_token_timeout and first_token_timeout)
+            min_first_token_timeout: Lower bound of the adaptive first-token timeout
+        """
+        self.first_token_timeout = first_token_timeout
+        self.chunk_timeout = chunk_timeout
+        self.max_attempts = max_attempts
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.cancel_stream = cancel_stream
+        self.adaptive_timeout_multiplier = adaptive_timeout_multiplier
+        self.min_first_token_timeout = min_first_token_timeout
+        self.logger = logging.getLogger(__name__)
+
+        self._ttft_samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.attempts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    def get_hedge_delay(self) -> float:
+        """Current hedge delay: quantile of recent time-to-first-token samples"""
+        with self._lock:
+            samples = sorted(self._ttft_samples)
+        if len(samples) < 20:
+            return self.default_hedge_delay
+        index = min(len(samples) - 1, int(self.hedge_quantile * len(samples)))
+        return max(self.min_hedge_delay, samples[index])
+
+    def get_first_token_timeout(self) -> float:
+        """Seconds an attempt may take to its first chunk (adaptive when adaptive_timeout_multiplier is set)"""
+        if not self.adaptive_timeout_multiplier:
+            return self.first_token_timeout
+        with self._lock:
+            samples = sorted(self._ttft_samples)
+        if len(samples) < 20:
+            return self.first_token_timeout
+        index = min(len(samples) - 1, int(0.99 * len(samples)))
+        timeout = samples[index] * self.adaptive_timeout_multiplier
+        return min(self.first_token_timeout, max(self.min_first_token_timeout, timeout))
+
+    def stream(self, start_attempt: Callable[[], Iterable[Any]],
+               idle_timeout: Optional[Callable[[], Optional[float]]] = None) -> Iterator[Any]:
+        """
+        Stream chunks from the fastest attempt
+
+        Args:
+            start_attempt: Starts one upstream call and returns its chunk iterable
+            idle_timeout: Returns seconds the caller may wait for the next chunk (None = no limit);
+                when they pass without a chunk, None is yielded so the caller can run timed work
+
+        Yields:
+            Chunks of the winning attempt, and None when idle_timeout passed without a chunk
+
+        Raises:
+            TimeoutError: No attempt produced a chunk in time, or the stream stalled
+            Exception: Last attempt error when every attempt failed
+        """
+        self._count('calls')
+        messages = queue.Queue()
+        attempts = []
+        call_start = time.time()
+        hedge_delay = self.get_hedge_delay()
+        first_token_timeout = self.get_first_token_timeout()
+        last_error = None
+
+        def launch(is_hedge=False):
+            attempt = _Attempt(len(attempts), time.time(), is_hedge)
+            attempts.append(attempt)
+            self._count('attempts')
+            threading.Thread(target=self._pump, args=(attempt, start_attempt, messages),
+                             name=f"hedged-attempt-{attempt.attempt_id}", daemon=True).start()
+            return attempt
+
+        try:
+            launch()
+            winner = None
+            first_chunk = None
+
+            # Phase 1: wait for the first chunk of any attempt
+            while winner is None:
+                now = time.time()
+                active = [attempt for attempt in attempts if attempt.active]
+                deadlines = [attempt.started_at + first_token_timeout for attempt in active]
+                can_hedge = len(attempts) < self.max_attempts and len(active) == 1 and len(attempts) == 1
+                if can_hedge:
+                    deadlines.append(call_start + hedge_delay)
+
+                try:
+                    attempt_id, kind, payload = messages.get(timeout=max(0.0, min(deadlines) - now))
+                except queue.Empty:
+                    now = time.time()
+                    if can_hedge and now >= call_start + hedge_delay:
+                        self._count('hedges')
+                        self.logger.info(f"No first token after {hedge_delay:.2f}s, sending hedge request")
+                        launch(is_hedge=True)
+                        continue
+                    for attempt in active:
+                        if now - attempt.started_at >= first_token_timeout:
+                            self._count('timeouts')
+                            self._cancel(attempt)
+                            last_error = TimeoutError(f"No first token within {first_token_timeout:.1f}s")
+                    if not any(attempt.active for attempt in attempts):
+                        if len(attempts) >= self.max_attempts:
+                            raise last_error
+                        self._count('retries')
+                        launch()
+                    continue
+
+                attempt = attempts[attempt_id]
+                if not attempt.active:
+                    continue
+                if kind == _CHUNK or kind == _END:
+                    winner = attempt
+                    first_chunk = payload if kind == _CHUNK else None
+                    break
+
+                # Error before the first chunk: retry if nothing else is still running
+                attempt.active = False
+                last_error = payload
+                self.logger.warning(f"Attempt {attempt_id} failed before first token: {payload}")
+                if not any(a.active for a in attempts):
+                    if len(attempts) >= self.max_attempts:
+                        raise last_error
+                    self._count('retries')
+                    launch()
+
+            with self._lock:
+                self._ttft_samples.append(time.time() - winner.started_at)
+            if winner.is_hedge:
+                self._count('hedge_wins')
+            for attempt in attempts:
+                if attempt is not winner:
+                    self._cancel(attempt)
+
+            if first_chunk is None:
+                return
+            yield first_chunk
+
+            # Phase 2: follow the winning attempt only
+            last_chunk_at = time.time()
+            while True:
+                timeout = self.chunk_timeout - (time.time() - last_chunk_at)
+                idle = idle_timeout() if idle_timeout is not None else None
+                try:
+                    attempt_id, kind, payload = messages.get(
+                        timeout=max(0.0, timeout if idle is None else min(timeout, idle)))
+                except queue.Empty:
+                    if time.time() - last_chunk_at < self.chunk_timeout:
+                        yield None
+                        continue
+                    self._count('timeouts')
+                    raise TimeoutError(f"Stream stalled for {self.chunk_timeout}s")
+                if attempt_id != winner.attempt_id:
+                    continue
+                if kind == _CHUNK:
+                    last_chunk_at = time.time()
+                    yield payload
+                elif kind == _END:
+                    return
+                else:
+                    raise payload
+        except Exception:
+            self._count('failures')
+            raise
+        finally:
+            # Also runs when the caller stops reading (generator closed)
+            for attempt in attempts:
+                self._cancel(attempt)
+
+    def _count(self, counter: str):
+        """Increment a stats counter (streams of concurrent requests share this instance)"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _pump(self, attempt: _Attempt, start_attempt: Callable[[], Iterable[Any]], messages: queue.Queue):
+        """Read one upstream stream and forward its chunks"""
+        try:
+            attempt.stream = start_attempt()
+            # _cancel may have run while the call was starting, before the stream was set
+            if attempt.cancel_event.is_set():
+                self._cancel_upstream(attempt)
+                self._close(attempt.stream)
+                return
+            iterator = iter(attempt.stream)
+            for chunk in iterator:
+                if attempt.cancel_event.is_set():
+                    self._close(iterator)
+                    return
+                messages.put((attempt.attempt_id, _CHUNK, chunk))
+            attempt.done = True
+            messages.put((attempt.attempt_id, _END, None))
+        except Exception as e:
+            if not attempt.cancel_event.is_set():
+                messages.put((attempt.attempt_id, _ERROR, e))
+
+    def _cancel(self, attempt: _Attempt):
+        """Stop an attempt and its upstream stream"""
+        if attempt.done or attempt.cancel_event.is_set():
+            return
+        attempt.active = False
+        attempt.cancel_event.set()
+        if attempt.stream is not None:
+            self._cancel_upstream(attempt)
+
+    def _cancel_upstream(self, attempt: _Attempt):
+        """Cancel the upstream stream of an attempt through cancel_stream (if set)"""
+        if self.cancel_stream is None:
+            return
+        try:
+            self.cancel_stream(attempt.stream)
+        except Exception as e:
+            self.logger.warning(f"Failed to cancel attempt {attempt.attempt_id}: {e}")
+
+    @staticmethod
+    def _close(stream: Any):
+        """Close a stream or iterator if it supports close()"""
+        close = getattr(stream, 'close', None)
+        if callable(close):
+            close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hedging counters and current hedge delay"""
+        with self._lock:
+            stats = {
+                'calls': self.calls,
+                'attempts': self.attempts,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'retries': self.retries,
+                'timeouts': self.timeouts,
+                'failures': self.failures,
+                'ttft_samples': len(self._ttft_samples)
+            }
+        stats['hedge_delay'] = self.get_hedge_delay()
+        stats['first_token_timeout'] = self.get_first_token_timeout()
+        return stats
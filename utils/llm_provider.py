@@ -0,0 +1,453 @@
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+from google.generativeai.types import content_types
+
+
+class LLMProvider(ABC):
+    """
+    Backend that creates model objects for ModelRouter and LLMService
+
+    Model objects expose the call surface of genai.GenerativeModel that the app uses:
+    generate_content(contents, generation_config=None, stream=False),
+    generate_content_async(...) and start_chat(history=None).
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    def create_model(self, model_name: str, generation_config: Any = None,
+                     system_instruction: str = None) -> Any:
+        """Create a model object"""
+
+    def list_models(self) -> List[str]:
+        """Names of models that support content generation"""
+        return []
+
+    def cancel_stream(self, stream: Any) -> bool:
+        """
+        Stop a streamed response that is no longer read, so the backend stops generating
+
+        The default uses the stream's public cancel() or close(). Without either the
+        stream is only abandoned: generation runs to the end upstream.
+
+        Returns:
+            Whether the upstream call was cancelled
+        """
+        return self._call_cancel(stream)
+
+    def _call_cancel(self, target: Any) -> bool:
+        for method_name in ('cancel', 'close'):
+            method = getattr(target, method_name, None)
+            if callable(method):
+                try:
+                    method()
+                    return True
+                except Exception as e:
+                    logging.getLogger(__name__).warning(f"Cancelling stream failed: {e}")
+                    return False
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Provider counters"""
+        return {'provider': self.name}
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through google-generativeai"""
+
+    name = 'gemini'
+
+    def __init__(self, api_key: str = None):
+        """
+        Initialize Gemini provider
+
+        Args:
+            api_key: Google Gemini API key (None keeps the current genai configuration)
+        """
+        if api_key is not None:
+            genai.configure(api_key=api_key)
+        self.logger = logging.getLogger(__name__)
+        self._warned_no_iterator = False
+
+    def create_model(self, model_name: str, generation_config: Any = None,
+                     system_instruction: str = None) -> genai.GenerativeModel:
+        return genai.GenerativeModel(model_name, generation_config=generation_config,
+                                     system_instruction=system_instruction)
+
+    def list_models(self) -> List[str]:
+        return [model.name for model in genai.list_models()
+                if 'generateContent' in model.supported_generation_methods]
+
+    def cancel_stream(self, stream: Any) -> bool:
+        """
+        Cancel the gRPC/REST iterator behind a streamed GenerateContentResponse
+
+        google-generativeai (0.8.x) exposes no public cancel; the response keeps the
+        transport iterator in the private _iterator attribute. If an SDK upgrade
+        removes it, a warning is logged once and the generic cancel()/close() of
+        the response object is tried instead.
+        """
+        iterator = getattr(stream, '_iterator', None)
+        if iterator is not None:
+            return self._call_cancel(iterator)
+        if not self._warned_no_iterator:
+            self._warned_no_iterator = True
+            self.logger.warning("Streamed Gemini response has no _iterator (SDK changed?): "
+                                "upstream cancellation falls back to the response's cancel()/close()")
+        return super().cancel_stream(stream)
+
+
+# Sentences the fake model builds its replies from
+FAKE_SENTENCES = [
+    "Dạ, cháu nghe bác kể mà thấy vui lắm ạ.",
+    "Bác nhớ uống đủ nước và nghỉ ngơi điều độ nhé.",
+    "Hôm nay trời đẹp, bác có ra ngoài đi dạo một chút không ạ?",
+    "Cháu mong bác lúc nào cũng khỏe mạnh, vui vẻ.",
+    "Bác kể thêm cho cháu nghe về chuyện ngày xưa ở quê đi ạ.",
+    "Nếu thấy trong người không khỏe thì bác nhớ hỏi ý kiến bác sĩ nhé.",
+    "Con cháu ở xa chắc cũng nhớ bác nhiều lắm đấy ạ.",
+    "Mình cùng nhau tìm cách nấu món quê ở đây bác nhé."
+]
+
+
+@dataclass
+class FakeLLMConfig:
+    """Latency, throughput, chunking and error injection of the fake backend"""
+    ttft_distribution: str = 'lognormal'       # 'fixed', 'uniform' or 'lognormal'
+    ttft_median: float = 0.4                   # Seconds to first token (median)
+    ttft_spread: float = 0.5                   # lognormal sigma / uniform half-width (fraction of median)
+    tokens_per_second: float = 80.0            # Generation speed after the first token
+    prompt_tokens_per_second: float = 0.0      # Prefill speed added to TTFT (prompt words ≈ tokens, 0 = none)
+    response_tokens: Tuple[int, int] = (40, 120)  # Reply length range (words ≈ tokens)
+    chunk_pattern: str = 'random'              # 'random' (chunk_tokens range), 'fixed' or 'sentence'
+    chunk_tokens: Tuple[int, int] = (3, 12)
+    error_rate: float = 0.0                    # Probability a call fails before the first token
+    mid_stream_error_rate: float = 0.0         # Probability a stream fails after some chunks
+    error_kinds: Tuple[str, ...] = ('rate_limit', 'unavailable', 'timeout')
+    seed: int = 0
+    responder: Optional[Callable[[str], str]] = field(default=None, repr=False)  # prompt -> reply text
+
+
+_ERRORS = {
+    'rate_limit': lambda: api_exceptions.ResourceExhausted('Fake quota exceeded'),
+    'unavailable': lambda: api_exceptions.ServiceUnavailable('Fake backend unavailable'),
+    'timeout': lambda: api_exceptions.DeadlineExceeded('Fake deadline exceeded'),
+}
+
+
+class _FakePart:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeContent:
+    def __init__(self, text: str):
+        self.role = 'model'
+        self.parts = [_FakePart(text)]
+
+
+class _FakeCandidate:
+    def __init__(self, text: str):
+        self.content = _FakeContent(text)
+        self.finish_reason = 1
+
+
+class _FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    """Complete response or stream chunk with the fields read from Gemini responses"""
+
+    def __init__(self, text: str, usage: _FakeUsage = None):
+        self.text = text
+        self.candidates = [_FakeCandidate(text)]
+        self.usage_metadata = usage
+
+
+class _FakeStream:
+    """Streamed response; close() stops generation like cancelling a real stream"""
+
+    def __init__(self, chunks: Iterator[FakeResponse]):
+        self._chunks = chunks
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> FakeResponse:
+        if self._closed:
+            raise StopIteration
+        return next(self._chunks)
+
+    def close(self):
+        """Stop the stream; safe while another thread is reading it (stops before its next chunk)"""
+        self._closed = True
+        try:
+            self._chunks.close()
+        except ValueError:
+            # Generator running in the reader thread
+            pass
+
+
+class _FakeAsyncStream:
+    """Async streamed response; close() stops it before the next chunk"""
+
+    def __init__(self, plan: 'Dict[str, Any]', model: 'FakeModel'):
+        self._plan = plan
+        self._model = model
+        self._closed = False
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        async for chunk in self._model._aiter_chunks(self._plan):
+            if self._closed:
+                return
+            yield chunk
+
+    def close(self):
+        self._closed = True
+
+
+class FakeChatSession:
+    """In-memory chat session (history as genai Content like the real ChatSession)"""
+
+    def __init__(self, model: 'FakeModel', history: list = None):
+        self.model = model
+        self.history = content_types.to_contents(history) if history else []
+
+    def send_message(self, content: Any, stream: bool = False, **kwargs):
+        user_contents = content_types.to_contents(content)
+        response = self.model.generate_content(self.history + user_contents, stream=stream)
+        if stream:
+            return response
+        self.history.extend(user_contents)
+        self.history.append(genai.protos.Content(role='model', parts=[genai.protos.Part(text=response.text)]))
+        return response
+
+
+class FakeModel:
+    """Deterministic offline model with simulated latency, token rate, chunking and errors"""
+
+    def __init__(self, provider: 'FakeProvider', model_name: str, generation_config: Any = None,
+                 system_instruction: str = None):
+        self.provider = provider
+        self.model_name = model_name
+        self._generation_config = generation_config
+        self._system_instruction = system_instruction
+
+    def start_chat(self, history: list = None) -> FakeChatSession:
+        return FakeChatSession(self, history)
+
+    def generate_content(self, contents: Any, generation_config: Any = None, stream: bool = False,
+                         request_options: Dict[str, Any] = None, **kwargs) -> Any:
+        plan = self.provider._plan_call(self._prompt_text(contents), generation_config or self._generation_config)
+        if stream:
+            return _FakeStream(self._iter_chunks(plan))
+        timeout = self._call_timeout(plan, request_options)
+        time.sleep(plan['ttft'] + plan['generation_time'] if timeout is None else timeout)
+        self._raise_planned_error(plan, timeout)
+        return FakeResponse(plan['text'], plan['usage'])
+
+    async def generate_content_async(self, contents: Any, generation_config: Any = None,
+                                     stream: bool = False, request_options: Dict[str, Any] = None,
+                                     **kwargs) -> Any:
+        plan = self.provider._plan_call(self._prompt_text(contents), generation_config or self._generation_config)
+        if stream:
+            return _FakeAsyncStream(plan, self)
+        timeout = self._call_timeout(plan, request_options)
+        await asyncio.sleep(plan['ttft'] + plan['generation_time'] if timeout is None else timeout)
+        self._raise_planned_error(plan, timeout)
+        return FakeResponse(plan['text'], plan['usage'])
+
+    def _iter_chunks(self, plan: Dict[str, Any]) -> Iterator[FakeResponse]:
+        time.sleep(plan['ttft'])
+        self._raise_planned_error(plan)
+        chunks = plan['chunks']
+        for index, (text, delay) in enumerate(chunks):
+            if index == plan['fail_after_chunk']:
+                self.provider._count('mid_stream_errors')
+                raise api_exceptions.ServiceUnavailable('Fake stream interrupted')
+            time.sleep(delay)
+            yield FakeResponse(text, plan['usage'] if index == len(chunks) - 1 else None)
+
+    async def _aiter_chunks(self, plan: Dict[str, Any]):
+        await asyncio.sleep(plan['ttft'])
+        self._raise_planned_error(plan)
+        chunks = plan['chunks']
+        for index, (text, delay) in enumerate(chunks):
+            if index == plan['fail_after_chunk']:
+                self.provider._count('mid_stream_errors')
+                raise api_exceptions.ServiceUnavailable('Fake stream interrupted')
+            await asyncio.sleep(delay)
+            yield FakeResponse(text, plan['usage'] if index == len(chunks) - 1 else None)
+
+    @staticmethod
+    def _call_timeout(plan: Dict[str, Any], request_options: Dict[str, Any] = None) -> Optional[float]:
+        """Client timeout of a unary call when the simulated call would exceed it, else None"""
+        timeout = (request_options or {}).get('timeout')
+        if timeout is not None and plan['ttft'] + plan['generation_time'] > timeout:
+            return timeout
+        return None
+
+    def _raise_planned_error(self, plan: Dict[str, Any], timeout: float = None):
+        if timeout is not None:
+            self.provider._count('timeouts')
+            raise api_exceptions.DeadlineExceeded(f'Fake call exceeded timeout of {timeout:.2f}s')
+        if plan['error'] is not None:
+            self.provider._count('errors')
+            raise _ERRORS[plan['error']]()
+
+    def _prompt_text(self, contents: Any) -> str:
+        """Plain text of the request (system instruction, history and the new message)"""
+        texts = [self._system_instruction or '']
+        for content in content_types.to_contents(contents):
+            texts.extend(part.text for part in content.parts if part.text)
+        return '\n'.join(texts)
+
+
+class FakeProvider(LLMProvider):
+    """Offline backend for load tests: same prompt and call order give the same replies, delays and errors"""
+
+    name = 'fake'
+    # Call counters are kept for this many recent prompts (chat prompts carry history, so nearly all are new);
+    # a retried or hedged prompt is always recent, an evicted one starts counting again
+    max_tracked_prompts = 4096
+
+    def __init__(self, config: FakeLLMConfig = None):
+        """
+        Initialize fake provider
+
+        Args:
+            config: Latency, throughput, chunking and error settings (default FakeLLMConfig)
+        """
+        self.config = config or FakeLLMConfig()
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._prompt_calls: 'OrderedDict[int, int]' = OrderedDict()
+        self._stats = {'calls': 0, 'errors': 0, 'mid_stream_errors': 0, 'timeouts': 0, 'output_tokens': 0,
+                       'cancelled_streams': 0}
+
+    def create_model(self, model_name: str, generation_config: Any = None,
+                     system_instruction: str = None) -> FakeModel:
+        return FakeModel(self, model_name, generation_config, system_instruction)
+
+    def list_models(self) -> List[str]:
+        return ['models/fake-chat', 'models/fake-lite']
+
+    def cancel_stream(self, stream: Any) -> bool:
+        cancelled = super().cancel_stream(stream)
+        if cancelled:
+            self._count('cancelled_streams')
+        return cancelled
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _plan_call(self, prompt: str, generation_config: Any = None) -> Dict[str, Any]:
+        """Decide reply text, delays and errors of one call (seeded by prompt and call number)"""
+        prompt_key = zlib.crc32(prompt.encode('utf-8'))
+        with self._lock:
+            call_number = self._prompt_calls.get(prompt_key, 0)
+            self._prompt_calls[prompt_key] = call_number + 1
+            self._prompt_calls.move_to_end(prompt_key)
+            if len(self._prompt_calls) > self.max_tracked_prompts:
+                self._prompt_calls.popitem(last=False)
+            self._stats['calls'] += 1
+        rng = random.Random(f"{self.config.seed}:{prompt_key}:{call_number}")
+        config = self.config
+
+        text = config.responder(prompt) if config.responder else self._default_reply(prompt, rng)
+        # Stop sequences first: chunks, token counts and timing all come from the cut text
+        for stop in getattr(generation_config, 'stop_sequences', None) or []:
+            text = text.split(stop, 1)[0]
+        words = text.split()
+        max_tokens = getattr(generation_config, 'max_output_tokens', None)
+        if max_tokens and len(words) > max_tokens:
+            words = words[:max_tokens]
+            text = ' '.join(words)
+
+        error = rng.choice(config.error_kinds) if config.error_kinds and rng.random() < config.error_rate else None
+        chunks = self._split_chunks(words, rng)
+        fail_after_chunk = None
+        if error is None and len(chunks) > 1 and rng.random() < config.mid_stream_error_rate:
+            fail_after_chunk = rng.randint(1, len(chunks) - 1)
+        if error is None:
+            self._count('output_tokens', len(words))
+
+        return {
+            'text': text,
+            'ttft': self._sample_ttft(rng) + self._prefill_time(prompt),
+            'generation_time': len(words) / config.tokens_per_second,
+            'chunks': [(chunk, len(chunk.split()) / config.tokens_per_second) for chunk in chunks],
+            'error': error,
+            'fail_after_chunk': fail_after_chunk,
+            'usage': _FakeUsage(max(1, len(prompt.split())), len(words))
+        }
+
+    def _sample_ttft(self, rng: random.Random) -> float:
+        config = self.config
+        if config.ttft_distribution == 'fixed':
+            return config.ttft_median
+        if config.ttft_distribution == 'uniform':
+            spread = config.ttft_median * config.ttft_spread
+            return max(0.0, rng.uniform(config.ttft_median - spread, config.ttft_median + spread))
+        return rng.lognormvariate(math.log(max(config.ttft_median, 1e-6)), config.ttft_spread)
+
+    def _prefill_time(self, prompt: str) -> float:
+        """Extra time to first token for reading the prompt"""
+        if self.config.prompt_tokens_per_second <= 0:
+            return 0.0
+        return len(prompt.split()) / self.config.prompt_tokens_per_second
+
+    def _default_reply(self, prompt: str, rng: random.Random) -> str:
+        """Reply built from FAKE_SENTENCES (fenced JSON when the prompt asks for a summary)"""
+        if '"summary"' in prompt:
+            return ('```json\n{"summary": "Cuộc trò chuyện thân mật, hỏi thăm sức khỏe.", '
+                    '"personal_info": [], "key_topics": ["sức khỏe"], "important_facts": []}\n```')
+        target = rng.randint(*self.config.response_tokens)
+        sentences = []
+        while sum(len(sentence.split()) for sentence in sentences) < target:
+            sentences.append(rng.choice(FAKE_SENTENCES))
+        return ' '.join(sentences)
+
+    def _split_chunks(self, words: List[str], rng: random.Random) -> List[str]:
+        """Group words into stream chunks according to chunk_pattern (chunks keep their trailing space)"""
+        config = self.config
+        chunks, current = [], []
+        for index, word in enumerate(words):
+            current.append(word)
+            if config.chunk_pattern == 'sentence':
+                boundary = word.endswith(('.', '!', '?'))
+            elif config.chunk_pattern == 'fixed':
+                boundary = len(current) >= config.chunk_tokens[0]
+            else:
+                boundary = len(current) >= rng.randint(*config.chunk_tokens)
+            if boundary or index == len(words) - 1:
+                chunks.append(' '.join(current) + ('' if index == len(words) - 1 else ' '))
+                current = []
+        return chunks
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        config = {key: value for key, value in asdict(self.config).items() if key != 'responder'}
+        return {'provider': self.name, **stats, 'config': config}
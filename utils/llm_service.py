@@ -1,14 +1,109 @@
 import google.generativeai as genai
 import logging
+import threading
 import time
-from typing import Optional, Tuple, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from functools import lru_cache
+from typing import Optional, Tuple, Dict, Any, Iterator, AsyncIterator, List, Callable
 import json
 
+from .model_router import (ModelRouter, ModelRoute, TASK_CHAT, TASK_TIPS,
+                           TASK_EMOTION, TASK_CONNECTION_TEST)
+from .response_cache import ResponseCache, make_cache_key
+from .semantic_cache import SemanticCache
+from .token_counter import default_estimator, estimate_cost
+from .metrics import MetricsCollector
+from .llm_provider import LLMProvider, GeminiProvider
+from .circuit_breaker import CircuitOpenError
+from .sentence_budget import SentenceBudget, truncate_sentences
+
+# Routes whose responses are cached by default, with their TTL in seconds
+# (chat and emotion replies depend on the conversation and are never cached unless asked)
+CACHED_TASK_TTLS = {
+    TASK_TIPS: 6 * 3600,
+    TASK_CONNECTION_TEST: 300
+}
+
+# Canned replies returned at once while a route's circuit is open (see ModelRouter circuit breakers)
+FALLBACK_RESPONSES = {
+    TASK_CHAT: "Dạ, cháu đang hơi chậm một chút. Bác chờ cháu một lát rồi nói lại với cháu nhé ạ.",
+    TASK_TIPS: "Bác nhớ uống đủ nước, ăn uống điều độ và nghỉ ngơi hợp lý nhé ạ.",
+    TASK_EMOTION: "Dạ, cháu vẫn ở đây lắng nghe bác. Bác cứ từ từ kể cho cháu nghe nhé ạ."
+}
+DEFAULT_FALLBACK_RESPONSE = "Dạ, hệ thống đang bận một chút. Bác thử lại sau ít phút nhé ạ."
+
+# Output length of context chat replies, matching the "4-5 sentences" rule of the prompt
+CHAT_MAX_TOKENS = 300
+CHAT_MAX_SENTENCES = 5
+# The model sometimes keeps writing the next turn of the conversation transcript
+CHAT_STOP_SEQUENCES = ("\nNgười dùng:", "\nUser:")
+
+@lru_cache(maxsize=32)
+def build_generation_config(temperature: float, max_tokens: int,
+                            stop_sequences: Tuple[str, ...] = None) -> genai.types.GenerationConfig:
+    """
+    Shared generation config for (temperature, max_tokens, stop_sequences)
+    
+    Configs are built once and reused by every call; treat them as read-only.
+    """
+    return genai.types.GenerationConfig(
+        temperature=temperature,
+        max_output_tokens=max_tokens,
+        stop_sequences=list(stop_sequences) if stop_sequences else None,
+        candidate_count=1
+    )
+
+@dataclass
+class BatchResult:
+    """Result of one prompt of a batch"""
+    index: int
+    prompt: str
+    text: str = ""
+    usage_info: Dict[str, Any] = field(default_factory=dict)
+    success: bool = False
+    error: Optional[str] = None
+    attempts: int = 0
+    duration: float = 0.0
+
+class _RateLimiter:
+    """Spaces out requests to a maximum rate and pauses all workers after a rate-limit error"""
+    
+    def __init__(self, requests_per_minute: float = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+    
+    def wait(self):
+        """Block until the next request may be sent"""
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+    
+    def pause(self, seconds: float):
+        """Hold back every worker for a while (after HTTP 429 / quota errors)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.time() + seconds)
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    """Whether an API error means the request rate or quota was exceeded"""
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in ('resourceexhausted', 'toomanyrequests', '429', 'quota', 'rate limit'))
+
 class LLMService:
     """Google Gemini AI service for natural language processing"""
     
     def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash", 
-                 temperature: float = 0.7, max_tokens: int = 1000):
+                 temperature: float = 0.7, max_tokens: int = 1000,
+                 routes: Dict[str, ModelRoute] = None, cache: ResponseCache = None,
+                 semantic_cache: SemanticCache = None, metrics: MetricsCollector = None,
+                 provider: LLMProvider = None):
         """
         Initialize LLM service with Gemini API
         
@@ -17,6 +112,11 @@ class LLMService:
             model_name: Model to use (default: gemini-1.5-flash)
             temperature: Response randomness (0.0-1.0)
             max_tokens: Maximum response length
+            routes: Model route overrides for utility tasks (tips, emotion, connection test)
+            cache: Response cache (default: in-memory ResponseCache; pass one with cache_dir for a disk tier)
+            semantic_cache: Cache for near-duplicate health questions (default: SemanticCache, 7 day TTL)
+            metrics: Collector receiving per-call token usage and cost (optional)
+            provider: LLM backend (default: GeminiProvider configured with api_key; FakeProvider for offline load tests)
         """
         self.api_key = api_key
         self.model_name = model_name
@@ -24,62 +124,385 @@ class LLMService:
         self.max_tokens = max_tokens
         self.logger = logging.getLogger(__name__)
         
-        # Configure Gemini
-        genai.configure(api_key=api_key)
+        # Configure backend (Gemini unless another provider is given)
+        self.provider = provider or GeminiProvider(api_key)
         
         # Initialize model
-        self.model = genai.GenerativeModel(model_name)
+        self.model = self.provider.create_model(model_name)
+        
+        # Utility tasks go to their own (lighter) routes; chat stays on model_name
+        self.router = ModelRouter(routes, provider=self.provider)
+        self.router.update_route(TASK_CHAT, model_name=model_name)
+        
+        # Identical utility prompts (tips, connection test) are answered from cache
+        self.cache = cache if cache is not None else ResponseCache()
+        # Differently worded versions of the same health question reuse the earlier answer
+        self.semantic_cache = semantic_cache if semantic_cache is not None else SemanticCache(
+            ttl=7 * 24 * 3600, scope_idle_ttl=7 * 24 * 3600)
+        self.metrics = metrics
         
         # Generation config optimized for elder care (shorter responses)
-        self.generation_config = genai.types.GenerationConfig(
-            temperature=temperature,
-            max_output_tokens=min(max_tokens, 500),  # Limit for brevity
-            candidate_count=1
-        )
+        # Calls never change it; per-call settings use their own prebuilt config
+        self.generation_config = build_generation_config(temperature, min(max_tokens, 500))  # Limit for brevity
+        self._config_lock = threading.Lock()
     
-    def generate_response(self, prompt: str, system_prompt: str = None) -> Tuple[str, Dict[str, Any], bool]:
+    def generate_response(self, prompt: str, system_prompt: str = None,
+                          task: str = TASK_CHAT, use_cache: bool = None,
+                          cache_scope: str = None, cache_ttl: float = None,
+                          generation_config: genai.types.GenerationConfig = None,
+                          user_id: str = None, topic: str = None) -> Tuple[str, Dict[str, Any], bool]:
         """
         Generate response using Gemini AI
         
         Args:
             prompt: User input text
             system_prompt: System/context prompt
+            task: Model route to use (chat, tips, emotion, ...)
+            use_cache: True/False to force or bypass the response cache (default: by route, see CACHED_TASK_TTLS)
+            cache_scope: Extra cache key part (e.g. the date for once-per-day content)
+            cache_ttl: Seconds the cached response stays valid (default: route TTL)
+            generation_config: Per-call config override (chat route only)
+            user_id: User the tokens are accounted to (see metrics)
+            topic: Topic the tokens are accounted to (default: the route)
             
         Returns:
-            Tuple of (response_text, usage_info, success)
+            Tuple of (response_text, usage_info, success); while the route's circuit is open the text is
+            a canned fallback, success is False and usage_info['fallback'] is True
         """
         try:
-            # Combine system prompt and user prompt
-            if system_prompt:
-                full_prompt = f"{system_prompt}\n\nUser: {prompt}\nAssistant:"
-            else:
-                full_prompt = prompt
-            
-            self.logger.info(f"Generating response for prompt: {prompt[:100]}...")
-            
-            # Generate response
-            response = self.model.generate_content(
-                full_prompt,
-                generation_config=self.generation_config
-            )
+            return self._generate(prompt, system_prompt, task, use_cache, cache_scope, cache_ttl, generation_config,
+                                  user_id, topic)
+        
+        except CircuitOpenError as e:
+            return self._fallback_response(task, e)
+        except Exception as e:
+            self.logger.error(f"Error generating response: {str(e)}")
+            return "", {}, False
+    
+    def _generate(self, prompt: str, system_prompt: str = None, task: str = TASK_CHAT,
+                  use_cache: bool = None, cache_scope: str = None, cache_ttl: float = None,
+                  generation_config: genai.types.GenerationConfig = None,
+                  user_id: str = None, topic: str = None) -> Tuple[str, Dict[str, Any], bool]:
+        """generate_response without error handling (API errors are raised)"""
+        full_prompt = self._build_full_prompt(prompt, system_prompt)
+        cache_key = self._get_cache_key(task, full_prompt, generation_config, use_cache, cache_scope)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+        
+        self.logger.info(f"Generating response for prompt: {prompt[:100]}...")
+        
+        with self.router.acquire(task) as model:
+            model, generation_config = self._resolve_call(task, model, generation_config)
+            response = model.generate_content(full_prompt, generation_config=generation_config,
+                                              request_options={'timeout': self.router.get_timeout(task)})
+        
+        result = self._parse_response(response, task, generation_config, full_prompt, user_id, topic)
+        return self._store_cached(cache_key, result, task, cache_ttl)
+    
+    def generate_batch(self, prompts: List[str], concurrency: int = 4, system_prompt: str = None,
+                       task: str = TASK_CHAT, max_retries: int = 3, requests_per_minute: float = None,
+                       progress_callback: Callable[[int, int, BatchResult], None] = None,
+                       use_cache: bool = None) -> List[BatchResult]:
+        """
+        Generate responses for many prompts with bounded parallel calls
+        
+        Args:
+            prompts: Prompts to run
+            concurrency: Maximum calls in flight (the route concurrency limit also applies)
+            system_prompt: System prompt shared by all prompts
+            task: Model route to use
+            max_retries: Extra attempts per prompt after a failed call
+            requests_per_minute: Client-side rate limit (None = no limit)
+            progress_callback: Called as (completed, total, result) after each prompt
+            use_cache: Response cache policy (see generate_response)
             
-            # Extract response text
-            if response.candidates and len(response.candidates) > 0:
-                response_text = response.candidates[0].content.parts[0].text
-                
-                # Get usage information
-                usage_info = self._extract_usage_info(response)
-                
-                self.logger.info("Response generated successfully")
-                return response_text, usage_info, True
-            else:
-                self.logger.warning("No response candidates generated")
-                return "", {}, False
-                
+        Returns:
+            One BatchResult per prompt, in input order; failures carry the error instead of raising
+        """
+        total = len(prompts)
+        results: List[Optional[BatchResult]] = [None] * total
+        limiter = _RateLimiter(requests_per_minute)
+        progress_lock = threading.Lock()
+        completed = [0]
+        batch_start = time.time()
+        
+        def run_item(index: int):
+            result = BatchResult(index=index, prompt=prompts[index])
+            item_start = time.time()
+            for attempt in range(max_retries + 1):
+                result.attempts = attempt + 1
+                limiter.wait()
+                try:
+                    result.text, result.usage_info, result.success = self._generate(
+                        prompts[index], system_prompt, task, use_cache
+                    )
+                    if result.success:
+                        result.error = None
+                        break
+                    result.error = "No response candidates generated"
+                except CircuitOpenError as e:
+                    # Wait for the circuit to probe again instead of spending retries on instant rejections
+                    result.error = str(e)
+                    limiter.pause(e.retry_after)
+                    continue
+                except Exception as e:
+                    result.error = str(e)
+                    if _is_rate_limit_error(e):
+                        # Back off every worker, not just this one
+                        limiter.pause(min(60.0, 2.0 ** (attempt + 1)))
+                        continue
+                if attempt < max_retries:
+                    time.sleep(min(10.0, 0.5 * 2 ** attempt))
+            result.duration = time.time() - item_start
+            results[index] = result
+            
+            with progress_lock:
+                completed[0] += 1
+                done = completed[0]
+            if progress_callback is not None:
+                try:
+                    progress_callback(done, total, result)
+                except Exception as e:
+                    self.logger.warning(f"Batch progress callback failed: {e}")
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, total or 1)),
+                                thread_name_prefix="llm-batch") as executor:
+            list(executor.map(run_item, range(total)))
+        
+        failures = sum(1 for result in results if not result.success)
+        self.logger.info(f"Batch of {total} prompts finished in {time.time() - batch_start:.2f}s "
+                         f"({failures} failed)")
+        return results
+    
+    async def agenerate(self, prompt: str, system_prompt: str = None, task: str = TASK_CHAT,
+                        generation_config: genai.types.GenerationConfig = None, use_cache: bool = None,
+                        cache_scope: str = None, cache_ttl: float = None,
+                        user_id: str = None, topic: str = None) -> Tuple[str, Dict[str, Any], bool]:
+        """
+        Async variant of generate_response using the async Gemini client
+        
+        Args:
+            prompt: User input text
+            system_prompt: System/context prompt
+            task: Model route to use (chat, tips, emotion, ...)
+            generation_config: Per-call config override (chat route only)
+            use_cache: True/False to force or bypass the response cache (default: by route)
+            cache_scope: Extra cache key part
+            cache_ttl: Seconds the cached response stays valid (default: route TTL)
+            user_id: User the tokens are accounted to
+            topic: Topic the tokens are accounted to (default: the route)
+            
+        Returns:
+            Tuple of (response_text, usage_info, success); canned fallback while the circuit is open
+        """
+        try:
+            full_prompt = self._build_full_prompt(prompt, system_prompt)
+            cache_key = self._get_cache_key(task, full_prompt, generation_config, use_cache, cache_scope)
+            cached = self._get_cached(cache_key)
+            if cached is not None:
+                return cached
+            
+            self.logger.info(f"Generating response (async) for prompt: {prompt[:100]}...")
+            
+            async with self.router.acquire_async(task) as model:
+                model, generation_config = self._resolve_call(task, model, generation_config)
+                response = await model.generate_content_async(
+                    full_prompt, generation_config=generation_config,
+                    request_options={'timeout': self.router.get_timeout(task)}
+                )
+            
+            result = self._parse_response(response, task, generation_config, full_prompt, user_id, topic)
+            return self._store_cached(cache_key, result, task, cache_ttl)
+        
+        except CircuitOpenError as e:
+            return self._fallback_response(task, e)
         except Exception as e:
             self.logger.error(f"Error generating response: {str(e)}")
             return "", {}, False
     
+    async def astream(self, prompt: str, system_prompt: str = None, task: str = TASK_CHAT,
+                      generation_config: genai.types.GenerationConfig = None) -> AsyncIterator[str]:
+        """
+        Stream response text pieces as Gemini produces them (async)
+        
+        The route slot is held until the stream is consumed or closed; closing it early
+        also cancels the upstream response.
+        
+        Args:
+            prompt: User input text
+            system_prompt: System/context prompt
+            task: Model route to use (chat, tips, emotion, ...)
+            generation_config: Per-call config override (chat route only)
+            
+        Yields:
+            Text pieces of the response
+            
+        Raises:
+            CircuitOpenError: The route's circuit is open
+            Exception: Gemini API errors (pieces already yielded are not repeated)
+        """
+        full_prompt = self._build_full_prompt(prompt, system_prompt)
+        self.logger.info(f"Streaming response (async) for prompt: {prompt[:100]}...")
+        
+        async with self.router.acquire_async(task) as model:
+            model, generation_config = self._resolve_call(task, model, generation_config)
+            response = await model.generate_content_async(full_prompt, generation_config=generation_config,
+                                                          stream=True)
+            finished = False
+            try:
+                async for chunk in response:
+                    text = self._chunk_text(chunk)
+                    if text:
+                        yield text
+                finished = True
+            finally:
+                # Closed early by the consumer: stop generation upstream, not only free the slot
+                if not finished:
+                    self.provider.cancel_stream(response)
+    
+    def generate_stream(self, prompt: str, system_prompt: str = None, task: str = TASK_CHAT,
+                        generation_config: genai.types.GenerationConfig = None) -> Iterator[str]:
+        """
+        Stream response text pieces as Gemini produces them (blocking generator)
+        
+        The route slot is held until the generator is exhausted or closed; closing it early
+        also cancels the upstream response.
+        
+        Args:
+            prompt: User input text
+            system_prompt: System/context prompt
+            task: Model route to use (chat, tips, emotion, ...)
+            generation_config: Per-call config override (chat route only)
+            
+        Yields:
+            Text pieces of the response
+            
+        Raises:
+            CircuitOpenError: The route's circuit is open
+            Exception: Gemini API errors (pieces already yielded are not repeated)
+        """
+        full_prompt = self._build_full_prompt(prompt, system_prompt)
+        self.logger.info(f"Streaming response for prompt: {prompt[:100]}...")
+        
+        with self.router.acquire(task) as model:
+            model, generation_config = self._resolve_call(task, model, generation_config)
+            response = model.generate_content(full_prompt, generation_config=generation_config, stream=True)
+            finished = False
+            try:
+                for chunk in response:
+                    text = self._chunk_text(chunk)
+                    if text:
+                        yield text
+                finished = True
+            finally:
+                # Closed early by the consumer: stop generation upstream, not only free the slot
+                if not finished:
+                    self.provider.cancel_stream(response)
+    
+    def _fallback_response(self, task: str, error: CircuitOpenError) -> Tuple[str, Dict[str, Any], bool]:
+        """Canned reply for a call rejected by an open circuit"""
+        self.logger.warning(f"Returning fallback response: {error}")
+        usage_info = {'fallback': True, 'model': self.router.get_route(task).model_name,
+                      'retry_after': error.retry_after}
+        return FALLBACK_RESPONSES.get(task, DEFAULT_FALLBACK_RESPONSE), usage_info, False
+    
+    def _build_full_prompt(self, prompt: str, system_prompt: str = None) -> str:
+        """Combine system prompt and user prompt"""
+        if system_prompt:
+            return f"{system_prompt}\n\nUser: {prompt}\nAssistant:"
+        return prompt
+    
+    def _resolve_call(self, task: str, routed_model: genai.GenerativeModel,
+                      generation_config: genai.types.GenerationConfig = None):
+        """Model and generation config of a call: chat uses the service model/config, other routes their own"""
+        if task == TASK_CHAT:
+            return self.model, generation_config or self.generation_config
+        return routed_model, None
+    
+    def _parse_response(self, response, task: str, generation_config: genai.types.GenerationConfig = None,
+                        full_prompt: str = None, user_id: str = None,
+                        topic: str = None) -> Tuple[str, Dict[str, Any], bool]:
+        """Extract response text and usage info from a complete response and account its tokens"""
+        if response.candidates and len(response.candidates) > 0:
+            response_text = response.candidates[0].content.parts[0].text
+            
+            # Get usage information
+            usage_info = self._extract_usage_info(response, self.router.get_route(task).model_name,
+                                                  generation_config, full_prompt)
+            if self.metrics is not None:
+                self.metrics.record_token_usage(self.metrics.create_token_usage(
+                    input_tokens=usage_info["input_tokens"],
+                    output_tokens=usage_info["output_tokens"],
+                    model_name=usage_info["model"],
+                    user_id=user_id,
+                    topic=topic or task,
+                    estimated=usage_info.get("estimated", False),
+                    cost=usage_info["cost"]
+                ))
+            
+            self.logger.info("Response generated successfully")
+            return response_text, usage_info, True
+        
+        self.logger.warning("No response candidates generated")
+        return "", {}, False
+    
+    def _get_cache_key(self, task: str, full_prompt: str, generation_config: genai.types.GenerationConfig,
+                       use_cache: Optional[bool], cache_scope: Optional[str]) -> Optional[str]:
+        """Cache key of a call from (model, generation config, normalized prompt), or None when not cached"""
+        if self.cache is None:
+            return None
+        if use_cache is None:
+            use_cache = task in CACHED_TASK_TTLS
+        if not use_cache:
+            if task in CACHED_TASK_TTLS:
+                self.cache.record_bypass()
+            return None
+        
+        if task == TASK_CHAT:
+            config = generation_config or self.generation_config
+            model_name = self.model_name
+            settings = {'temperature': config.temperature, 'max_output_tokens': config.max_output_tokens}
+        else:
+            route = self.router.get_route(task)
+            model_name = route.model_name
+            settings = {'temperature': route.temperature, 'max_output_tokens': route.max_output_tokens}
+        return make_cache_key(model_name, settings, full_prompt, cache_scope)
+    
+    def _get_cached(self, cache_key: Optional[str]) -> Optional[Tuple[str, Dict[str, Any], bool]]:
+        """Cached (response_text, usage_info, True) for a key, or None"""
+        if cache_key is None:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        self.logger.info("Response served from cache")
+        return cached['text'], {**cached['usage_info'], 'cached': True}, True
+    
+    def _store_cached(self, cache_key: Optional[str], result: Tuple[str, Dict[str, Any], bool],
+                      task: str, cache_ttl: float = None) -> Tuple[str, Dict[str, Any], bool]:
+        """Cache a successful result and return it unchanged"""
+        response_text, usage_info, success = result
+        if cache_key is not None and success and response_text:
+            ttl = cache_ttl if cache_ttl is not None else CACHED_TASK_TTLS.get(task)
+            self.cache.set(cache_key, {'text': response_text, 'usage_info': usage_info}, ttl)
+        return result
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get response cache and semantic cache hit-rate metrics"""
+        stats = self.cache.get_stats() if self.cache is not None else {}
+        if self.semantic_cache is not None:
+            stats['semantic'] = self.semantic_cache.get_stats()
+        return stats
+    
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """Text of a streamed chunk ('' for chunks without text parts, e.g. the final safety/usage chunk)"""
+        try:
+            return chunk.text
+        except ValueError:
+            return ""
+    
     def detect_emotion(self, text: str) -> Dict[str, Any]:
         """
         Detect emotion from user text using keyword analysis
@@ -153,47 +576,109 @@ class LLMService:
             Tuple of (response_text, usage_info, success)
         """
         try:
-            # Detect emotion from user input
-            emotion_info = self.detect_emotion(user_input)
-            
-            # Build conversation context
-            context_messages = []
-            
-            if conversation_history:
-                for msg in conversation_history[-3:]:  # Keep last 3 messages (reduced for brevity)
-                    context_messages.append(msg)
-            
-            # Add current user input
-            context_messages.append({"role": "user", "content": user_input})
+            conversation_text, emotion_info = self._prepare_chat_prompt(user_input, conversation_history)
             
-            # Create elder care system prompt with emotion context
-            system_prompt = self._get_elder_care_prompt(emotion_info.get('emotion_context', ''))
-            
-            # Build optimized conversation prompt
-            conversation_text = self._build_optimized_conversation_prompt(
-                context_messages, 
-                system_prompt, 
-                emotion_info
+            # Generate response with a per-call config limited for brevity (shared config untouched)
+            response, usage_info, success = self.generate_response(
+                conversation_text, generation_config=self._build_chat_generation_config()
             )
             
-            # Generate response with optimized settings for brevity
-            original_max_tokens = self.max_tokens
-            self.update_generation_config(max_tokens=300)  # Limit response length
+            # Add emotion info to usage_info
+            usage_info['emotion_detected'] = emotion_info
             
-            response, usage_info, success = self.generate_response(conversation_text)
+            return self._limit_sentences(response, success), usage_info, success
             
-            # Restore original settings
-            self.update_generation_config(max_tokens=original_max_tokens)
+        except Exception as e:
+            self.logger.error(f"Error in chat with context: {str(e)}")
+            return "", {}, False
+    
+    async def achat_with_context(self, user_input: str,
+                                 conversation_history: list = None) -> Tuple[str, Dict[str, Any], bool]:
+        """
+        Async variant of chat_with_context (per-call config, the shared config is not touched)
+        
+        Args:
+            user_input: Current user message
+            conversation_history: Previous conversation messages
             
-            # Add emotion info to usage_info
+        Returns:
+            Tuple of (response_text, usage_info, success)
+        """
+        try:
+            conversation_text, emotion_info = self._prepare_chat_prompt(user_input, conversation_history)
+            
+            response, usage_info, success = await self.agenerate(
+                conversation_text, generation_config=self._build_chat_generation_config()
+            )
             usage_info['emotion_detected'] = emotion_info
             
-            return response, usage_info, success
+            return self._limit_sentences(response, success), usage_info, success
             
         except Exception as e:
             self.logger.error(f"Error in chat with context: {str(e)}")
             return "", {}, False
     
+    async def astream_chat_with_context(self, user_input: str,
+                                        conversation_history: list = None) -> AsyncIterator[str]:
+        """
+        Stream a context- and emotion-aware reply (e.g. to start TTS on the first sentence)
+        
+        Args:
+            user_input: Current user message
+            conversation_history: Previous conversation messages
+            
+        Yields:
+            Text pieces of the response (the stream stops after CHAT_MAX_SENTENCES sentences)
+        """
+        conversation_text, _ = self._prepare_chat_prompt(user_input, conversation_history)
+        budget = SentenceBudget(CHAT_MAX_SENTENCES)
+        stream = self.astream(conversation_text, generation_config=self._build_chat_generation_config())
+        try:
+            async for text in stream:
+                text = budget.feed(text)
+                if text:
+                    yield text
+                if budget.exhausted:
+                    break
+        finally:
+            # Stops the upstream call and frees the route slot right away
+            await stream.aclose()
+    
+    def _build_chat_generation_config(self) -> genai.types.GenerationConfig:
+        """Per-call config of context chat replies (token cap and stop sequences)"""
+        return self._build_generation_config(max_tokens=CHAT_MAX_TOKENS, stop_sequences=CHAT_STOP_SEQUENCES)
+    
+    @staticmethod
+    def _limit_sentences(response: str, success: bool) -> str:
+        """Cut a complete chat reply to CHAT_MAX_SENTENCES sentences"""
+        return truncate_sentences(response, CHAT_MAX_SENTENCES) if success and response else response
+    
+    def _prepare_chat_prompt(self, user_input: str, conversation_history: list = None) -> Tuple[str, Dict[str, Any]]:
+        """Detect emotion and build the conversation prompt; returns (prompt, emotion_info)"""
+        # Detect emotion from user input
+        emotion_info = self.detect_emotion(user_input)
+        
+        # Build conversation context
+        context_messages = []
+        
+        if conversation_history:
+            for msg in conversation_history[-3:]:  # Keep last 3 messages (reduced for brevity)
+                context_messages.append(msg)
+        
+        # Add current user input
+        context_messages.append({"role": "user", "content": user_input})
+        
+        # Create elder care system prompt with emotion context
+        system_prompt = self._get_elder_care_prompt(emotion_info.get('emotion_context', ''))
+        
+        # Build optimized conversation prompt
+        conversation_text = self._build_optimized_conversation_prompt(
+            context_messages, 
+            system_prompt, 
+            emotion_info
+        )
+        return conversation_text, emotion_info
+    
     def _get_elder_care_prompt(self, emotion_context: str = "") -> str:
         """Get specialized prompt for elderly care chatbot with emotion awareness"""
         base_prompt = """Bạn là trợ lý AI thân thiện cho người cao tuổi Việt Nam.
@@ -248,73 +733,109 @@ HỖ TRỢ: Sức khỏe, dinh dưỡng, tâm lý, gia đình, công nghệ đơ
         
         return "\n".join(prompt_parts)
     
-    def _extract_usage_info(self, response) -> Dict[str, Any]:
-        """Extract token usage and other info from response"""
+    def _extract_usage_info(self, response, model_name: str = None,
+                            generation_config: genai.types.GenerationConfig = None,
+                            prompt_text: str = None) -> Dict[str, Any]:
+        """
+        Extract token usage, cost and other info from response (settings of the config used by the call)
+        
+        Missing token counts are estimated locally; real counts calibrate the local estimator.
+        """
         usage_info = {
             "input_tokens": 0,
             "output_tokens": 0,
             "total_tokens": 0,
-            "model": self.model_name,
-            "temperature": self.temperature,
-            "max_tokens": self.max_tokens
+            "model": model_name or self.model_name,
+            "temperature": generation_config.temperature if generation_config else self.temperature,
+            "max_tokens": generation_config.max_output_tokens if generation_config else self.max_tokens
         }
         
         try:
+            response_text = ""
+            if response.candidates and len(response.candidates) > 0:
+                response_text = response.candidates[0].content.parts[0].text
+            
             # Try to extract usage metadata
-            if hasattr(response, 'usage_metadata'):
-                usage = response.usage_metadata
-                usage_info["input_tokens"] = getattr(usage, 'prompt_token_count', 0)
-                usage_info["output_tokens"] = getattr(usage, 'candidates_token_count', 0)
-                usage_info["total_tokens"] = getattr(usage, 'total_token_count', 0)
-            
-            # Estimate if not available
-            if usage_info["total_tokens"] == 0:
-                # Rough estimation: 1 token ≈ 4 characters
-                if response.candidates and len(response.candidates) > 0:
-                    response_text = response.candidates[0].content.parts[0].text
-                    usage_info["output_tokens"] = len(response_text) // 4
-                    usage_info["total_tokens"] = usage_info["input_tokens"] + usage_info["output_tokens"]
+            usage = getattr(response, 'usage_metadata', None)
+            if usage is not None:
+                usage_info["input_tokens"] = getattr(usage, 'prompt_token_count', 0) or 0
+                usage_info["output_tokens"] = getattr(usage, 'candidates_token_count', 0) or 0
+                usage_info["total_tokens"] = getattr(usage, 'total_token_count', 0) or 0
+            
+            # Real counts calibrate the local estimator; missing ones are estimated with it
+            if prompt_text and usage_info["input_tokens"]:
+                default_estimator.observe(prompt_text, usage_info["input_tokens"])
+            if response_text and usage_info["output_tokens"]:
+                default_estimator.observe(response_text, usage_info["output_tokens"])
+            
+            if not usage_info["input_tokens"] and prompt_text:
+                usage_info["input_tokens"] = default_estimator.estimate(prompt_text)
+                usage_info["estimated"] = True
+            if not usage_info["output_tokens"] and response_text:
+                usage_info["output_tokens"] = default_estimator.estimate(response_text)
+                usage_info["estimated"] = True
+            if usage_info.get("estimated") or not usage_info["total_tokens"]:
+                usage_info["total_tokens"] = usage_info["input_tokens"] + usage_info["output_tokens"]
         
         except Exception as e:
             self.logger.warning(f"Could not extract usage info: {e}")
         
+        usage_info["cost"] = estimate_cost(usage_info["model"], usage_info["input_tokens"],
+                                           usage_info["output_tokens"])
         return usage_info
     
-    def test_connection(self) -> bool:
+    def preflight(self, prompt: str, system_prompt: str = None, task: str = TASK_CHAT,
+                  generation_config: genai.types.GenerationConfig = None) -> Dict[str, Any]:
+        """
+        Size a prompt locally before sending it
+        
+        Args:
+            prompt: User input text
+            system_prompt: System/context prompt
+            task: Model route to use
+            generation_config: Per-call config override (chat route only)
+            
+        Returns:
+            Estimated input tokens, output token limit and the maximum cost of the call
+        """
+        full_prompt = self._build_full_prompt(prompt, system_prompt)
+        route = self.router.get_route(task)
+        if task == TASK_CHAT:
+            model_name = self.model_name
+            max_output_tokens = (generation_config or self.generation_config).max_output_tokens
+        else:
+            model_name = route.model_name
+            max_output_tokens = route.max_output_tokens or self.max_tokens
+        input_tokens = default_estimator.estimate(full_prompt)
+        return {
+            'model': model_name,
+            'input_tokens': input_tokens,
+            'max_output_tokens': max_output_tokens,
+            'max_cost': estimate_cost(model_name, input_tokens, max_output_tokens)
+        }
+    
+    def test_connection(self, use_cache: bool = False) -> bool:
         """
         Test Gemini API connection
         
+        Args:
+            use_cache: Reuse a recent successful test instead of calling the API (for callers that poll)
+            
         Returns:
             True if connection is successful
         """
-        try:
-            test_response = self.model.generate_content(
-                "Xin chào! Đây là test kết nối.",
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=10,
-                    temperature=0
-                )
-            )
-            
-            if test_response.candidates and len(test_response.candidates) > 0:
-                self.logger.info("Gemini API connection test successful")
-                return True
-            else:
-                self.logger.error("Gemini API connection test failed: No response")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"Gemini API connection test failed: {e}")
-            return False
+        _, _, success = self.generate_response("Xin chào! Đây là test kết nối.",
+                                               task=TASK_CONNECTION_TEST, use_cache=use_cache)
+        if success:
+            self.logger.info("Gemini API connection test successful")
+        else:
+            self.logger.error("Gemini API connection test failed: No response")
+        return success
     
     def get_available_models(self) -> list:
-        """Get list of available Gemini models"""
+        """Get list of available models of the provider"""
         try:
-            models = []
-            for model in genai.list_models():
-                if 'generateContent' in model.supported_generation_methods:
-                    models.append(model.name)
-            return models
+            return self.provider.list_models()
         except Exception as e:
             self.logger.error(f"Error getting available models: {e}")
             return [self.model_name]
@@ -328,7 +849,8 @@ HỖ TRỢ: Sức khỏe, dinh dưỡng, tâm lý, gia đình, công nghệ đơ
         """
         try:
             self.model_name = model_name
-            self.model = genai.GenerativeModel(model_name)
+            self.model = self.provider.create_model(model_name)
+            self.router.update_route(TASK_CHAT, model_name=model_name)
             self.logger.info(f"Model changed to: {model_name}")
         except Exception as e:
             self.logger.error(f"Error changing model: {e}")
@@ -336,31 +858,47 @@ HỖ TRỢ: Sức khỏe, dinh dưỡng, tâm lý, gia đình, công nghệ đơ
     def update_generation_config(self, temperature: float = None, 
                                 max_tokens: int = None):
         """
-        Update generation configuration
+        Update the default generation configuration
+        
+        The new config object replaces the old one in a single assignment, so calls
+        running in other threads keep using the config they started with.
         
         Args:
             temperature: New temperature value
             max_tokens: New max tokens value
         """
-        if temperature is not None:
-            self.temperature = temperature
-        if max_tokens is not None:
-            self.max_tokens = max_tokens
+        with self._config_lock:
+            if temperature is not None:
+                self.temperature = temperature
+            if max_tokens is not None:
+                self.max_tokens = max_tokens
             
-        self.generation_config = genai.types.GenerationConfig(
-            temperature=self.temperature,
-            max_output_tokens=self.max_tokens,
-            candidate_count=1
-        )
+            self.generation_config = self._build_generation_config()
         
         self.logger.info(f"Generation config updated: temp={self.temperature}, max_tokens={self.max_tokens}")
     
-    def get_health_advice(self, symptom_or_question: str) -> Tuple[str, Dict[str, Any], bool]:
+    def _build_generation_config(self, temperature: float = None, max_tokens: int = None,
+                                 stop_sequences: Tuple[str, ...] = None) -> genai.types.GenerationConfig:
+        """Prebuilt generation config from the service settings with optional per-call overrides"""
+        return build_generation_config(
+            self.temperature if temperature is None else temperature,
+            self.max_tokens if max_tokens is None else max_tokens,
+            stop_sequences
+        )
+    
+    def get_route_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get per-route model, concurrency and latency metrics"""
+        return self.router.get_stats()
+    
+    def get_health_advice(self, symptom_or_question: str, use_cache: bool = True,
+                          profile_scope: str = None) -> Tuple[str, Dict[str, Any], bool]:
         """
         Get health-related advice for elderly
         
         Args:
             symptom_or_question: Health question or symptom description
+            use_cache: Reuse the answer of an identical or near-duplicate question
+            profile_scope: Limits reuse to questions of the same user profile (None = shared)
             
         Returns:
             Tuple of (advice_text, usage_info, success)
@@ -377,12 +915,25 @@ Câu hỏi về sức khỏe: {symptom_or_question}
 Lưu ý: Đây chỉ là thông tin tham khảo, không thay thế ý kiến chuyên môn của bác sĩ.
 """
         
-        return self.generate_response(health_prompt)
+        scope = f"health:{profile_scope}" if profile_scope else "health"
+        if use_cache and self.semantic_cache is not None:
+            cached = self.semantic_cache.lookup(symptom_or_question, scope)
+            if cached is not None:
+                answer, similarity = cached
+                return answer['text'], {**answer['usage_info'], 'cached': True, 'similarity': similarity}, True
+        
+        response, usage_info, success = self.generate_response(health_prompt, task=TASK_TIPS, use_cache=use_cache)
+        if use_cache and success and self.semantic_cache is not None and not usage_info.get('cached'):
+            self.semantic_cache.add(symptom_or_question, {'text': response, 'usage_info': usage_info}, scope)
+        return response, usage_info, success
     
-    def get_daily_tips(self) -> Tuple[str, Dict[str, Any], bool]:
+    def get_daily_tips(self, use_cache: bool = True) -> Tuple[str, Dict[str, Any], bool]:
         """
-        Get daily health and lifestyle tips for elderly
+        Get daily health and lifestyle tips for elderly (generated once per day and shared by all users)
         
+        Args:
+            use_cache: Reuse today's tips (set False to regenerate)
+            
         Returns:
             Tuple of (tips_text, usage_info, success)
         """
@@ -396,7 +947,8 @@ Hãy đưa ra 3-5 lời khuyên hữu ích cho người cao tuổi trong ngày h
 Mỗi lời khuyên nên ngắn gọn, dễ thực hiện và phù hợp với người Việt Nam cao tuổi.
 """
         
-        return self.generate_response(tips_prompt)
+        return self.generate_response(tips_prompt, task=TASK_TIPS, use_cache=use_cache,
+                                      cache_scope=date.today().isoformat(), cache_ttl=24 * 3600)
     
     def test_emotion_detection(self, test_inputs: list = None) -> Dict[str, Any]:
         """
@@ -439,6 +991,25 @@ Mỗi lời khuyên nên ngắn gọn, dễ thực hiện và phù hợp với n
         Returns:
             Tuple of (response_text, usage_info, success)
         """
+        full_prompt, emotion_info = self._prepare_emotion_prompt(user_input)
+        
+        # Generate response with emotion context
+        response, usage_info, success = self.generate_response(full_prompt, task=TASK_EMOTION)
+        
+        # Add emotion info to usage
+        usage_info['emotion_detected'] = emotion_info
+        
+        return response, usage_info, success
+    
+    async def aget_emotion_optimized_response(self, user_input: str) -> Tuple[str, Dict[str, Any], bool]:
+        """Async variant of get_emotion_optimized_response"""
+        full_prompt, emotion_info = self._prepare_emotion_prompt(user_input)
+        response, usage_info, success = await self.agenerate(full_prompt, task=TASK_EMOTION)
+        usage_info['emotion_detected'] = emotion_info
+        return response, usage_info, success
+    
+    def _prepare_emotion_prompt(self, user_input: str) -> Tuple[str, Dict[str, Any]]:
+        """Build the emotion-optimized prompt; returns (prompt, emotion_info)"""
         # Detect emotion
         emotion_info = self.detect_emotion(user_input)
         
@@ -454,10 +1025,4 @@ Mỗi lời khuyên nên ngắn gọn, dễ thực hiện và phù hợp với n
             system_prompt = self._get_elder_care_prompt()
             full_prompt = f"{system_prompt}\n\nNgười dùng: {user_input}\n\nTrả lời ngắn gọn:\nTrợ lý:"
         
-        # Generate response with emotion context
-        response, usage_info, success = self.generate_response(full_prompt)
-        
-        # Add emotion info to usage
-        usage_info['emotion_detected'] = emotion_info
-        
-        return response, usage_info, success
+        return full_prompt, emotion_info
@@ -1,11 +1,16 @@
 import time
 import json
+import threading
 import os
 from datetime import datetime
-from typing import Dict, Any, Optional
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List
 from dataclasses import dataclass, asdict
 import logging
 
+from .token_counter import estimate_cost
+
 @dataclass
 class STTMetrics:
     """Metrics for Speech-to-Text operation"""
@@ -48,6 +53,32 @@ class TTSMetrics:
     success: bool
     error_message: Optional[str] = None
 
+@dataclass
+class StreamMetrics:
+    """Metrics for one streamed chat response"""
+    start_time: float
+    end_time: float
+    total_time: float
+    time_to_first_byte: Optional[float]
+    upstream_chunks: int
+    events_sent: int
+    bytes_sent: int
+    success: bool
+    error_message: Optional[str] = None
+    cancelled: bool = False
+
+@dataclass
+class TokenUsage:
+    """Token usage and cost of one model call"""
+    timestamp: float
+    user_id: str
+    topic: str
+    model_name: str
+    input_tokens: int
+    output_tokens: int
+    cost: float
+    estimated: bool = False  # Counted locally because the API returned no usage metadata
+
 @dataclass
 class PipelineMetrics:
     """Overall pipeline metrics"""
@@ -62,14 +93,72 @@ class PipelineMetrics:
     error_stage: Optional[str] = None
     error_message: Optional[str] = None
 
+class RequestTrace:
+    """Phase spans and per-request samples (e.g. inter-chunk gaps) of one request"""
+    
+    def __init__(self, name: str, start_time: float = None):
+        self.name = name
+        self.start_time = start_time if start_time is not None else time.time()
+        self.spans: Dict[str, float] = {}
+        self.samples: Dict[str, List[float]] = {}
+        self.attributes: Dict[str, Any] = {}
+    
+    @contextmanager
+    def span(self, phase: str):
+        """Time a phase (durations of repeated phases are added up)"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(phase, time.time() - start)
+    
+    def add_span(self, phase: str, duration: float):
+        """Add a measured phase duration in seconds"""
+        self.spans[phase] = self.spans.get(phase, 0.0) + duration
+    
+    def add_sample(self, name: str, value: float):
+        """Add one sample of a repeated measurement"""
+        self.samples.setdefault(name, []).append(value)
+    
+    def finish(self):
+        """Record the total request time"""
+        self.spans['total'] = time.time() - self.start_time
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(percent / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def _add_token_usage(totals_by_dimension: Dict[str, Dict[str, Dict[str, float]]], usage: TokenUsage):
+    """Add one call to per-user, per-topic and per-model totals"""
+    for dimension, key in (('user', usage.user_id), ('topic', usage.topic), ('model', usage.model_name)):
+        totals = totals_by_dimension[dimension].setdefault(
+            key, {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cost': 0.0}
+        )
+        totals['calls'] += 1
+        totals['input_tokens'] += usage.input_tokens
+        totals['output_tokens'] += usage.output_tokens
+        totals['cost'] += usage.cost
+
 class MetricsCollector:
     """Collects and manages performance metrics for the pipeline"""
     
-    def __init__(self, save_to_file: bool = True, log_metrics: bool = True):
+    def __init__(self, save_to_file: bool = True, log_metrics: bool = True,
+                 structured_logs: bool = False, histogram_window: int = 1000):
         self.save_to_file = save_to_file
         self.log_metrics = log_metrics
+        self.structured_logs = structured_logs
+        self.histogram_window = histogram_window
         self.logger = logging.getLogger(__name__)
         self.metrics_history = []
+        self.stream_history = deque(maxlen=500)
+        self.span_histograms: Dict[str, Dict[str, deque]] = {}
+        self._histogram_lock = threading.Lock()
+        self.token_usage_history = deque(maxlen=10000)
+        self._usage_lock = threading.Lock()
+        self.token_totals: Dict[str, Dict[str, Dict[str, float]]] = {'user': {}, 'topic': {}, 'model': {}}
         
     def create_session_id(self) -> str:
         """Generate unique session ID"""
@@ -164,6 +253,159 @@ class MetricsCollector:
             error_message=error_message
         )
     
+    def create_stream_metrics(self, start_time: float, end_time: float,
+                             time_to_first_byte: Optional[float],
+                             upstream_chunks: int, events_sent: int,
+                             bytes_sent: int, success: bool,
+                             error_message: str = None,
+                             cancelled: bool = False) -> StreamMetrics:
+        """Create streaming response metrics object"""
+        return StreamMetrics(
+            start_time=start_time,
+            end_time=end_time,
+            total_time=end_time - start_time,
+            time_to_first_byte=time_to_first_byte,
+            upstream_chunks=upstream_chunks,
+            events_sent=events_sent,
+            bytes_sent=bytes_sent,
+            success=success,
+            error_message=error_message,
+            cancelled=cancelled
+        )
+    
+    def record_stream_metrics(self, metrics: StreamMetrics):
+        """Keep streaming metrics in memory (last 500 responses)"""
+        self.stream_history.append(metrics)
+        if self.log_metrics:
+            ttfb = f"{metrics.time_to_first_byte:.3f}s" if metrics.time_to_first_byte is not None else "n/a"
+            self.logger.info(f"Stream done: ttfb={ttfb}, chunks={metrics.upstream_chunks}, "
+                             f"events={metrics.events_sent}, total={metrics.total_time:.3f}s")
+    
+    def get_stream_summary(self) -> Dict[str, Any]:
+        """Get aggregated streaming metrics (TTFB, events and chunks per response)"""
+        history = list(self.stream_history)
+        summary = {
+            "total_streams": len(history),
+            "cancelled_streams": sum(1 for m in history if m.cancelled),
+            "success_rate": 0.0,
+            "average_ttfb": 0.0,
+            "p95_ttfb": 0.0,
+            "average_total_time": 0.0,
+            "average_upstream_chunks": 0.0,
+            "average_events": 0.0,
+            "average_bytes": 0.0
+        }
+        
+        if history:
+            summary["success_rate"] = sum(1 for m in history if m.success) / len(history) * 100
+            ttfbs = sorted(m.time_to_first_byte for m in history if m.time_to_first_byte is not None)
+            if ttfbs:
+                summary["average_ttfb"] = sum(ttfbs) / len(ttfbs)
+                summary["p95_ttfb"] = ttfbs[int(0.95 * (len(ttfbs) - 1))]
+            summary["average_total_time"] = sum(m.total_time for m in history) / len(history)
+            summary["average_upstream_chunks"] = sum(m.upstream_chunks for m in history) / len(history)
+            summary["average_events"] = sum(m.events_sent for m in history) / len(history)
+            summary["average_bytes"] = sum(m.bytes_sent for m in history) / len(history)
+        
+        return summary
+    
+    def create_token_usage(self, input_tokens: int, output_tokens: int, model_name: str = None,
+                           user_id: str = None, topic: str = None, estimated: bool = False,
+                           cost: float = None) -> TokenUsage:
+        """Create token usage record (cost from MODEL_PRICING unless given)"""
+        return TokenUsage(
+            timestamp=time.time(),
+            user_id=user_id or 'unknown',
+            topic=topic or 'unknown',
+            model_name=model_name or 'unknown',
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cost=estimate_cost(model_name, input_tokens, output_tokens) if cost is None else cost,
+            estimated=estimated
+        )
+    
+    def record_token_usage(self, usage: TokenUsage):
+        """Add a call to the rolling history and the per-user/topic/model totals"""
+        with self._usage_lock:
+            self.token_usage_history.append(usage)
+            _add_token_usage(self.token_totals, usage)
+    
+    def get_token_usage_summary(self, window: float = 86400) -> Dict[str, Any]:
+        """
+        Get token and cost aggregates per user, topic and model
+        
+        Args:
+            window: Rolling window in seconds (default: last 24 hours)
+            
+        Returns:
+            Rolling aggregates over the window and all-time totals
+        """
+        since = time.time() - window
+        with self._usage_lock:
+            recent = [usage for usage in self.token_usage_history if usage.timestamp >= since]
+            all_time = {dimension: {key: dict(totals) for key, totals in by_key.items()}
+                        for dimension, by_key in self.token_totals.items()}
+        
+        rolling = {'user': {}, 'topic': {}, 'model': {}}
+        for usage in recent:
+            _add_token_usage(rolling, usage)
+        
+        return {
+            'window_seconds': window,
+            'calls': len(recent),
+            'input_tokens': sum(usage.input_tokens for usage in recent),
+            'output_tokens': sum(usage.output_tokens for usage in recent),
+            'cost': sum(usage.cost for usage in recent),
+            'estimated_share': sum(1 for usage in recent if usage.estimated) / len(recent) if recent else 0.0,
+            'by_user': rolling['user'],
+            'by_topic': rolling['topic'],
+            'by_model': rolling['model'],
+            'all_time': all_time
+        }
+    
+    def record_trace(self, trace: RequestTrace):
+        """Add the spans and samples of a finished request to the latency histograms"""
+        with self._histogram_lock:
+            histograms = self.span_histograms.setdefault(trace.name, {})
+            for phase, duration in trace.spans.items():
+                histograms.setdefault(phase, deque(maxlen=self.histogram_window)).append(duration)
+            for name, values in trace.samples.items():
+                histograms.setdefault(name, deque(maxlen=self.histogram_window)).extend(values)
+        
+        if self.structured_logs:
+            self.logger.info(json.dumps({
+                'event': 'request_trace',
+                'name': trace.name,
+                'timestamp': datetime.now().isoformat(),
+                'spans_ms': {phase: round(duration * 1000, 1) for phase, duration in trace.spans.items()},
+                'samples': {name: len(values) for name, values in trace.samples.items()},
+                **trace.attributes
+            }, ensure_ascii=False))
+    
+    def get_latency_histograms(self, name: str = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Get p50/p95/p99 per phase (milliseconds) for one trace name or all of them"""
+        # Copy under the lock, sort outside it (record_trace runs in request threads)
+        with self._histogram_lock:
+            names = [name] if name else list(self.span_histograms)
+            snapshot = {
+                trace_name: {phase: list(values) for phase, values in self.span_histograms.get(trace_name, {}).items()}
+                for trace_name in names
+            }
+        result = {}
+        for trace_name, phases in snapshot.items():
+            result[trace_name] = {}
+            for phase, values in phases.items():
+                ordered = sorted(values)
+                result[trace_name][phase] = {
+                    'count': len(ordered),
+                    'avg_ms': sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+                    'p50_ms': _percentile(ordered, 50) * 1000,
+                    'p95_ms': _percentile(ordered, 95) * 1000,
+                    'p99_ms': _percentile(ordered, 99) * 1000,
+                    'max_ms': ordered[-1] * 1000 if ordered else 0.0
+                }
+        return result
+    
     def display_metrics(self, metrics: Any, title: str = "Metrics"):
         """Display metrics in a formatted way"""
         print(f"\n{'='*50}")
@@ -0,0 +1,324 @@
+import asyncio
+import google.generativeai as genai
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from dataclasses import dataclass, asdict, replace
+from typing import Optional, Dict, Any
+
+from .llm_provider import LLMProvider, GeminiProvider
+from .circuit_breaker import CircuitBreaker
+
+# Task types routed to models
+TASK_CHAT = 'chat'
+TASK_SUMMARY = 'summary'
+TASK_TIPS = 'tips'
+TASK_EMOTION = 'emotion'
+TASK_CONNECTION_TEST = 'connection_test'
+
+# Exceptions meaning the caller stopped the call (early stream close, task cancellation)
+CALLER_EXITS = (GeneratorExit, asyncio.CancelledError)
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """Model, generation settings and concurrency limit for one task type"""
+    model_name: str
+    temperature: Optional[float] = None
+    max_output_tokens: Optional[int] = None
+    max_concurrency: int = 4
+
+
+# Interactive chat keeps the full model; background/utility work goes to a lighter one
+DEFAULT_ROUTES = {
+    TASK_CHAT: ModelRoute("gemini-2.5-flash", max_concurrency=16),
+    TASK_SUMMARY: ModelRoute("gemini-2.5-flash-lite", temperature=0.2, max_output_tokens=512, max_concurrency=2),
+    TASK_TIPS: ModelRoute("gemini-2.5-flash-lite", temperature=0.7, max_output_tokens=500, max_concurrency=2),
+    TASK_EMOTION: ModelRoute("gemini-2.5-flash-lite", temperature=0.7, max_output_tokens=300, max_concurrency=4),
+    TASK_CONNECTION_TEST: ModelRoute("gemini-2.5-flash-lite", temperature=0, max_output_tokens=10, max_concurrency=1),
+}
+
+
+class ModelRouter:
+    """Maps task types to models/generation configs with per-route concurrency, latency metrics and circuit breakers"""
+
+    def __init__(self, routes: Dict[str, ModelRoute] = None, latency_window: int = 200,
+                 provider: LLMProvider = None, breaker_config: Dict[str, Any] = None):
+        """
+        Initialize model router
+
+        Args:
+            routes: Route overrides by task type (merged over DEFAULT_ROUTES)
+            latency_window: Number of recent calls kept per route for latency stats
+            provider: Backend creating the model objects (default: GeminiProvider with the current genai configuration)
+            breaker_config: CircuitBreaker settings applied to every route (failure_rate_threshold, open_seconds, ...)
+        """
+        self.routes = dict(DEFAULT_ROUTES)
+        if routes:
+            self.routes.update(routes)
+
+        self.latency_window = latency_window
+        self.provider = provider or GeminiProvider()
+        self.breaker_config = dict(breaker_config or {})
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._models = {}
+        self._semaphores = {}
+        self._stats = {}
+        self._breakers = {}
+        self._async_waiters = {}
+        self._unknown_tasks = set()
+
+        for task in self.routes:
+            self._init_route_state(task)
+
+    def _init_route_state(self, task: str):
+        """(Re)create semaphore, async waiters, stats and circuit breaker for a route"""
+        route = self.routes[task]
+        self._semaphores[task] = threading.BoundedSemaphore(route.max_concurrency)
+        self._async_waiters[task] = []  # (loop, future) of acquire_async callers waiting for a slot
+        self._breakers[task] = CircuitBreaker(task, **self.breaker_config)
+        self._stats[task] = {
+            'calls': 0,
+            'errors': 0,
+            'cancelled': 0,
+            'in_flight': 0,
+            'latencies': deque(maxlen=self.latency_window),
+            'wait_times': deque(maxlen=self.latency_window)
+        }
+
+    def get_route(self, task: str) -> ModelRoute:
+        """Get route for a task type (unknown task types use the chat route)"""
+        return self.routes[self._route_key(task)]
+
+    def _route_key(self, task: str) -> str:
+        """Route a task type runs on: its own, or the chat route when it has none"""
+        if task in self.routes:
+            return task
+        if task not in self._unknown_tasks:
+            self._unknown_tasks.add(task)
+            self.logger.warning(f"No model route for task '{task}', using the '{TASK_CHAT}' route")
+        return TASK_CHAT
+
+    def update_route(self, task: str, **changes):
+        """
+        Change model or settings of a route
+
+        Args:
+            task: Task type
+            **changes: ModelRoute fields to change (model_name, temperature, ...)
+        """
+        with self._lock:
+            if task in self.routes:
+                self.routes[task] = replace(self.routes[task], **changes)
+            else:
+                self.routes[task] = ModelRoute(**changes)
+            self._models = {key: m for key, m in self._models.items() if key[0] != task}
+            self._init_route_state(task)
+        self.logger.info(f"Model route '{task}' updated: {self.routes[task]}")
+
+    def get_generation_config(self, task: str) -> Optional[genai.types.GenerationConfig]:
+        """Build generation config of a route (None when the route uses model defaults)"""
+        route = self.get_route(task)
+        config = {}
+        if route.temperature is not None:
+            config['temperature'] = route.temperature
+        if route.max_output_tokens is not None:
+            config['max_output_tokens'] = route.max_output_tokens
+        if not config:
+            return None
+        return genai.types.GenerationConfig(candidate_count=1, **config)
+
+    def get_model(self, task: str, system_instruction: str = None) -> genai.GenerativeModel:
+        """
+        Get (cached) model object for a task type
+
+        Args:
+            task: Task type
+            system_instruction: Optional system instruction baked into the model
+
+        Returns:
+            Model object of the provider configured for the route
+        """
+        task = self._route_key(task)
+        key = (task, system_instruction)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                route = self.get_route(task)
+                model = self.provider.create_model(
+                    route.model_name,
+                    generation_config=self.get_generation_config(task),
+                    system_instruction=system_instruction
+                )
+                self._models[key] = model
+            return model
+
+    def get_breaker(self, task: str) -> CircuitBreaker:
+        """Get circuit breaker of a route"""
+        return self._breakers[self._route_key(task)]
+
+    def get_timeout(self, task: str) -> float:
+        """Adaptive timeout (seconds) for one call of a route, from its recent latency percentiles"""
+        return self.get_breaker(task).get_timeout()
+
+    @contextmanager
+    def acquire(self, task: str):
+        """
+        Hold one concurrency slot of a route and record latency of the wrapped call
+
+        An exception raised in the block counts as a failure for the route's circuit breaker;
+        closing a stream early (GeneratorExit) or cancelling the caller (CancelledError) counts as neither.
+
+        Usage:
+            with router.acquire('summary'):
+                response = router.get_model('summary').generate_content(prompt)
+
+        Raises:
+            CircuitOpenError: The route's circuit is open (raised before waiting for a slot)
+        """
+        task = self._route_key(task)
+        semaphore = self._semaphores[task]
+        waiters = self._async_waiters[task]
+        stats = self._stats[task]
+        breaker = self._breakers[task]
+        breaker.before_call()
+
+        wait_start = time.time()
+        semaphore.acquire()
+        start_time = self._start_call(stats, wait_start)
+
+        success = False
+        try:
+            yield self.get_model(task)
+            success = True
+        except CALLER_EXITS:
+            # Stream closed or task cancelled by the caller: not a result of the upstream call
+            success = None
+            raise
+        finally:
+            self._finish_call(stats, semaphore, waiters, breaker, start_time, success)
+
+    @asynccontextmanager
+    async def acquire_async(self, task: str):
+        """
+        Async variant of acquire: waits for a slot without blocking the event loop
+
+        Slots are shared with acquire, so sync and async callers respect the same limit.
+        A waiting coroutine sleeps on a future that is woken when any caller releases
+        a slot (no polling, no thread parked per waiter).
+
+        Usage:
+            async with router.acquire_async('chat') as model:
+                response = await model.generate_content_async(prompt)
+        """
+        task = self._route_key(task)
+        semaphore = self._semaphores[task]
+        waiters = self._async_waiters[task]
+        stats = self._stats[task]
+        breaker = self._breakers[task]
+        breaker.before_call()
+
+        wait_start = time.time()
+        await self._wait_for_slot(semaphore, waiters)
+        start_time = self._start_call(stats, wait_start)
+
+        success = False
+        try:
+            yield self.get_model(task)
+            success = True
+        except CALLER_EXITS:
+            # Stream closed or task cancelled by the caller: not a result of the upstream call
+            success = None
+            raise
+        finally:
+            self._finish_call(stats, semaphore, waiters, breaker, start_time, success)
+
+    async def _wait_for_slot(self, semaphore: threading.BoundedSemaphore, waiters: list):
+        """Take a slot, sleeping until a release wakes this coroutine when none is free"""
+        loop = asyncio.get_running_loop()
+        while not semaphore.acquire(blocking=False):
+            entry = (loop, loop.create_future())
+            with self._lock:
+                waiters.append(entry)
+            try:
+                # A slot released before the waiter was registered would not wake it
+                if semaphore.acquire(blocking=False):
+                    return
+                await entry[1]
+            finally:
+                with self._lock:
+                    if entry in waiters:
+                        waiters.remove(entry)
+
+    def _start_call(self, stats: Dict[str, Any], wait_start: float) -> float:
+        """Record a call that got its slot; returns the call start time"""
+        start_time = time.time()
+        with self._lock:
+            stats['in_flight'] += 1
+            stats['wait_times'].append(start_time - wait_start)
+        return start_time
+
+    def _finish_call(self, stats: Dict[str, Any], semaphore: threading.BoundedSemaphore, waiters: list,
+                     breaker: CircuitBreaker, start_time: float, success: Optional[bool]):
+        """
+        Record the end of a call, release its slot and wake the async waiters of the route
+
+        success is None for calls stopped by the caller: they free their breaker probe slot
+        without counting as a success or a failure.
+        """
+        latency = time.time() - start_time
+        with self._lock:
+            stats['in_flight'] -= 1
+            stats['calls'] += 1
+            if success is None:
+                stats['cancelled'] += 1
+            elif not success:
+                stats['errors'] += 1
+            stats['latencies'].append(latency)
+        semaphore.release()
+        # After the release: a waiter registering from now on sees the free slot in its own retry.
+        # All current waiters retry; the ones that lose the slot register again
+        with self._lock:
+            woken = list(waiters)
+            waiters.clear()
+        for loop, future in woken:
+            try:
+                loop.call_soon_threadsafe(self._wake_waiter, future)
+            except RuntimeError:
+                # Event loop already closed
+                pass
+        if success is None:
+            breaker.release()
+        elif success:
+            breaker.record_success(latency)
+        else:
+            breaker.record_failure()
+
+    @staticmethod
+    def _wake_waiter(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get per-route concurrency and latency metrics"""
+        stats = {}
+        with self._lock:
+            for task, route in self.routes.items():
+                route_stats = self._stats[task]
+                latencies = sorted(route_stats['latencies'])
+                waits = list(route_stats['wait_times'])
+                stats[task] = {
+                    **asdict(route),
+                    'calls': route_stats['calls'],
+                    'errors': route_stats['errors'],
+                    'cancelled': route_stats['cancelled'],
+                    'in_flight': route_stats['in_flight'],
+                    'avg_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+                    'p95_latency': latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+                    'avg_wait_time': sum(waits) / len(waits) if waits else 0.0,
+                    'circuit': self._breakers[task].get_stats()
+                }
+        return stats
@@ -0,0 +1,178 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .semantic_cache import tokenize, guard_signature
+from .token_counter import estimate_tokens
+
+# Section headers: "=== TITLE ===" or a short line ending with a colon ("TRÁNH:")
+_HEADER_PATTERN = re.compile(r'^=+[^=]*=+$|^[^:]{1,60}:$')
+# Bullet rules, the only lines removed as duplicates (tables and numbered steps stay intact)
+_BULLET_PATTERN = re.compile(r'^[-•*]\s')
+
+# Builds a system prompt from (topic_key, user_input, user_info)
+PromptBuilder = Callable[[str, Optional[str], Optional[Dict[str, Any]]], str]
+
+
+def _is_header(line: str) -> bool:
+    return bool(_HEADER_PATTERN.match(line))
+
+
+def compress_prompt(text: str, drop_sections: Iterable[str] = (), similarity: float = 0.6,
+                    min_words: int = 3) -> str:
+    """
+    Shrink a system prompt without changing its rules
+
+    - strips indentation and trailing spaces, collapses blank lines
+    - drops sections whose header starts with one of drop_sections (up to the next blank line or header)
+    - drops bullet rules whose content words overlap an earlier line with the same negation/contrast
+      words (see semantic_cache.guard_signature) by at least similarity (Jaccard, so a short rule
+      is not dropped just because its words appear in a longer, different rule), e.g. a repeated
+      avoid-list; a header whose rules were all dropped goes too
+
+    Args:
+        text: Prompt text
+        drop_sections: Header prefixes of sections to remove
+        similarity: Jaccard similarity of content words with an earlier line to count as duplicate
+        min_words: Rules with fewer content words are always kept
+
+    Returns:
+        Compressed prompt
+    """
+    drop_sections = tuple(drop_sections)
+    lines: List[str] = []
+    seen_rules: List[Tuple[frozenset, frozenset]] = []
+    dropping = False
+    # Current section: index of its header in lines, rules kept and rules removed as duplicates
+    section = {'header': None, 'kept': 0, 'removed': 0}
+
+    def close_section():
+        if section['header'] is not None and section['removed'] and not section['kept']:
+            del lines[section['header']]
+        section.update(header=None, kept=0, removed=0)
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            dropping = False
+            close_section()
+            if lines and lines[-1]:
+                lines.append('')
+            continue
+        if _is_header(line):
+            close_section()
+            dropping = line.lstrip('= ').startswith(drop_sections) if drop_sections else False
+            if not dropping:
+                section['header'] = len(lines)
+                lines.append(line)
+            continue
+        if dropping:
+            continue
+
+        words = frozenset(tokenize(line))
+        if len(words) >= min_words:
+            guard = guard_signature(line)
+            if _BULLET_PATTERN.match(line) and any(
+                    guard == seen_guard and len(words & seen_words) / len(words | seen_words) >= similarity
+                    for seen_words, seen_guard in seen_rules):
+                section['removed'] += 1
+                continue
+            seen_rules.append((words, guard))
+        section['kept'] += 1
+        lines.append(line)
+
+    close_section()
+    return '\n'.join(line for index, line in enumerate(lines)
+                     if line or (index and lines[index - 1])).strip()
+
+
+@dataclass
+class PromptVariant:
+    """A named way of building the system prompt"""
+    name: str
+    builder: PromptBuilder
+    description: str = ''
+
+
+class PromptRegistry:
+    """Named system-prompt variants with token counts measured on every build"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._variants: Dict[str, PromptVariant] = {}
+        self._token_counts: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, builder: PromptBuilder, description: str = ''):
+        """
+        Register (or replace) a prompt variant
+
+        Args:
+            name: Variant name
+            builder: Function (topic_key, user_input, user_info) -> prompt text
+            description: Short description shown in stats
+        """
+        with self._lock:
+            self._variants[name] = PromptVariant(name, builder, description)
+            self._token_counts.setdefault(name, [])
+
+    def names(self) -> List[str]:
+        """Registered variant names"""
+        return list(self._variants)
+
+    def build(self, name: str, topic_key: str, user_input: str = None,
+              user_info: Dict[str, Any] = None) -> str:
+        """
+        Build a prompt with a variant and record its token count
+
+        Raises:
+            ValueError: Unknown variant
+        """
+        variant = self._variants.get(name)
+        if variant is None:
+            raise ValueError(f"Unknown prompt variant: {name}")
+        prompt = variant.builder(topic_key, user_input, user_info)
+        tokens = estimate_tokens(prompt)
+        with self._lock:
+            counts = self._token_counts[name]
+            counts.append(tokens)
+            del counts[:-500]
+        return prompt
+
+    def measure(self, contexts: Iterable[Tuple[str, Optional[Dict[str, Any]]]],
+                names: Iterable[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Token counts of variants over sample (topic_key, user_info) contexts, without recording them
+
+        Returns:
+            Per variant: avg/min/max tokens and characters
+        """
+        contexts = list(contexts)
+        report = {}
+        for name in names or self.names():
+            variant = self._variants[name]
+            prompts = [variant.builder(topic_key, None, user_info) for topic_key, user_info in contexts]
+            tokens = [estimate_tokens(prompt) for prompt in prompts]
+            report[name] = {
+                'avg_tokens': sum(tokens) / len(tokens) if tokens else 0.0,
+                'min_tokens': min(tokens, default=0),
+                'max_tokens': max(tokens, default=0),
+                'avg_chars': sum(len(prompt) for prompt in prompts) / len(prompts) if prompts else 0.0
+            }
+        return report
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Description and token counts of the prompts built with each variant"""
+        with self._lock:
+            return {
+                name: {
+                    'description': variant.description,
+                    'builds': len(self._token_counts[name]),
+                    'avg_tokens': (sum(self._token_counts[name]) / len(self._token_counts[name])
+                                   if self._token_counts[name] else 0.0),
+                    'last_tokens': self._token_counts[name][-1] if self._token_counts[name] else 0
+                }
+                for name, variant in self._variants.items()
+            }
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Unicode-normalize (NFC), lowercase and collapse whitespace so trivially different prompts share a key"""
+    text = unicodedata.normalize('NFC', prompt)
+    return _SPACE_PATTERN.sub(' ', text.lower()).strip()
+
+
+def make_cache_key(model_name: str, config: Dict[str, Any], prompt: str, scope: str = None) -> str:
+    """
+    Build a cache key from model, generation config and normalized prompt
+
+    Args:
+        model_name: Model used for the call
+        config: Generation settings that change the output (temperature, max tokens, ...)
+        prompt: Full prompt text
+        scope: Extra key part, e.g. the date for once-per-day content
+
+    Returns:
+        SHA-256 hex digest
+    """
+    payload = json.dumps([model_name, config, normalize_prompt(prompt), scope],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """In-memory LRU cache of model responses with TTL and an optional on-disk tier"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0, cache_dir: str = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        Initialize response cache
+
+        Args:
+            max_entries: Maximum entries kept in memory (least recently used are evicted)
+            ttl: Default seconds an entry stays valid
+            cache_dir: Directory of the on-disk tier (None = memory only)
+            clock: Time source in seconds (injectable for tests)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get a cached value
+
+        Args:
+            key: Cache key (see make_cache_key)
+
+        Returns:
+            Cached value, or None when missing or expired
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry['expires_at'] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry['value']
+                del self._entries[key]
+                self.expirations += 1
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, entry)
+        return entry['value']
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        """
+        Store a value (must be JSON serializable when the disk tier is enabled)
+
+        Args:
+            key: Cache key
+            value: Value to cache
+            ttl: Seconds the entry stays valid (default: cache ttl)
+        """
+        entry = {'value': value, 'expires_at': self.clock() + (self.ttl if ttl is None else ttl)}
+        with self._lock:
+            self._store(key, entry)
+        self._write_disk(key, entry)
+
+    def record_bypass(self):
+        """Count a call that skipped the cache on purpose"""
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self):
+        """Drop all entries from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+        if self.cache_dir:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        pass
+
+    def _store(self, key: str, entry: Dict[str, Any]):
+        """Put an entry in memory and evict the least recently used ones (lock held)"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        """Read a valid entry from the disk tier"""
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"Could not read cache entry {key[:12]}: {e}")
+            return None
+
+        if entry.get('expires_at', 0) <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]):
+        """Write an entry to the disk tier (atomic replace)"""
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except Exception as e:
+            self.logger.warning(f"Could not write cache entry {key[:12]}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and hit rate"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'bypasses': self.bypasses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'disk_tier': bool(self.cache_dir)
+            }
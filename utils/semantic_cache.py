@@ -0,0 +1,313 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_NON_WORD_PATTERN = re.compile(r'[^\w\s]', re.UNICODE)
+_SPACE_PATTERN = re.compile(r'\s+')
+
+# Function words that do not change what is being asked
+STOP_WORDS = {
+    'bị', 'thì', 'nên', 'có', 'là', 'và', 'của', 'tôi', 'bác', 'cháu', 'ạ', 'nhé', 'à', 'ơi',
+    'gì', 'sao', 'thế', 'nào', 'tốt', 'phải', 'để', 'hết', 'hay', 'với', 'cho', 'được',
+    'làm', 'ra', 'vậy', 'mình', 'cái', 'những', 'các', 'một', 'này', 'đó', 'kia'
+}
+# Question particles at the end of a sentence ("... có tốt không?")
+TRAILING_PARTICLES = {'không', 'chưa', 'à', 'ạ', 'nhỉ', 'nhé', 'hả', 'vậy', 'ơi', 'cháu', 'bác'}
+# Words that flip the meaning of otherwise similar questions: both questions must contain the same ones
+GUARD_WORDS = {
+    'không', 'đừng', 'chẳng', 'chớ', 'tránh', 'kiêng', 'cấm',
+    'cao', 'thấp', 'tăng', 'giảm', 'nóng', 'lạnh', 'nhiều', 'ít', 'trước', 'sau', 'sáng', 'tối'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Content words of a question: NFC, lowercase, no punctuation, stop words and trailing particles removed"""
+    text = _NON_WORD_PATTERN.sub(' ', unicodedata.normalize('NFC', text).lower())
+    words = _SPACE_PATTERN.sub(' ', text).strip().split()
+    while words and words[-1] in TRAILING_PARTICLES:
+        words.pop()
+    content = [word for word in words if word not in STOP_WORDS]
+    return content or words
+
+
+def strip_diacritics(word: str) -> str:
+    """Remove Vietnamese diacritics (for questions typed without accents)"""
+    decomposed = unicodedata.normalize('NFD', word)
+    return ''.join(c for c in decomposed if unicodedata.category(c) != 'Mn').replace('đ', 'd')
+
+
+class HashedNgramEmbedder:
+    """
+    Local embedding: hashed words, word bigrams and character n-grams into a fixed-size
+    L2-normalized vector (no model download, microseconds per question)
+    """
+
+    def __init__(self, dim: int = 4096, ngram_range: Tuple[int, int] = (2, 3),
+                 ngram_weight: float = 0.25, bigram_weight: float = 0.7, plain_weight: float = 0.5):
+        """
+        Initialize embedder
+
+        Args:
+            dim: Vector size (number of hash buckets)
+            ngram_range: Min and max character n-gram length
+            ngram_weight: Weight of character n-grams (robustness to typos)
+            bigram_weight: Weight of word bigrams (Vietnamese compounds such as "huyết áp")
+            plain_weight: Weight of words without diacritics
+        """
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.ngram_weight = ngram_weight
+        self.bigram_weight = bigram_weight
+        self.plain_weight = plain_weight
+
+    def _add(self, vector: np.ndarray, feature: str, weight: float):
+        """Add a feature to its signed hash bucket"""
+        digest = zlib.crc32(feature.encode('utf-8'))
+        sign = 1.0 if digest & 1 else -1.0
+        vector[(digest >> 1) % self.dim] += sign * weight
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        Embed a text
+
+        Args:
+            text: Input text
+
+        Returns:
+            float32 vector of length dim (all zeros for empty text)
+        """
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = tokenize(text)
+        min_n, max_n = self.ngram_range
+        for word in words:
+            self._add(vector, f"w:{word}", 1.0)
+            self._add(vector, f"p:{strip_diacritics(word)}", self.plain_weight)
+            padded = f" {word} "
+            for n in range(min_n, max_n + 1):
+                for i in range(len(padded) - n + 1):
+                    self._add(vector, padded[i:i + n], self.ngram_weight)
+        for first, second in zip(words, words[1:]):
+            self._add(vector, f"b:{first} {second}", self.bigram_weight)
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+def guard_signature(text: str) -> frozenset:
+    """Meaning-flipping words of a question (see GUARD_WORDS)"""
+    return frozenset(word for word in tokenize(text) if word in GUARD_WORDS)
+
+
+class _ScopeIndex:
+    """Vectors and entries of one cache scope (the matrix grows by doubling up to capacity)"""
+
+    def __init__(self, dim: int, capacity: int, initial_rows: int = 8):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(initial_rows, capacity), dim), dtype=np.float32)
+        self.entries: List[Dict[str, Any]] = []
+        self.size = 0
+        self.next_slot = 0
+        self.last_used = 0.0
+
+    def add(self, vector: np.ndarray, entry: Dict[str, Any]):
+        """Store an entry, growing the matrix while below capacity and overwriting the oldest when full"""
+        slot = self.next_slot
+        if slot == len(self.vectors) and slot < self.capacity:
+            grown = np.zeros((min(len(self.vectors) * 2, self.capacity), self.vectors.shape[1]), dtype=np.float32)
+            grown[:slot] = self.vectors
+            self.vectors = grown
+        self.vectors[slot] = vector
+        if slot < len(self.entries):
+            self.entries[slot] = entry
+        else:
+            self.entries.append(entry)
+        self.next_slot = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+
+class SemanticCache:
+    """Answers near-duplicate questions from earlier answers using cosine similarity of local embeddings"""
+
+    def __init__(self, embedder: HashedNgramEmbedder = None, threshold: float = 0.8,
+                 max_entries_per_scope: int = 500, ttl: float = None, audit_size: int = 200,
+                 max_scopes: int = 100, scope_idle_ttl: float = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        Initialize semantic cache
+
+        Args:
+            embedder: Text embedder (default HashedNgramEmbedder)
+            threshold: Minimum cosine similarity for a hit
+            max_entries_per_scope: Entries kept per scope (oldest are overwritten)
+            ttl: Seconds an entry stays valid (None = no expiry)
+            audit_size: Number of recent hits kept in the audit trail
+            max_scopes: Scopes kept; the least recently used one is dropped beyond this
+            scope_idle_ttl: Seconds without lookups or adds after which a scope is dropped (None = never)
+            clock: Time source (injectable for tests)
+        """
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.threshold = threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self.ttl = ttl
+        self.max_scopes = max_scopes
+        self.scope_idle_ttl = scope_idle_ttl
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+
+        # Least recently used scope first
+        self._scopes: Dict[str, _ScopeIndex] = OrderedDict()
+        self._lock = threading.Lock()
+        self.audit_trail = deque(maxlen=audit_size)
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted_scopes = 0
+        self.lookup_times = deque(maxlen=500)
+
+    def _touch(self, scope: str) -> Optional[_ScopeIndex]:
+        """Scope index marked as just used, or None if missing/idle too long (call with the lock held)"""
+        index = self._scopes.get(scope)
+        if index is None:
+            return None
+        now = self.clock()
+        if self.scope_idle_ttl is not None and now - index.last_used > self.scope_idle_ttl:
+            del self._scopes[scope]
+            self.evicted_scopes += 1
+            return None
+        index.last_used = now
+        self._scopes.move_to_end(scope)
+        return index
+
+    def _evict_scopes(self):
+        """Drop idle scopes and the least recently used ones beyond max_scopes (call with the lock held)"""
+        if self.scope_idle_ttl is not None:
+            cutoff = self.clock() - self.scope_idle_ttl
+            for scope in [scope for scope, index in self._scopes.items() if index.last_used < cutoff]:
+                del self._scopes[scope]
+                self.evicted_scopes += 1
+        while len(self._scopes) > self.max_scopes:
+            self._scopes.popitem(last=False)
+            self.evicted_scopes += 1
+
+    def lookup(self, query: str, scope: str = 'default') -> Optional[Tuple[Any, float]]:
+        """
+        Find the answer of the most similar earlier question in a scope
+
+        Args:
+            query: Question text
+            scope: Cache scope (e.g. topic and user profile)
+
+        Returns:
+            (answer, similarity) when the best match reaches the threshold, else None
+        """
+        start = time.time()
+        vector = self.embedder.embed(query)
+        guard = guard_signature(query)
+        result = None
+        with self._lock:
+            index = self._touch(scope)
+            if index is not None and index.size and vector.any():
+                similarities = index.vectors[:index.size] @ vector
+                now = self.clock()
+                for slot in np.argsort(similarities)[::-1]:
+                    similarity = float(similarities[slot])
+                    if similarity < self.threshold:
+                        break
+                    entry = index.entries[slot]
+                    if self.ttl is not None and now - entry['created_at'] > self.ttl:
+                        continue
+                    if entry['guard'] != guard:
+                        continue
+                    result = (entry['answer'], similarity)
+                    entry['hits'] += 1
+                    self.audit_trail.append({
+                        'timestamp': datetime.now().isoformat(),
+                        'scope': scope,
+                        'query': query,
+                        'matched_query': entry['query'],
+                        'similarity': round(similarity, 4)
+                    })
+                    break
+
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.lookup_times.append(time.time() - start)
+
+        if result is not None:
+            self.logger.info(f"Semantic cache hit ({result[1]:.3f}) in scope {scope}: {query[:60]}")
+        return result
+
+    def add(self, query: str, answer: Any, scope: str = 'default'):
+        """
+        Store the answer of a question
+
+        Args:
+            query: Question text
+            answer: Answer to return for similar questions
+            scope: Cache scope
+        """
+        vector = self.embedder.embed(query)
+        if not vector.any():
+            return
+        with self._lock:
+            index = self._touch(scope)
+            if index is None:
+                index = _ScopeIndex(self.embedder.dim, self.max_entries_per_scope)
+                index.last_used = self.clock()
+                self._scopes[scope] = index
+                self._evict_scopes()
+            index.add(vector, {'query': query, 'answer': answer, 'guard': guard_signature(query),
+                               'created_at': self.clock(), 'hits': 0})
+
+    def clear(self, scope: str = None):
+        """Drop one scope or everything"""
+        with self._lock:
+            if scope is None:
+                self._scopes.clear()
+            else:
+                self._scopes.pop(scope, None)
+
+    def clear_prefix(self, prefix: str) -> int:
+        """
+        Drop every scope whose name starts with prefix (e.g. all profiles of one topic)
+
+        Returns:
+            Number of scopes dropped
+        """
+        with self._lock:
+            scopes = [scope for scope in self._scopes if scope.startswith(prefix)]
+            for scope in scopes:
+                del self._scopes[scope]
+        return len(scopes)
+
+    def get_audit_trail(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent cache hits (newest last)"""
+        with self._lock:
+            return list(self.audit_trail)[-limit:]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit rate, lookup time and size per scope"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            times = list(self.lookup_times)
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'avg_lookup_ms': sum(times) / len(times) * 1000 if times else 0.0,
+                'threshold': self.threshold,
+                'evicted_scopes': self.evicted_scopes,
+                'scopes': {scope: index.size for scope, index in self._scopes.items()}
+            }
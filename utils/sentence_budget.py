@@ -0,0 +1,65 @@
+import re
+
+# Sentence end (., !, ?, … and closing quotes/brackets) followed by whitespace, or a line break
+_SENTENCE_END_PATTERN = re.compile(r'[.!?…]+["\')\]]*\s+|\n+')
+
+
+class SentenceBudget:
+    """
+    Counts sentences of a streamed response and cuts it off once the budget is reached
+
+    Sentences are counted across chunk boundaries; fragments shorter than
+    min_sentence_chars (list numbers, "Dạ.") do not use up the budget.
+    """
+
+    def __init__(self, max_sentences: int = 5, min_sentence_chars: int = 5):
+        """
+        Initialize sentence budget
+
+        Args:
+            max_sentences: Sentences allowed before the stream is cut (None or 0 = unlimited)
+            min_sentence_chars: Minimum characters for a fragment to count as a sentence
+        """
+        self.max_sentences = max_sentences
+        self.min_sentence_chars = min_sentence_chars
+        self.sentences = 0
+        self.exhausted = False
+        self._tail = ''
+
+    def feed(self, text: str) -> str:
+        """
+        Add a streamed piece
+
+        Args:
+            text: Next piece of the response
+
+        Returns:
+            Part of the piece within the budget ('' once the budget is exhausted)
+        """
+        if self.exhausted or not text:
+            return ''
+        if not self.max_sentences:
+            return text
+
+        new_text_start = len(self._tail)
+        combined = self._tail + text
+        sentence_start = 0
+        for match in _SENTENCE_END_PATTERN.finditer(combined):
+            sentence = combined[sentence_start:match.start()]
+            sentence_start = match.end()
+            if len(sentence.strip()) < self.min_sentence_chars:
+                continue
+            self.sentences += 1
+            if self.sentences >= self.max_sentences:
+                # Keep the final punctuation, drop the whitespace after it
+                self.exhausted = True
+                cut = match.start() + len(match.group().rstrip())
+                return combined[new_text_start:cut] if cut > new_text_start else ''
+
+        self._tail = combined[sentence_start:]
+        return text
+
+
+def truncate_sentences(text: str, max_sentences: int, min_sentence_chars: int = 5) -> str:
+    """Cut a complete response after max_sentences sentences"""
+    return SentenceBudget(max_sentences, min_sentence_chars).feed(text)
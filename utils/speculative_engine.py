@@ -0,0 +1,174 @@
+import logging
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Any
+
+# Short acknowledgements that come up again and again, by intent (normalized form)
+QUICK_REPLY_INTENTS = {
+    'thanks': {
+        'cảm ơn', 'cám ơn', 'cảm ơn cháu', 'cám ơn cháu', 'cảm ơn con', 'cám ơn con',
+        'cảm ơn nhé', 'cảm ơn cháu nhé', 'cám ơn cháu nhé', 'cảm ơn nhiều', 'cảm ơn cháu nhiều'
+    },
+    'ack': {
+        'vâng', 'vâng ạ', 'dạ', 'dạ vâng', 'ừ', 'ừm', 'ừ được', 'ok', 'được', 'được rồi',
+        'đúng rồi', 'ừ đúng rồi', 'thế à', 'vậy à', 'à ra thế', 'hay đấy', 'hay quá'
+    },
+    'goodbye': {
+        'tạm biệt', 'tạm biệt cháu', 'chào cháu nhé', 'chúc ngủ ngon',
+        'bác đi ngủ đây', 'bác đi nghỉ đây', 'thôi bác đi nghỉ đây'
+    }
+}
+
+# Reply templates; {call_style}/{Call_style} and {topic} are filled from user info and the topic
+QUICK_REPLY_TEMPLATES = {
+    'thanks': [
+        "Dạ, có gì đâu {call_style}. Được trò chuyện với {call_style} là cháu vui rồi ạ.",
+        "Cháu cảm ơn {call_style} mới đúng ạ. {Call_style} cần gì cứ gọi cháu nhé.",
+        "Dạ không có chi ạ. {Call_style} còn muốn chia sẻ gì về {topic} thì cháu nghe đây."
+    ],
+    'ack': [
+        "Dạ vâng. {Call_style} cứ thong thả, muốn kể thêm gì về {topic} thì cháu nghe ạ.",
+        "Vâng ạ. Nói chuyện với {call_style} cháu thấy vui lắm, {call_style} kể tiếp cho cháu nghe nhé.",
+        "Dạ. Hôm nay {call_style} thấy trong người thế nào ạ?"
+    ],
+    'goodbye': [
+        "Dạ, {call_style} nghỉ ngơi cho khỏe nhé. Lúc nào rảnh lại trò chuyện với cháu ạ.",
+        "Chúc {call_style} ngủ ngon ạ. Mai mình lại nói chuyện tiếp nhé.",
+        "Dạ, cháu chào {call_style}. {Call_style} giữ sức khỏe, cháu luôn ở đây ạ."
+    ]
+}
+
+_NORMALIZE_PATTERN = re.compile(r'[^\w\s]', re.UNICODE)
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_short_message(message: str) -> str:
+    """Lowercase, drop punctuation/emoji and collapse whitespace"""
+    text = _NORMALIZE_PATTERN.sub(' ', message.lower())
+    return _SPACE_PATTERN.sub(' ', text).strip()
+
+
+class SpeculativeEngine:
+    """Warms topic sessions while the user is typing and answers common short acknowledgements from templates"""
+
+    def __init__(self, warm: Optional[Callable[[str], Any]] = None,
+                 intents: Dict[str, set] = None,
+                 templates: Dict[str, List[str]] = None,
+                 min_warm_interval: float = 10.0, max_quick_words: int = 6):
+        """
+        Initialize speculative engine
+
+        Args:
+            warm: Prepares the session/context of a topic (called in a background thread)
+            intents: Normalized short messages by intent (default QUICK_REPLY_INTENTS)
+            templates: Reply templates by intent (default QUICK_REPLY_TEMPLATES)
+            min_warm_interval: Minimum seconds between two warm-ups of the same topic
+            max_quick_words: Longer messages never get a template reply
+        """
+        self.warm = warm
+        self.intents = intents or QUICK_REPLY_INTENTS
+        self.templates = templates or QUICK_REPLY_TEMPLATES
+        self.min_warm_interval = min_warm_interval
+        self.max_quick_words = max_quick_words
+        self.logger = logging.getLogger(__name__)
+
+        self._message_intents = {message: intent
+                                 for intent, messages in self.intents.items()
+                                 for message in messages}
+        self._lock = threading.Lock()
+        self._last_warm = {}
+        self._warming = set()
+        self._template_index = {}
+
+        self.typing_pings = 0
+        self.warmups = 0
+        self.quick_hits = 0
+        self.quick_misses = 0
+
+    def on_typing(self, topic_key: str) -> bool:
+        """
+        Handle a typing ping: warm the topic session in the background (debounced)
+
+        Returns:
+            Whether a warm-up was started
+        """
+        now = time.time()
+        with self._lock:
+            self.typing_pings += 1
+            if self.warm is None or topic_key in self._warming:
+                return False
+            if now - self._last_warm.get(topic_key, 0) < self.min_warm_interval:
+                return False
+            self._last_warm[topic_key] = now
+            self._warming.add(topic_key)
+
+        threading.Thread(target=self._run_warm, args=(topic_key,),
+                         name=f"warm-{topic_key}", daemon=True).start()
+        return True
+
+    def _run_warm(self, topic_key: str):
+        """Run the warm-up callback of one topic"""
+        try:
+            self.warm(topic_key)
+            with self._lock:
+                self.warmups += 1
+        except Exception as e:
+            self.logger.error(f"Warm-up failed for {topic_key}: {e}")
+        finally:
+            with self._lock:
+                self._warming.discard(topic_key)
+
+    def match_intent(self, message: str) -> Optional[str]:
+        """Intent of a common short message, or None"""
+        normalized = normalize_short_message(message)
+        if not normalized or len(normalized.split()) > self.max_quick_words:
+            return None
+        return self._message_intents.get(normalized)
+
+    def quick_reply(self, message: str, topic_key: str, topic_name: str,
+                    user_info: Dict[str, Any] = None) -> Optional[str]:
+        """
+        Personalized template reply for a common short message
+
+        Args:
+            message: User message
+            topic_key: Topic key (templates rotate per topic)
+            topic_name: Topic name used in templates
+            user_info: User info (call_style is used to address the user)
+
+        Returns:
+            Reply text, or None when the message needs the model
+        """
+        intent = self.match_intent(message)
+        if intent is None or not self.templates.get(intent):
+            with self._lock:
+                self.quick_misses += 1
+            return None
+
+        templates = self.templates[intent]
+        with self._lock:
+            key = (topic_key, intent)
+            index = self._template_index.get(key, 0)
+            self._template_index[key] = index + 1
+            self.quick_hits += 1
+
+        call_style = (user_info or {}).get('call_style') or 'bác'
+        return templates[index % len(templates)].format(
+            call_style=call_style,
+            Call_style=call_style[:1].upper() + call_style[1:],
+            topic=topic_name.lower()
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get speculative engine counters"""
+        with self._lock:
+            total = self.quick_hits + self.quick_misses
+            return {
+                'typing_pings': self.typing_pings,
+                'warmups': self.warmups,
+                'warming': sorted(self._warming),
+                'quick_hits': self.quick_hits,
+                'quick_misses': self.quick_misses,
+                'quick_hit_rate': self.quick_hits / total if total else 0.0
+            }
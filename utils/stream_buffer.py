@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Iterator, Optional, Tuple
+
+
+class StreamBuffer:
+    """Ring buffer of serialized events of one response stream, readable again after a reconnect"""
+
+    def __init__(self, stream_id: str, max_events: int = 1024):
+        """
+        Initialize stream buffer
+
+        Args:
+            stream_id: Unique stream ID
+            max_events: Number of most recent events kept for resuming clients
+        """
+        self.stream_id = stream_id
+        self.created_at = time.time()
+        self.closed_at = None
+        self.logger = logging.getLogger(__name__)
+
+        self._events = deque(maxlen=max_events)
+        self._next_id = 1
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._detached_since = self.created_at
+
+    @property
+    def closed(self) -> bool:
+        """Whether the producer has finished"""
+        return self.closed_at is not None
+
+    def append(self, data: str) -> int:
+        """
+        Add a serialized event
+
+        Args:
+            data: Event data (already JSON encoded)
+
+        Returns:
+            ID of the new event
+        """
+        with self._condition:
+            event_id = self._next_id
+            self._next_id += 1
+            self._events.append((event_id, data))
+            self._condition.notify_all()
+        return event_id
+
+    def close(self):
+        """Mark the stream as complete; readers finish after the last event"""
+        with self._condition:
+            if self.closed_at is None:
+                self.closed_at = time.time()
+            self._condition.notify_all()
+
+    def detached_for(self) -> float:
+        """Seconds since the last reader disconnected (0 while a reader is attached)"""
+        with self._condition:
+            if self._readers > 0:
+                return 0.0
+            return time.time() - self._detached_since
+
+    def read(self, last_event_id: int = 0, keepalive: float = 15.0) -> Iterator[Optional[Tuple[int, str]]]:
+        """
+        Iterate over events after last_event_id, waiting for new ones until the stream closes
+
+        Args:
+            last_event_id: ID of the last event the client already has (0 = from the start)
+            keepalive: Seconds without events after which None is yielded (for keep-alive comments)
+
+        Yields:
+            (event_id, data) tuples, or None when no event arrived within keepalive
+        """
+        with self._condition:
+            self._readers += 1
+        try:
+            position = last_event_id
+            while True:
+                with self._condition:
+                    pending = [event for event in self._events if event[0] > position]
+                    if not pending:
+                        if self.closed:
+                            return
+                        self._condition.wait(keepalive)
+                        pending = [event for event in self._events if event[0] > position]
+
+                if pending and pending[0][0] > position + 1:
+                    self.logger.warning(f"Stream {self.stream_id}: events {position + 1}-{pending[0][0] - 1} "
+                                        f"no longer buffered")
+                if not pending:
+                    if not self.closed:
+                        yield None
+                    continue
+
+                for event in pending:
+                    position = event[0]
+                    yield event
+        finally:
+            # Runs when the stream ends and when the server closes the response of a dropped client
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._detached_since = time.time()
+
+
+class StreamRegistry:
+    """Keeps stream buffers by ID so clients can resume a dropped response stream"""
+
+    def __init__(self, max_events: int = 1024, ttl: float = 300.0):
+        """
+        Initialize stream registry
+
+        Args:
+            max_events: Ring buffer size of each stream
+            ttl: Seconds a finished stream stays available for resuming
+        """
+        self.max_events = max_events
+        self.ttl = ttl
+        self._streams: Dict[str, StreamBuffer] = {}
+        self._lock = threading.Lock()
+
+    def create(self) -> StreamBuffer:
+        """Create and register a new stream buffer"""
+        buffer = StreamBuffer(uuid.uuid4().hex, self.max_events)
+        with self._lock:
+            self._purge()
+            self._streams[buffer.stream_id] = buffer
+        return buffer
+
+    def get(self, stream_id: str) -> Optional[StreamBuffer]:
+        """Get a stream buffer (None if unknown or expired)"""
+        with self._lock:
+            self._purge()
+            return self._streams.get(stream_id)
+
+    def _purge(self):
+        """Drop finished streams older than ttl"""
+        now = time.time()
+        expired = [stream_id for stream_id, buffer in self._streams.items()
+                   if buffer.closed and now - buffer.closed_at > self.ttl]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+    def get_stats(self) -> Dict[str, int]:
+        """Number of registered and still running streams"""
+        with self._lock:
+            return {
+                'streams': len(self._streams),
+                'active': sum(1 for buffer in self._streams.values() if not buffer.closed)
+            }
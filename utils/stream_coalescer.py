@@ -0,0 +1,112 @@
+import re
+import time
+from typing import Callable, Optional
+
+# Sentence end (., !, ?, … and closing quotes/brackets) followed by whitespace, or a line break
+_SENTENCE_END_PATTERN = re.compile(r'[.!?…]+["\')\]]*\s+|\n+')
+
+
+class StreamCoalescer:
+    """
+    Merges small streamed text pieces into fewer events using a configurable flush policy
+
+    max_latency is checked when a piece is added and when poll() is called. To bound
+    latency while the upstream is silent, the consumer must wait for the next piece at
+    most time_until_flush() seconds and call poll() when that wait times out.
+    """
+
+    def __init__(self, flush_on_sentence: bool = True, max_bytes: int = 200,
+                 max_latency: float = 0.25, flush_first: bool = True,
+                 clock: Callable[[], float] = time.time):
+        """
+        Initialize coalescer
+
+        Args:
+            flush_on_sentence: Flush everything up to the last complete sentence
+            max_bytes: Flush when buffered UTF-8 text reaches this size
+            max_latency: Flush when the oldest buffered text is older than this (seconds)
+            flush_first: Send the first piece immediately to keep time-to-first-byte low
+            clock: Time source in seconds (injectable for tests)
+        """
+        self.flush_on_sentence = flush_on_sentence
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.flush_first = flush_first
+        self.clock = clock
+
+        self._buffer = ''
+        self._buffer_bytes = 0
+        self._buffered_since = None
+        self.pieces_in = 0
+        self.flushes = 0
+
+    def add(self, text: str) -> Optional[str]:
+        """
+        Add a text piece
+
+        Args:
+            text: Cleaned text to send
+
+        Returns:
+            Text to send now, or None while it stays buffered
+        """
+        if not text:
+            return self.poll()
+
+        self.pieces_in += 1
+        if not self._buffer:
+            self._buffered_since = self.clock()
+        self._buffer += text
+        self._buffer_bytes += len(text.encode('utf-8'))
+
+        if self.flush_first and self.flushes == 0:
+            return self.flush()
+        if self._buffer_bytes >= self.max_bytes:
+            return self.flush()
+        if self._is_stale():
+            return self.flush()
+
+        if self.flush_on_sentence:
+            last_end = 0
+            for match in _SENTENCE_END_PATTERN.finditer(self._buffer):
+                last_end = match.end()
+            return self._flush_until(last_end)
+        return None
+
+    def poll(self) -> Optional[str]:
+        """Flush buffered text if it has waited longer than max_latency"""
+        if self._buffer and self._is_stale():
+            return self.flush()
+        return None
+
+    def time_until_flush(self) -> Optional[float]:
+        """Seconds until buffered text reaches max_latency, or None when nothing is buffered"""
+        if not self._buffer:
+            return None
+        return max(0.0, self._buffered_since + self.max_latency - self.clock())
+
+    def flush(self, text: str = '') -> Optional[str]:
+        """Flush all buffered text plus an optional final piece (used at the end of the stream)"""
+        if text:
+            self.pieces_in += 1
+            self._buffer += text
+        return self._flush_until(len(self._buffer))
+
+    def _is_stale(self) -> bool:
+        """Whether buffered text has waited at least max_latency"""
+        return self._buffered_since is not None and self.clock() - self._buffered_since >= self.max_latency
+
+    def _flush_until(self, end: int) -> Optional[str]:
+        """Flush the first end characters of the buffer"""
+        if end <= 0:
+            return None
+
+        text, self._buffer = self._buffer[:end], self._buffer[end:]
+        self.flushes += 1
+        if self._buffer:
+            self._buffer_bytes = len(self._buffer.encode('utf-8'))
+            self._buffered_since = self.clock()
+        else:
+            self._buffer_bytes = 0
+            self._buffered_since = None
+        return text
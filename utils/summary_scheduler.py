@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional, Dict, Any
+
+
+class IdleSummaryScheduler:
+    """Summarizes conversation backlog in the background while the request rate is low"""
+
+    def __init__(self, find_backlog: Callable[[], List[str]],
+                 summarize: Callable[[str], Any],
+                 precompute: Optional[Callable[[str], Any]] = None,
+                 check_interval: float = 30.0, idle_window: float = 60.0,
+                 max_idle_requests: int = 2, max_topics_per_run: int = 1):
+        """
+        Initialize idle-time scheduler
+
+        Args:
+            find_backlog: Returns topic keys that have unsummarized backlog
+            summarize: Summarizes the backlog of one topic; raises when the summary failed
+                (the remaining topics of the run are skipped and retried on a later check)
+            precompute: Precomputes restore data of one topic (optional)
+            check_interval: Seconds between idle checks
+            idle_window: Seconds of request history used to measure the request rate
+            max_idle_requests: The system counts as idle with at most this many
+                requests inside idle_window
+            max_topics_per_run: Topics handled per idle check, so work stays interruptible
+        """
+        self.find_backlog = find_backlog
+        self.summarize = summarize
+        self.precompute = precompute
+        self.check_interval = check_interval
+        self.idle_window = idle_window
+        self.max_idle_requests = max_idle_requests
+        self.max_topics_per_run = max_topics_per_run
+        self.logger = logging.getLogger(__name__)
+
+        self._request_times = deque()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.runs = 0
+        self.topics_summarized = 0
+        self.failures = 0
+        self.last_run_at = None
+        self.last_error = None
+
+    def record_request(self):
+        """Record an incoming user request (called from the request path)"""
+        now = time.time()
+        with self._lock:
+            self._request_times.append(now)
+            self._trim(now)
+
+    def _trim(self, now: float):
+        """Drop request timestamps outside the idle window"""
+        while self._request_times and now - self._request_times[0] > self.idle_window:
+            self._request_times.popleft()
+
+    def recent_request_count(self) -> int:
+        """Number of requests inside the idle window"""
+        with self._lock:
+            self._trim(time.time())
+            return len(self._request_times)
+
+    def is_idle(self) -> bool:
+        """Whether the current request rate is low enough for background work"""
+        return self.recent_request_count() <= self.max_idle_requests
+
+    def run_once(self) -> List[str]:
+        """
+        Run one idle check and summarize up to max_topics_per_run topics
+
+        Returns:
+            Topic keys that were processed
+        """
+        if not self.is_idle():
+            return []
+
+        processed = []
+        try:
+            for topic_key in self.find_backlog()[:self.max_topics_per_run]:
+                # Traffic may have picked up while the previous topic was summarized
+                if not self.is_idle():
+                    break
+                self.summarize(topic_key)
+                if self.precompute:
+                    self.precompute(topic_key)
+                processed.append(topic_key)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            self.logger.error(f"Idle summarization failed: {e}")
+
+        self.runs += 1
+        self.topics_summarized += len(processed)
+        self.last_run_at = time.time()
+        if processed:
+            self.logger.info(f"Idle summarization done for: {', '.join(processed)}")
+        return processed
+
+    def _loop(self):
+        """Background loop"""
+        while not self._stop_event.wait(self.check_interval):
+            self.run_once()
+
+    def start(self):
+        """Start the background thread (no-op if already running)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._loop, name="idle-summary-scheduler", daemon=True)
+            self._thread.start()
+        self.logger.info("Idle summary scheduler started")
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.check_interval)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get scheduler status"""
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'idle': self.is_idle(),
+            'recent_requests': self.recent_request_count(),
+            'idle_window': self.idle_window,
+            'runs': self.runs,
+            'topics_summarized': self.topics_summarized,
+            'failures': self.failures,
+            'last_run_at': self.last_run_at,
+            'last_error': self.last_error
+        }
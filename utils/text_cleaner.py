@@ -0,0 +1,242 @@
+import re
+from typing import Iterable
+
+# Patterns are compiled once at import time (used for every streamed chunk)
+_EMPHASIS_PATTERN = re.compile(r'\*{1,3}(.*?)\*{1,3}')      # *, **, ***
+_CODE_PATTERN = re.compile(r'`{1,3}(.*?)`{1,3}')            # `, ```
+# Same matching as _EMPHASIS_PATTERN, with the opening run captured
+_EMPHASIS_OPENING_PATTERN = re.compile(r'(\*{1,3})(.*?)\*{1,3}')
+_HEADER_PATTERN = re.compile(r'#{1,6}\s*(.*?)(?:\n|$)')     # # headers
+_PUNCT_SPACING_PATTERN = re.compile(
+    r'([.!?:;,])([a-zA-Zàáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ])'
+)
+_MULTI_SPACE_PATTERN = re.compile(r' {2,}')
+_MULTI_NEWLINE_PATTERN = re.compile(r'\n{3,}')
+
+# Characters whose cleaning depends on what follows them; a chunk is never cut right after one
+_UNSTABLE_TAIL_CHARS = frozenset('.!?:;,*•`#')
+# Bullets and emphasis leftovers removed, arrows turned into spaces (one pass)
+_MARKUP_CHARS = str.maketrans({'•': '', '→': ' ', '*': ''})
+
+
+def _clean_markup(text: str) -> str:
+    """Remove markdown and fix punctuation spacing (everything except whitespace normalization)"""
+    text = _EMPHASIS_PATTERN.sub(r'\1', text)
+    text = _CODE_PATTERN.sub(r'\1', text)
+    text = _HEADER_PATTERN.sub(r'\1\n', text)
+
+    text = text.translate(_MARKUP_CHARS)
+
+    return _PUNCT_SPACING_PATTERN.sub(r'\1 \2', text)
+
+
+def _normalize_whitespace(text: str) -> str:
+    """Collapse repeated spaces and blank lines"""
+    text = _MULTI_SPACE_PATTERN.sub(' ', text)
+    return _MULTI_NEWLINE_PATTERN.sub('\n\n', text)
+
+
+def clean_response_text(text: str) -> str:
+    """
+    Clean a complete model response for display and TTS
+
+    Removes basic markdown (*, `, # headers, bullets, arrows), adds a space after
+    punctuation when missing and normalizes whitespace.
+    """
+    return _normalize_whitespace(_clean_markup(text)).strip()
+
+
+class StreamingTextCleaner:
+    """
+    Incremental version of clean_response_text for streamed chunks
+
+    Raw text is buffered only until it can be cleaned without knowing what comes
+    next: a line containing '#' or '`' waits for its end, and a chunk is never cut
+    right after punctuation or a markdown character. Cleaned trailing whitespace is
+    held back until more text arrives. Complete lines are scanned once (the scan
+    resumes where the previous feed() stopped) and each raw character is cleaned
+    exactly once, so the work per chunk does not grow with the buffered text.
+    The concatenated output of feed() and finish() equals clean_response_text()
+    of the whole text, regardless of how the text was split into chunks.
+    """
+
+    def __init__(self):
+        self._pending = ''
+        self._held_whitespace = ''
+        self._started = False
+        # Line scan state of _pending: offset of the first unscanned line, open header
+        self._scan_pos = 0
+        self._in_header = False
+
+    def feed(self, chunk: str) -> str:
+        """
+        Add a raw chunk
+
+        Args:
+            chunk: Raw text from the model
+
+        Returns:
+            Cleaned text that is final (may be empty)
+        """
+        if not chunk:
+            return ''
+
+        self._pending += chunk
+        cut = self._find_safe_cut(self._pending)
+        if cut == 0:
+            return ''
+        # Lines scanned but held back (an open header) keep their scan state
+        self._scan_pos = max(0, self._scan_pos - cut)
+
+        segment, self._pending = self._pending[:cut], self._pending[cut:]
+        return self._emit(_clean_markup(segment), final=False)
+
+    def finish(self) -> str:
+        """Flush everything still buffered at the end of the stream"""
+        segment, self._pending = self._pending, ''
+        self._scan_pos = 0
+        self._in_header = False
+        return self._emit(_clean_markup(segment), final=True)
+
+    def _emit(self, cleaned: str, final: bool) -> str:
+        """Apply whitespace normalization and strip() semantics across chunk boundaries"""
+        text = self._held_whitespace + cleaned
+        if not self._started:
+            text = text.lstrip()
+
+        body = text.rstrip()
+        self._held_whitespace = '' if final else text[len(body):]
+        if body:
+            self._started = True
+        return _normalize_whitespace(body)
+
+    def _find_safe_cut(self, text: str) -> int:
+        """
+        Largest prefix length of text that can be cleaned independently of the rest
+
+        Only lines completed since the last call are scanned; the text before
+        _scan_pos is either a held-back header or already cut off.
+        """
+        cut = 0
+        in_header = self._in_header
+        pos = self._scan_pos
+
+        while True:
+            newline = text.find('\n', pos)
+            if newline == -1:
+                break
+
+            # The header pattern runs after emphasis/code removal, so inspect the line as it sees it
+            line = _CODE_PATTERN.sub(r'\1', _EMPHASIS_PATTERN.sub(r'\1', text[pos:newline]))
+            if in_header:
+                # A header followed only by whitespace swallows blank lines up to the next content line
+                if line.strip():
+                    in_header = False
+                    cut = newline + 1
+            else:
+                hash_index = line.find('#')
+                if hash_index == -1:
+                    cut = newline + 1
+                else:
+                    rest = line[hash_index:]
+                    run = len(rest) - len(rest.lstrip('#'))
+                    if rest[min(run, 6):].strip():
+                        cut = newline + 1
+                    else:
+                        in_header = True
+            pos = newline + 1
+
+        self._scan_pos = pos
+        self._in_header = in_header
+        tail = text[pos:]
+        if in_header or '#' in tail or '`' in tail:
+            return cut
+
+        end = len(tail)
+        while end > 0 and tail[end - 1] in _UNSTABLE_TAIL_CHARS:
+            end -= 1
+        if not StreamingTextCleaner._emphasis_is_final(tail[:end]):
+            return cut
+        return pos + end
+
+    @staticmethod
+    def _emphasis_is_final(text: str) -> bool:
+        """
+        Whether emphasis matching inside text cannot change when more text follows
+
+        A '*' left unpaired may pair with a later one, and a match that had to give up
+        part of its opening run (e.g. '**' read as an empty pair) would instead open
+        a longer match once a closing '**' arrives.
+        """
+        for match in _EMPHASIS_OPENING_PATTERN.finditer(text):
+            start = match.start()
+            run = len(text[start:]) - len(text[start:].lstrip('*'))
+            if len(match.group(1)) != min(run, 3):
+                return False
+        return '*' not in _EMPHASIS_PATTERN.sub('', text)
+
+
+class StreamingPatternRemover:
+    """
+    Removes matches of a single-line pattern from streamed text
+
+    A match can only start at one of the given openers and never spans a line
+    break, so completed lines are final; the current line is held back from the
+    first opener (or the partial opener at its end) until the line ends.
+    Everything before that is emitted right away.
+    """
+
+    def __init__(self, pattern: re.Pattern, openers: Iterable[str]):
+        """
+        Initialize remover
+
+        Args:
+            pattern: Compiled pattern whose matches start with an opener and contain no newline
+            openers: Literal strings every match starts with
+        """
+        self.pattern = pattern
+        self.openers = tuple(openers)
+        self.removed = 0
+        self._pending = ''
+
+    def feed(self, text: str) -> str:
+        """
+        Add a piece of (cleaned) text
+
+        Returns:
+            Text that can no longer be part of a match, with matches removed
+        """
+        if not text:
+            return ''
+        self._pending += text
+        hold = self._find_hold(self._pending)
+        segment, self._pending = self._pending[:hold], self._pending[hold:]
+        return self._remove(segment)
+
+    def finish(self) -> str:
+        """Flush the held-back text at the end of the stream"""
+        segment, self._pending = self._pending, ''
+        return self._remove(segment)
+
+    def _find_hold(self, text: str) -> int:
+        """Start of the text that may still belong to a match"""
+        line_start = text.rfind('\n') + 1
+        line = text[line_start:]
+        hold = len(line)
+        for opener in self.openers:
+            index = line.find(opener)
+            if index != -1:
+                hold = min(hold, index)
+            # Opener cut off at the end of the piece
+            for size in range(min(len(opener) - 1, len(line)), 0, -1):
+                if line.endswith(opener[:size]):
+                    hold = min(hold, len(line) - size)
+                    break
+        return line_start + hold
+
+    def _remove(self, text: str) -> str:
+        if not text:
+            return ''
+        text, count = self.pattern.subn('', text)
+        self.removed += count
+        return text
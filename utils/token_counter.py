@@ -0,0 +1,143 @@
+import re
+import threading
+from typing import Dict, Iterable, Optional
+
+# Words (syllables in Vietnamese) and standalone punctuation marks
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+_PUNCT_PATTERN = re.compile(r"[^\w\s]", re.UNICODE)
+
+# Gemini's tokenizer splits most Vietnamese syllables with diacritics into more than one token,
+# while plain ASCII syllables ("con", "ban") and short English words are usually a single token
+TOKENS_PER_DIACRITIC_SYLLABLE = 1.6
+TOKENS_PER_PLAIN_SYLLABLE = 1.0
+CHARS_PER_TOKEN_ASCII = 4.0  # Longer ASCII words (English, names)
+TOKENS_PER_DIGIT = 1.0       # Digits are tokenized one by one
+TOKENS_PER_PUNCT = 1.0
+
+# USD per 1M tokens (input, output); unknown models are costed with DEFAULT_PRICING
+MODEL_PRICING = {
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-flash-lite': (0.10, 0.40),
+    'gemini-2.0-flash': (0.10, 0.40),
+    'gemini-1.5-flash': (0.075, 0.30),
+}
+DEFAULT_PRICING = (0.30, 2.50)
+
+
+def _word_tokens(word: str) -> float:
+    """Estimated tokens of one word/syllable"""
+    if word.isdigit():
+        return len(word) * TOKENS_PER_DIGIT
+    if not word.isascii():
+        return TOKENS_PER_DIACRITIC_SYLLABLE
+    if len(word) <= CHARS_PER_TOKEN_ASCII:
+        return TOKENS_PER_PLAIN_SYLLABLE
+    return len(word) / CHARS_PER_TOKEN_ASCII
+
+
+class TokenEstimator:
+    """Local token estimator for Vietnamese text, self-calibrating against real token counts"""
+
+    def __init__(self, smoothing: float = 0.1, min_correction: float = 0.5, max_correction: float = 2.0):
+        """
+        Initialize token estimator
+
+        Args:
+            smoothing: Weight of a new observation in the correction factor (exponential moving average)
+            min_correction: Lower bound of the correction factor
+            max_correction: Upper bound of the correction factor
+        """
+        self.smoothing = smoothing
+        self.min_correction = min_correction
+        self.max_correction = max_correction
+        self.correction = 1.0
+        self.observations = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def raw_estimate(text: str) -> float:
+        """Uncalibrated estimate from syllable, digit and punctuation counts"""
+        if not text:
+            return 0.0
+        words = sum(_word_tokens(word) for word in _WORD_PATTERN.findall(text))
+        return words + len(_PUNCT_PATTERN.findall(text)) * TOKENS_PER_PUNCT
+
+    def estimate(self, text: str) -> int:
+        """
+        Estimate the number of model tokens in a text
+
+        Args:
+            text: Text to measure
+
+        Returns:
+            Estimated token count (0 for empty text)
+        """
+        raw = self.raw_estimate(text)
+        if raw == 0:
+            return 0
+        return max(1, round(raw * self.correction))
+
+    def observe(self, text: str, actual_tokens: int):
+        """
+        Calibrate with a real token count (e.g. usage metadata of a response)
+
+        Args:
+            text: Text that was sent or received
+            actual_tokens: Token count reported by the API for that text
+        """
+        raw = self.raw_estimate(text)
+        if raw < 20 or not actual_tokens:
+            return  # Short texts are dominated by rounding and special tokens
+        ratio = min(self.max_correction, max(self.min_correction, actual_tokens / raw))
+        with self._lock:
+            self.correction += self.smoothing * (ratio - self.correction)
+            self.observations += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Current correction factor and number of observations"""
+        return {'correction': self.correction, 'observations': self.observations}
+
+
+# Shared estimator: calibration from any service benefits every caller
+default_estimator = TokenEstimator()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of model tokens in a text without calling the API
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Estimated token count (0 for empty text)
+    """
+    return default_estimator.estimate(text)
+
+
+def estimate_tokens_many(texts: Iterable[str]) -> int:
+    """Estimate the total token count of several texts"""
+    return sum(estimate_tokens(text) for text in texts)
+
+
+def estimate_cost(model_name: Optional[str], input_tokens: int, output_tokens: int) -> float:
+    """
+    Estimate the cost of a call in USD
+
+    Args:
+        model_name: Model used (matched by prefix, e.g. "models/gemini-2.5-flash-001")
+        input_tokens: Prompt tokens
+        output_tokens: Response tokens
+
+    Returns:
+        Cost in USD from MODEL_PRICING
+    """
+    name = (model_name or '').split('/')[-1]
+    pricing = DEFAULT_PRICING
+    # Longest matching prefix, so "gemini-2.5-flash-lite" is not priced as "gemini-2.5-flash"
+    for model_prefix in sorted(MODEL_PRICING, key=len, reverse=True):
+        if name.startswith(model_prefix):
+            pricing = MODEL_PRICING[model_prefix]
+            break
+    input_price, output_price = pricing
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000